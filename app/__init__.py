@@ -1,18 +1,28 @@
 import os
 from flask import Flask, render_template
-from .extensions import db, login_manager, migrate, csrf
+from .extensions import db, login_manager, migrate, csrf, query_recorder
+from .database import init_database, log_database_settings
+from .images import image_pipeline
+from .utils import UploadRequest
+from .cache import FragmentCacheExtension
 from config import Config
 
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    # Stream uploaded files to disk while hashing them
+    app.request_class = UploadRequest
+    # {% cache %} tag for template fragments
+    app.jinja_env.add_extension(FragmentCacheExtension)
 
     # Initialize extensions
-    db.init_app(app)
+    init_database(app)
     login_manager.init_app(app)
     migrate.init_app(app, db)
     csrf.init_app(app)
+    query_recorder.init_app(app)
+    image_pipeline.init_app(app)
 
     # Register blueprints
     from .blueprints.public import public_bp
@@ -25,16 +35,17 @@ def create_app(config_class=Config):
     app.register_blueprint(admin_bp, url_prefix='/admin')
     app.register_blueprint(student_bp, url_prefix='/student')
 
-    # Make site settings available in all templates
+    from .commands import register_commands
+    register_commands(app)
+
+    # Make site settings available in all templates (cached per worker)
     @app.context_processor
     def inject_settings():
-        from .models import SiteSetting
-        settings = {}
+        from .cache import site_settings_cache
         try:
-            for s in SiteSetting.query.all():
-                settings[s.key] = s.value
+            settings = site_settings_cache.get()
         except Exception:
-            pass
+            settings = {}
         return dict(site_settings=settings)
 
     # Create instance directory, tables, and upload directories
@@ -43,8 +54,16 @@ def create_app(config_class=Config):
         instance_path = os.path.join(os.path.abspath(os.path.dirname(os.path.dirname(__file__))), 'instance')
         os.makedirs(instance_path, exist_ok=True)
 
-        db.create_all()
-        for folder_key in ['GALLERY_FOLDER', 'NOTES_FOLDER', 'AVATARS_FOLDER', 'THUMBNAILS_FOLDER']:
+        # Only on the primary: replicas are copies of it, and other apps'
+        # replica binds are registered on the shared ``db`` as well.
+        db.create_all(bind_key=None)
+        log_database_settings(app)
+        from .counters import seed_counters
+        seed_counters()
+        from .search import create_search_index
+        app.extensions['search'] = create_search_index()
+        for folder_key in ['GALLERY_FOLDER', 'NOTES_FOLDER', 'AVATARS_FOLDER', 'THUMBNAILS_FOLDER',
+                           'ORIGINALS_FOLDER', 'UPLOAD_TEMP_FOLDER', 'IMPORT_REPORTS_FOLDER']:
             path = app.config.get(folder_key, '')
             if path:
                 os.makedirs(path, exist_ok=True)
@@ -0,0 +1,659 @@
+"""Exam analytics maintained on write.
+
+Every write to ``results`` is turned into a list of signed changes, i.e.
+``(+1, row)`` for a result that now counts and ``(-1, row)`` for one that
+no longer does, and each aggregate applies them in the same transaction.
+ORM writes are picked up by an ``after_flush`` hook, Core bulk inserts
+(the importers, ``flask generate-data``) by ``do_orm_execute``. A change
+of a student's grade moves their results between groups. Bulk updates and
+deletes read the rows they match before and after running and are
+replayed the same way. ``flask rebuild-analytics`` recomputes everything
+on demand, and ``flask db upgrade`` does once for databases whose results
+predate these tables.
+
+``exam_stats`` holds, per ``(exam_name, subject_id, grade)``, the count,
+sum and sum of squares of the percentages plus a 1% histogram. Mean and
+standard deviation follow exactly; median, quantiles and percentile ranks
+come from the histogram, so no page ever scans the results themselves.
+
+``student_progress`` holds, per student and subject, running sums for the
+average and trend, the best score and the latest exams. Removing the best
+or a recent exam re-reads that one student's results in the subject.
+
+``rank_lists`` and ``result_ranks`` rank each exam sitting (name, subject
+and date) over everyone who sat it and within each batch of that subject,
+so a student's positions are read by key. A new or removed result shifts
+only the entries scoring below it; enrolling in a batch adds the
+student's results to that batch's lists.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from .extensions import db
+from .models import (
+    Batch, BatchEnrollment, ExamStat, RankList, Result, ResultRank, Student, StudentProgress,
+    PROGRESS_EPOCH
+)
+
+HISTOGRAM_BINS = 100
+PROGRESS_POINTS = 12
+# Above this many changes to one rank list in a flush, re-rank it in one statement
+RERANK_THRESHOLD = 8
+RANK_LIST_KEY = ('exam_name', 'subject_id', 'exam_date', 'batch_id')
+RESULT_FIELDS = ('student_id', 'subject_id', 'exam_name', 'exam_date',
+                 'marks_obtained', 'total_marks')
+_LOOKUP_CHUNK = 900
+
+
+# ==================== Change tracking ====================
+
+def _old_value(state, attr):
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(state.object, attr)
+
+
+def _student_grades(conn, student_ids):
+    students = Student.__table__
+    ids = sorted(student_ids)
+    grades = {}
+    for i in range(0, len(ids), _LOOKUP_CHUNK):
+        grades.update(conn.execute(db.select(students.c.id, students.c.grade).where(
+            students.c.id.in_(ids[i:i + _LOOKUP_CHUNK]))).all())
+    return grades
+
+
+def _with_grades(conn, changes):
+    """Add each row's student grade to ``(sign, row)`` pairs that lack one."""
+    grades = _student_grades(conn, {row['student_id'] for _, row in changes
+                                    if 'grade' not in row})
+    for _, row in changes:
+        row.setdefault('grade', grades.get(row['student_id']))
+    return [(sign, row) for sign, row in changes if row['grade'] is not None]
+
+
+def _flush_changes(session):
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, Result):
+            changes.append((1, {f: getattr(obj, f) for f in RESULT_FIELDS}))
+    for obj in session.deleted:
+        if isinstance(obj, Result):
+            state = db.inspect(obj)
+            changes.append((-1, {f: _old_value(state, f) for f in RESULT_FIELDS}))
+    regraded = {}
+    for obj in session.dirty:
+        state = db.inspect(obj)
+        if isinstance(obj, Result):
+            if any(state.attrs[f].history.has_changes() for f in RESULT_FIELDS):
+                changes.append((-1, {f: _old_value(state, f) for f in RESULT_FIELDS}))
+                changes.append((1, {f: getattr(obj, f) for f in RESULT_FIELDS}))
+        elif isinstance(obj, Student):
+            history = state.attrs['grade'].history
+            if history.deleted and history.added and history.deleted[0] != history.added[0]:
+                regraded[obj.id] = (history.deleted[0], history.added[0])
+    return changes + _regrade_changes(session.connection(), regraded)
+
+
+def _regrade_changes(conn, regraded):
+    """Move the results of students whose grade changed (``{id: (old, new)}``)."""
+    results = Result.__table__
+    changes = []
+    ids = sorted(regraded)
+    for i in range(0, len(ids), _LOOKUP_CHUNK):
+        rows = conn.execute(db.select(*(results.c[f] for f in RESULT_FIELDS)).where(
+            results.c.student_id.in_(ids[i:i + _LOOKUP_CHUNK])))
+        for row in rows:
+            old, new = regraded[row.student_id]
+            changes.append((-1, dict(row._mapping, grade=old)))
+            changes.append((1, dict(row._mapping, grade=new)))
+    return changes
+
+
+def _flush_enrollments(session):
+    enrollments = [(1, obj.student_id, obj.batch_id)
+                   for obj in session.new if isinstance(obj, BatchEnrollment)]
+    for obj in session.deleted:
+        if isinstance(obj, BatchEnrollment):
+            state = db.inspect(obj)
+            enrollments.append((-1, _old_value(state, 'student_id'), _old_value(state, 'batch_id')))
+    return enrollments
+
+
+def _apply(conn, changes, bulk=False):
+    changes = _with_grades(conn, changes)
+    if changes:
+        _apply_exam_stats(conn, changes)
+        _apply_progress(conn, changes)
+        _apply_ranks(conn, _rank_entries(conn, changes), bulk)
+
+
+@contextmanager
+def deferred_analytics():
+    """Skip upkeep for the writes inside the block; call ``rebuild_analytics`` after.
+
+    For bulk loads, where one rebuild is far cheaper than maintaining every
+    aggregate row by row.
+    """
+    db.session.info['analytics_deferred'] = True
+    try:
+        yield
+    finally:
+        db.session.info.pop('analytics_deferred', None)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _load_deleted(session, flush_context, instances):
+    # Deleted rows can no longer be read after the flush, so load any of
+    # their columns that were expired (e.g. by a commit) while they still can.
+    if session.info.get('analytics_deferred'):
+        return
+    for obj in session.deleted:
+        if isinstance(obj, (Result, BatchEnrollment)):
+            # Reading one expired column loads all of them.
+            getattr(obj, 'student_id')
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_flush(session, flush_context):
+    if session.info.get('analytics_deferred'):
+        return
+    changes = _flush_changes(session)
+    if changes:
+        _apply(session.connection(), changes)
+    enrollments = _flush_enrollments(session)
+    if enrollments:
+        # Results written in this flush were ranked in the batch lists above.
+        flushed = {obj.id for obj in session.new if isinstance(obj, Result)}
+        _apply_ranks(session.connection(), _enrollment_entries(
+            session.connection(), enrollments, flushed))
+
+
+def _matching_rows(orm_execute_state, columns):
+    """The rows a bulk UPDATE or DELETE applies to, read in its transaction."""
+    statement, params = orm_execute_state.statement, orm_execute_state.parameters
+    conn = orm_execute_state.session.connection()
+    query = db.select(*columns)
+    if statement.whereclause is not None:
+        query = query.where(statement.whereclause)
+    if isinstance(params, list):
+        # ORM bulk UPDATE by primary key: one parameter set per row.
+        ids = [p['id'] for p in params]
+        key = statement.table.c.id
+        return [row for i in range(0, len(ids), _LOOKUP_CHUNK)
+                for row in conn.execute(query.where(key.in_(ids[i:i + _LOOKUP_CHUNK])))]
+    return conn.execute(query, params or {}).all()
+
+
+def _rows_by_id(conn, table, columns, ids):
+    rows = []
+    for i in range(0, len(ids), _LOOKUP_CHUNK):
+        rows.extend(conn.execute(db.select(*columns).where(
+            table.c.id.in_(ids[i:i + _LOOKUP_CHUNK]))))
+    return rows
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _track_bulk(orm_execute_state):
+    table = getattr(orm_execute_state.statement, 'table', None)
+    name = getattr(table, 'name', None)
+    if name not in (Result.__tablename__, BatchEnrollment.__tablename__,
+                    Student.__tablename__) or \
+            orm_execute_state.session.info.get('analytics_deferred'):
+        return None
+    conn = orm_execute_state.session.connection()
+    if orm_execute_state.is_insert:
+        if name == Student.__tablename__:
+            return None
+        params = orm_execute_state.parameters or []
+        rows = [params] if isinstance(params, dict) else params
+        result = orm_execute_state.invoke_statement()
+        if name == Result.__tablename__:
+            _apply(conn, [(1, {f: row[f] for f in RESULT_FIELDS}) for row in rows])
+        else:
+            _apply_ranks(conn, _enrollment_entries(
+                conn, [(1, row['student_id'], row['batch_id']) for row in rows]))
+        return result
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return None
+
+    # Bulk UPDATE and DELETE: read the rows they apply to before and after,
+    # and replay them as signed changes like a flush.
+    if name == Student.__tablename__:
+        if orm_execute_state.is_delete:
+            return None
+        columns = (table.c.id, table.c.grade)
+    elif name == Result.__tablename__:
+        columns = (table.c.id,) + tuple(table.c[f] for f in RESULT_FIELDS)
+    else:
+        columns = (table.c.id, table.c.student_id, table.c.batch_id)
+    before = _matching_rows(orm_execute_state, columns)
+    result = orm_execute_state.invoke_statement()
+    after = [] if orm_execute_state.is_delete else _rows_by_id(
+        conn, table, columns, [row.id for row in before])
+
+    if name == Student.__tablename__:
+        grades = dict(after)
+        _apply(conn, _regrade_changes(conn, {
+            student_id: (grade, grades[student_id]) for student_id, grade in before
+            if grades.get(student_id, grade) != grade}))
+    elif name == Result.__tablename__:
+        _apply(conn, [(-1, {f: row._mapping[f] for f in RESULT_FIELDS}) for row in before] +
+               [(1, {f: row._mapping[f] for f in RESULT_FIELDS}) for row in after])
+    else:
+        _apply_ranks(conn, _enrollment_entries(conn, [(-1, s, b) for _, s, b in before]) +
+                     _enrollment_entries(conn, [(1, s, b) for _, s, b in after]))
+    return result
+
+
+# ==================== Summary rows ====================
+
+def _select_locked(conn, table, key_columns, keys):
+    key = db.tuple_(*(table.c[c] for c in key_columns))
+    rows = {}
+    for i in range(0, len(keys), _LOOKUP_CHUNK):
+        for row in conn.execute(db.select(table).where(
+                key.in_(keys[i:i + _LOOKUP_CHUNK])).with_for_update()):
+            rows[tuple(getattr(row, c) for c in key_columns)] = row
+    return rows
+
+
+def _upsert(conn, table, key_columns, deltas, blank, merge):
+    """Fold ``deltas`` (``{key: delta}``) into the summary rows of ``table``.
+
+    Rows that do not exist yet are created from ``blank``. ``merge(row,
+    delta)`` returns the row's new values, or None to delete it. Rows are
+    locked while they are read, so concurrent writers queue up instead of
+    losing each other's updates. Returns the rows as they were before the
+    merge, by key.
+    """
+    keys = list(deltas)
+    existing = _select_locked(conn, table, key_columns, keys)
+    missing = [key for key in keys if key not in existing]
+    if missing:
+        rows = [dict(zip(key_columns, key), **blank) for key in missing]
+        try:
+            with conn.begin_nested():
+                conn.execute(table.insert(), rows)
+        except IntegrityError:
+            # Another transaction created some of them; add the rest one by one.
+            for row in rows:
+                try:
+                    with conn.begin_nested():
+                        conn.execute(table.insert(), row)
+                except IntegrityError:
+                    pass
+        existing.update(_select_locked(conn, table, key_columns, missing))
+
+    now = datetime.utcnow()
+    updates, emptied = [], []
+    for key, delta in deltas.items():
+        row = existing[key]
+        values = merge(row, delta)
+        if values is None:
+            emptied.append(row.id)
+        else:
+            updates.append(dict(values, row_id=row.id, updated_at=now))
+    if updates:
+        conn.execute(table.update().where(table.c.id == db.bindparam('row_id')), updates)
+    if emptied:
+        conn.execute(table.delete().where(table.c.id.in_(emptied)))
+    return existing
+
+
+# ==================== Exam statistics ====================
+
+def _bin(percentage):
+    return min(max(int(percentage), 0), HISTOGRAM_BINS - 1)
+
+
+def _apply_exam_stats(conn, changes):
+    deltas = {}
+    for sign, row in changes:
+        key = (row['exam_name'], row['subject_id'], row['grade'])
+        pct = Result.percentage_of(row['marks_obtained'], row['total_marks'])
+        delta = deltas.setdefault(key, {'count': 0, 'total': 0.0, 'squares': 0.0,
+                                        'bins': {}, 'exam_date': None, 'removed_date': None})
+        delta['count'] += sign
+        delta['total'] += sign * pct
+        delta['squares'] += sign * pct * pct
+        b = _bin(pct)
+        delta['bins'][b] = delta['bins'].get(b, 0) + sign
+        date_key = 'exam_date' if sign > 0 else 'removed_date'
+        delta[date_key] = max(filter(None, (delta[date_key], row['exam_date'])), default=None)
+    deltas = {key: d for key, d in deltas.items()
+              if any(d['bins'].values()) or d['exam_date'] != d['removed_date']}
+    if deltas:
+        _write_exam_stats(conn, deltas)
+
+
+def _merge_exam_stat(row, delta):
+    count = row.count + delta['count']
+    if count <= 0:
+        return None
+    histogram = list(row.histogram)
+    for b, n in delta['bins'].items():
+        histogram[b] = max(histogram[b] + n, 0)
+    return {'count': count, 'total': row.total + delta['total'],
+            'total_squares': row.total_squares + delta['squares'], 'histogram': histogram,
+            'exam_date': max(filter(None, (row.exam_date, delta['exam_date'])), default=None)}
+
+
+def _write_exam_stats(conn, deltas):
+    before = _upsert(conn, ExamStat.__table__, ('exam_name', 'subject_id', 'grade'), deltas,
+                     {'count': 0, 'total': 0.0, 'total_squares': 0.0,
+                      'histogram': [0] * HISTOGRAM_BINS},
+                     _merge_exam_stat)
+    # Removing a result of the latest sitting may leave an earlier one latest.
+    stale = []
+    for key, delta in deltas.items():
+        latest, removed = before[key].exam_date, delta['removed_date']
+        if latest and removed and removed >= latest and not (
+                delta['exam_date'] and delta['exam_date'] >= removed):
+            stale.append(key)
+    if stale:
+        _recompute_exam_dates(conn, stale)
+
+
+def _recompute_exam_dates(conn, keys):
+    results, students, table = Result.__table__, Student.__table__, ExamStat.__table__
+    key = db.tuple_(results.c.exam_name, results.c.subject_id, students.c.grade)
+    latest = []
+    for i in range(0, len(keys), _LOOKUP_CHUNK):
+        latest.extend(conn.execute(db.select(
+            results.c.exam_name, results.c.subject_id, students.c.grade,
+            db.func.max(results.c.exam_date)
+        ).join_from(results, students, results.c.student_id == students.c.id).where(
+            key.in_(keys[i:i + _LOOKUP_CHUNK])).group_by(*key.clauses)))
+    if latest:
+        conn.execute(table.update().where(
+            table.c.exam_name == db.bindparam('key_name'),
+            table.c.subject_id == db.bindparam('key_subject'),
+            table.c.grade == db.bindparam('key_grade')
+        ), [{'key_name': name, 'key_subject': subject_id, 'key_grade': grade, 'exam_date': day}
+            for name, subject_id, grade, day in latest])
+
+
+# ==================== Student progress ====================
+
+_BLANK_PROGRESS = {'exam_count': 0, 'total': 0.0, 'sum_x': 0.0, 'sum_xx': 0.0,
+                   'sum_xy': 0.0, 'best': None, 'recent': []}
+
+
+def _progress_change(sign, row):
+    day = (row['exam_date'] - PROGRESS_EPOCH).days
+    return sign, day, Result.percentage_of(row['marks_obtained'], row['total_marks'])
+
+
+def _fold_progress(values, changes):
+    """Apply ``(sign, day, percentage)`` changes to progress column values.
+
+    Returns False when a removed exam was the best or one of the recent
+    ones, which can only be replaced by reading the student's results.
+    """
+    complete = True
+    recent = values['recent']
+    for sign, day, pct in changes:
+        values['exam_count'] += sign
+        values['total'] += sign * pct
+        values['sum_x'] += sign * day
+        values['sum_xx'] += sign * day * day
+        values['sum_xy'] += sign * day * pct
+        if sign > 0:
+            values['best'] = pct if values['best'] is None else max(values['best'], pct)
+            recent.append([day, pct])
+            recent.sort(reverse=True)
+            del recent[PROGRESS_POINTS:]
+        elif pct == values['best'] or [day, pct] in recent:
+            complete = False
+    return complete
+
+
+def _apply_progress(conn, changes):
+    deltas = {}
+    for sign, row in changes:
+        key = (row['student_id'], row['subject_id'])
+        deltas.setdefault(key, []).append(_progress_change(sign, row))
+    stale = []
+
+    def merge(row, delta):
+        values = {name: getattr(row, name) for name in _BLANK_PROGRESS}
+        values['recent'] = [list(point) for point in row.recent]
+        if not _fold_progress(values, delta):
+            stale.append((row.student_id, row.subject_id))
+        return values if values['exam_count'] > 0 else None
+
+    _upsert(conn, StudentProgress.__table__, ('student_id', 'subject_id'), deltas,
+            _BLANK_PROGRESS, merge)
+    if stale:
+        _recompute_progress(conn, stale)
+
+
+def _recompute_progress(conn, keys):
+    results, table = Result.__table__, StudentProgress.__table__
+    key = db.tuple_(results.c.student_id, results.c.subject_id)
+    fresh = {}
+    for i in range(0, len(keys), _LOOKUP_CHUNK):
+        rows = conn.execute(db.select(
+            results.c.student_id, results.c.subject_id, results.c.exam_date,
+            results.c.marks_obtained, results.c.total_marks
+        ).where(key.in_(keys[i:i + _LOOKUP_CHUNK])))
+        for row in rows:
+            values = fresh.setdefault((row.student_id, row.subject_id),
+                                      dict(_BLANK_PROGRESS, recent=[]))
+            _fold_progress(values, [_progress_change(1, row._mapping)])
+    if fresh:
+        conn.execute(table.update().where(
+            table.c.student_id == db.bindparam('key_student'),
+            table.c.subject_id == db.bindparam('key_subject')
+        ), [dict(values, key_student=student_id, key_subject=subject_id)
+            for (student_id, subject_id), values in fresh.items()])
+
+
+# ==================== Rank lists ====================
+
+def _rank_entries(conn, changes):
+    """``(sign, list key, student_id, percentage)`` for the overall and batch lists."""
+    students = sorted({row['student_id'] for _, row in changes})
+    enrollments, batches = BatchEnrollment.__table__, Batch.__table__
+    batch_ids = {}
+    for i in range(0, len(students), _LOOKUP_CHUNK):
+        rows = conn.execute(db.select(
+            enrollments.c.student_id, batches.c.subject_id, batches.c.id
+        ).join_from(enrollments, batches, enrollments.c.batch_id == batches.c.id).where(
+            enrollments.c.student_id.in_(students[i:i + _LOOKUP_CHUNK])))
+        for student_id, subject_id, batch_id in rows:
+            batch_ids.setdefault((student_id, subject_id), []).append(batch_id)
+    entries = []
+    for sign, row in changes:
+        pct = Result.percentage_of(row['marks_obtained'], row['total_marks'])
+        sitting = (row['exam_name'], row['subject_id'], row['exam_date'])
+        for batch_id in [0] + batch_ids.get((row['student_id'], row['subject_id']), []):
+            entries.append((sign, sitting + (batch_id,), row['student_id'], pct))
+    return entries
+
+
+def _enrollment_entries(conn, enrollments, skip_results=()):
+    """Entries that add or remove students' results in a batch's lists when they
+    join or leave it. ``skip_results`` are ids already ranked by the caller."""
+    signs = {(student_id, batch_id): sign for sign, student_id, batch_id in enrollments}
+    results, batches = Result.__table__, Batch.__table__
+    pair = db.tuple_(results.c.student_id, batches.c.id)
+    keys = list(signs)
+    entries = []
+    for i in range(0, len(keys), _LOOKUP_CHUNK):
+        rows = conn.execute(db.select(
+            batches.c.id.label('batch_id'), *(results.c[f] for f in RESULT_FIELDS)
+        ).join_from(results, batches, results.c.subject_id == batches.c.subject_id).where(
+            pair.in_(keys[i:i + _LOOKUP_CHUNK])).add_columns(results.c.id))
+        for row in rows:
+            if row.id in skip_results:
+                continue
+            entries.append((
+                signs[row.student_id, row.batch_id],
+                (row.exam_name, row.subject_id, row.exam_date, row.batch_id), row.student_id,
+                Result.percentage_of(row.marks_obtained, row.total_marks)))
+    return entries
+
+
+def _insert_ranked(conn, list_id, student_id, pct):
+    table = ResultRank.__table__
+    conn.execute(table.update().where(
+        table.c.rank_list_id == list_id, table.c.percentage < pct
+    ).values(rank=table.c.rank + 1))
+    above = conn.execute(db.select(db.func.count()).select_from(table).where(
+        table.c.rank_list_id == list_id, table.c.percentage > pct)).scalar()
+    conn.execute(table.insert(), {'rank_list_id': list_id, 'student_id': student_id,
+                                  'percentage': pct, 'rank': above + 1})
+
+
+def _remove_ranked(conn, list_id, student_id, pct, shift=True):
+    table = ResultRank.__table__
+    entry_id = conn.execute(db.select(table.c.id).where(
+        table.c.rank_list_id == list_id, table.c.student_id == student_id,
+        table.c.percentage == pct).limit(1)).scalar()
+    if entry_id is None:
+        return
+    conn.execute(table.delete().where(table.c.id == entry_id))
+    if shift:
+        conn.execute(table.update().where(
+            table.c.rank_list_id == list_id, table.c.percentage < pct
+        ).values(rank=table.c.rank - 1))
+
+
+def _rerank(conn, list_ids=None):
+    """Recompute positions of whole lists (all of them for None) with one window query."""
+    table = ResultRank.__table__
+    chunks = [None] if list_ids is None else [
+        list_ids[i:i + _LOOKUP_CHUNK] for i in range(0, len(list_ids), _LOOKUP_CHUNK)]
+    for chunk in chunks:
+        ranked = db.select(table.c.id, db.func.rank().over(
+            partition_by=table.c.rank_list_id, order_by=table.c.percentage.desc()
+        ).label('position'))
+        if chunk is not None:
+            ranked = ranked.where(table.c.rank_list_id.in_(chunk))
+        ranked = ranked.subquery()
+        conn.execute(table.update().where(table.c.id == ranked.c.id).values(
+            rank=ranked.c.position))
+
+
+def _apply_ranks(conn, entries, bulk=False):
+    """Move entries in and out of rank lists, shifting only the positions below them.
+
+    Lists with many changes at once, and every list when ``bulk`` is set
+    (the caller re-ranks), are re-ranked as a whole instead.
+    """
+    by_list = {}
+    for sign, key, student_id, pct in entries:
+        by_list.setdefault(key, []).append((sign, student_id, pct))
+    if not by_list:
+        return
+    lists = _upsert(conn, RankList.__table__, RANK_LIST_KEY,
+                    {key: sum(sign for sign, _, _ in items) for key, items in by_list.items()},
+                    {'size': 0}, lambda row, delta: {'size': max(row.size + delta, 0)})
+    table = ResultRank.__table__
+    inserts, rerank = [], []
+    for key, items in by_list.items():
+        list_id = lists[key].id
+        whole = bulk or len(items) > RERANK_THRESHOLD
+        for sign, student_id, pct in items:
+            if sign < 0:
+                _remove_ranked(conn, list_id, student_id, pct, shift=not whole)
+            elif whole:
+                inserts.append({'rank_list_id': list_id, 'student_id': student_id,
+                                'percentage': pct, 'rank': 0})
+            else:
+                _insert_ranked(conn, list_id, student_id, pct)
+        if whole and not bulk:
+            rerank.append(list_id)
+    if inserts:
+        conn.execute(table.insert(), inserts)
+    if rerank:
+        _rerank(conn, rerank)
+    emptied = [row.id for row in lists.values() if row.size + sum(
+        sign for sign, _, _ in by_list[(row.exam_name, row.subject_id, row.exam_date,
+                                        row.batch_id)]) <= 0]
+    if emptied:
+        conn.execute(table.delete().where(table.c.rank_list_id.in_(emptied)))
+        conn.execute(RankList.__table__.delete().where(RankList.__table__.c.id.in_(emptied)))
+
+
+def ranks_for(student_id, sittings):
+    """``{(exam_name, subject_id, exam_date, batch_id): (rank, size)}`` for one student.
+
+    One indexed query however long the lists are.
+    """
+    sittings = list(set(sittings))
+    if not sittings:
+        return {}
+    key = db.tuple_(RankList.exam_name, RankList.subject_id, RankList.exam_date)
+    rows = db.session.query(
+        RankList.exam_name, RankList.subject_id, RankList.exam_date, RankList.batch_id,
+        ResultRank.rank, RankList.size
+    ).join(ResultRank, ResultRank.rank_list_id == RankList.id).filter(
+        ResultRank.student_id == student_id, key.in_(sittings))
+    return {tuple(row[:4]): (row.rank, row.size) for row in rows}
+
+
+def progress_for(student_id):
+    """The student's progress in each subject, best known subjects first."""
+    return StudentProgress.query.options(db.joinedload(StudentProgress.subject)).filter_by(
+        student_id=student_id).order_by(StudentProgress.exam_count.desc()).all()
+
+
+def exam_stats_for(keys):
+    """``{(exam_name, subject_id, grade): ExamStat}`` for the given keys, in one query."""
+    keys = set(keys)
+    if not keys:
+        return {}
+    # Separate IN lists use the unique index, which a row-value IN does not on SQLite.
+    stats = ExamStat.query.filter(
+        ExamStat.exam_name.in_({k[0] for k in keys}),
+        ExamStat.subject_id.in_({k[1] for k in keys}),
+        ExamStat.grade.in_({k[2] for k in keys}))
+    return {(s.exam_name, s.subject_id, s.grade): s for s in stats
+            if (s.exam_name, s.subject_id, s.grade) in keys}
+
+
+# ==================== Rebuild ====================
+
+def _all_changes(conn, batch_size):
+    results, students = Result.__table__, Student.__table__
+    rows = conn.execute(
+        db.select(*(results.c[f] for f in RESULT_FIELDS), students.c.grade).join_from(
+            results, students, results.c.student_id == students.c.id
+        ).execution_options(yield_per=batch_size))
+    for row in rows:
+        yield 1, dict(row._mapping)
+
+
+def rebuild_analytics(batch_size=5000, commit=True, conn=None):
+    """Recompute every aggregate from ``results``; returns the number of results read.
+
+    Runs on the session's connection unless ``conn`` is given, e.g. the
+    migration's, in which case the caller owns the transaction.
+    """
+    if conn is None:
+        conn = db.session.connection()
+    else:
+        commit = False
+    for model in (ExamStat, StudentProgress, ResultRank, RankList):
+        conn.execute(model.__table__.delete())
+    total = 0
+    batch = []
+    for change in _all_changes(conn, batch_size):
+        batch.append(change)
+        if len(batch) >= batch_size:
+            _apply(conn, batch, bulk=True)
+            total += len(batch)
+            batch = []
+    _apply(conn, batch, bulk=True)
+    total += len(batch)
+    _rerank(conn)
+    if commit:
+        db.session.commit()
+    return total
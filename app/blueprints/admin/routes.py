@@ -1,20 +1,38 @@
 import os
-from flask import render_template, flash, redirect, url_for, request, current_app
+from datetime import date, datetime, timedelta
+from flask import (
+    render_template, flash, redirect, url_for, request, current_app, send_from_directory, abort
+)
 from flask_login import login_required
+from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.security import generate_password_hash
 from . import admin_bp
 from ...extensions import db
+from ...cache import site_settings_cache
 from ...models import (
     AdminUser, Student, Subject, Faculty, Batch, BatchEnrollment,
-    Result, Announcement, GalleryImage, Note, Testimonial, ContactMessage, SiteSetting
+    Result, Announcement, GalleryImage, Note, Testimonial, ContactMessage, SiteSetting, ExamStat,
+    RankList, ResultRank
 )
 from ...forms import (
-    StudentForm, BatchForm, ResultForm, AnnouncementForm,
+    StudentForm, StudentImportForm, BatchForm, ResultForm, ResultImportForm, AnnouncementForm,
     FacultyForm, GalleryUploadForm, NoteUploadForm, TestimonialForm
 )
+from ...importers import (
+    import_results as import_results_sheet, read_student_sheet, onboard_students, SheetError,
+    CredentialSheet, purge_credential_sheets
+)
 from ...utils import (
     admin_required, generate_student_id, generate_random_password,
-    calculate_grade, save_image, save_file, allowed_file, create_thumbnail
+    calculate_grade, save_file, release_upload, allowed_file
+)
+from ...images import image_pipeline, save_original, is_readable_image
+from ...counters import get_counts
+from ...student_context import active_subjects_cache
+from ...exports import YIELD_PER, ExportError, export_response
+from ...pagination import keyset_paginate
+from ...search import (
+    SEARCH_KINDS, search as search_index, match_ids, load_results, is_enabled as search_enabled
 )
 
 
@@ -24,11 +42,13 @@ from ...utils import (
 @login_required
 @admin_required
 def dashboard():
+    counts = get_counts('active_students', 'active_batches', 'unread_messages',
+                        'active_announcements')
     stats = {
-        'students': Student.query.filter_by(is_active=True).count(),
-        'batches': Batch.query.filter_by(is_active=True).count(),
-        'messages': ContactMessage.query.filter_by(is_read=False).count(),
-        'announcements': Announcement.query.filter_by(is_active=True).count(),
+        'students': counts['active_students'],
+        'batches': counts['active_batches'],
+        'messages': counts['unread_messages'],
+        'announcements': counts['active_announcements'],
     }
     recent_students = Student.query.filter_by(is_active=True).order_by(
         Student.created_at.desc()).limit(5).all()
@@ -39,18 +59,41 @@ def dashboard():
                            recent_messages=recent_messages)
 
 
+# ==================== Search ====================
+
+@admin_bp.route('/search')
+@login_required
+@admin_required
+def search():
+    q = request.args.get('q', '').strip()
+    kind = request.args.get('kind', '')
+    kinds = [kind] if kind in SEARCH_KINDS else None
+    results = load_results(search_index(q, kinds)) if q else []
+    return render_template('admin/search.html', q=q, kind=kind, results=results,
+                           kinds=list(SEARCH_KINDS), enabled=search_enabled())
+
+
 # ==================== Students ====================
 
 @admin_bp.route('/students')
 @login_required
 @admin_required
 def students():
-    page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '')
     grade_filter = request.args.get('grade', 0, type=int)
+    students = keyset_paginate(
+        _filtered_students(search, grade_filter), Student,
+        request.args.get('after'), request.args.get('before'), per_page=15,
+        total=None if search or grade_filter else get_counts('active_students')['active_students'])
+    return render_template('admin/students.html', students=students,
+                           search=search, grade_filter=grade_filter)
+
 
+def _filtered_students(search, grade_filter):
     query = Student.query.filter_by(is_active=True)
-    if search:
+    if search and search_enabled():
+        query = query.filter(Student.id.in_(match_ids('student', search)))
+    elif search:
         query = query.filter(
             db.or_(
                 Student.full_name.ilike(f'%{search}%'),
@@ -59,11 +102,27 @@ def students():
         )
     if grade_filter:
         query = query.filter_by(grade=grade_filter)
+    return query
 
-    students = query.order_by(Student.created_at.desc()).paginate(
-        page=page, per_page=15, error_out=False)
-    return render_template('admin/students.html', students=students,
-                           search=search, grade_filter=grade_filter)
+
+@admin_bp.route('/students/export')
+@login_required
+@admin_required
+def export_students():
+    query = _filtered_students(request.args.get('search', ''),
+                               request.args.get('grade', 0, type=int))
+    rows = query.with_entities(
+        Student.student_id, Student.full_name, Student.email, Student.phone, Student.grade,
+        Student.parent_name, Student.parent_phone, Student.date_of_birth, Student.created_at
+    ).order_by(Student.id).yield_per(YIELD_PER)
+    try:
+        return export_response(
+            'students', ['Student ID', 'Name', 'Email', 'Phone', 'Grade', 'Parent Name',
+                         'Parent Phone', 'Date of Birth', 'Joined'],
+            rows, request.args.get('format'))
+    except ExportError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('admin.students'))
 
 
 @admin_bp.route('/students/add', methods=['GET', 'POST'])
@@ -76,6 +135,7 @@ def add_student():
 
     if form.validate_on_submit():
         password = generate_random_password()
+        password_hash = generate_password_hash(password)
         student_id = generate_student_id()
         student = Student(
             student_id=student_id,
@@ -87,7 +147,7 @@ def add_student():
             parent_phone=form.parent_phone.data,
             address=form.address.data,
             date_of_birth=form.date_of_birth.data,
-            password_hash=generate_password_hash(password)
+            password_hash=password_hash
         )
         db.session.add(student)
         db.session.commit()
@@ -99,6 +159,77 @@ def add_student():
                            generated_id=generated_id)
 
 
+@admin_bp.route('/students/import', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def import_students():
+    _purge_credential_sheets()
+    form = StudentImportForm()
+    if form.validate_on_submit():
+        try:
+            students, errors = read_student_sheet(form.file.data)
+        except SheetError as e:
+            flash(str(e), 'danger')
+        else:
+            folder = current_app.config['IMPORT_REPORTS_FOLDER']
+            filename = f'student-credentials-{datetime.now():%Y%m%d-%H%M%S-%f}.csv'
+            with CredentialSheet(os.path.join(folder, filename)) as sheet:
+                sheet.write({'row': number, 'email': email, 'status': f'Skipped: {message}'}
+                            for number, email, message in errors)
+                try:
+                    onboard_students(students, sheet,
+                                     workers=current_app.config.get('PASSWORD_HASH_WORKERS'))
+                except SQLAlchemyError:
+                    current_app.logger.exception('Student import %s failed', filename)
+                    flash('The import stopped on a database error. Students created before it '
+                          f'are listed with their passwords in {filename} below.', 'danger')
+                    return redirect(url_for('admin.import_students'))
+            return _send_credential_sheet(folder, filename)
+    return render_template('admin/student_import.html', form=form, sheets=_credential_sheets())
+
+
+def _purge_credential_sheets():
+    purge_credential_sheets(current_app.config['IMPORT_REPORTS_FOLDER'],
+                            timedelta(hours=current_app.config['IMPORT_REPORT_HOURS']))
+
+
+def _credential_sheets():
+    """Stored import credentials sheets, newest first."""
+    folder = current_app.config['IMPORT_REPORTS_FOLDER']
+    sheets = []
+    for entry in os.scandir(folder):
+        if entry.is_file() and entry.name.endswith('.csv'):
+            stat = entry.stat()
+            sheets.append({'filename': entry.name, 'size': stat.st_size,
+                           'modified': datetime.fromtimestamp(stat.st_mtime)})
+    return sorted(sheets, key=lambda sheet: sheet['modified'], reverse=True)
+
+
+def _send_credential_sheet(folder, filename):
+    response = send_from_directory(folder, filename, as_attachment=True, mimetype='text/csv')
+    response.cache_control.no_store = True
+    return response
+
+
+@admin_bp.route('/students/import/<filename>')
+@login_required
+@admin_required
+def download_credential_sheet(filename):
+    _purge_credential_sheets()
+    return _send_credential_sheet(current_app.config['IMPORT_REPORTS_FOLDER'], filename)
+
+
+@admin_bp.route('/students/import/<filename>/delete', methods=['POST'])
+@login_required
+@admin_required
+def delete_credential_sheet(filename):
+    if filename not in {sheet['filename'] for sheet in _credential_sheets()}:
+        abort(404)
+    os.remove(os.path.join(current_app.config['IMPORT_REPORTS_FOLDER'], filename))
+    flash('Credentials sheet deleted.', 'info')
+    return redirect(url_for('admin.import_students'))
+
+
 @admin_bp.route('/students/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -151,10 +282,47 @@ def reset_student_password(id):
 @login_required
 @admin_required
 def batches():
-    batches = Batch.query.filter_by(is_active=True).order_by(Batch.created_at.desc()).all()
+    counts = db.session.query(
+        BatchEnrollment.batch_id,
+        db.func.count(BatchEnrollment.id).label('enrolled')
+    ).group_by(BatchEnrollment.batch_id).subquery()
+    batches = db.session.query(Batch, db.func.coalesce(counts.c.enrolled, 0)).outerjoin(
+        counts, counts.c.batch_id == Batch.id
+    ).options(
+        db.joinedload(Batch.subject), db.joinedload(Batch.faculty)
+    ).filter(Batch.is_active == True).order_by(Batch.created_at.desc()).all()
     return render_template('admin/batches.html', batches=batches)
 
 
+@admin_bp.route('/batches/enrollments/export')
+@login_required
+@admin_required
+def export_enrollments():
+    batch_filter = request.args.get('batch', 0, type=int)
+    grade_filter = request.args.get('grade', 0, type=int)
+    subject_filter = request.args.get('subject', 0, type=int)
+    query = db.session.query(
+        Batch.name, Subject.name, Batch.grade, Student.student_id, Student.full_name,
+        Student.email, Student.phone, BatchEnrollment.enrolled_at
+    ).select_from(BatchEnrollment).join(BatchEnrollment.batch).join(Batch.subject).join(
+        BatchEnrollment.student)
+    if batch_filter:
+        query = query.filter(Batch.id == batch_filter)
+    if grade_filter:
+        query = query.filter(Batch.grade == grade_filter)
+    if subject_filter:
+        query = query.filter(Batch.subject_id == subject_filter)
+    rows = query.order_by(BatchEnrollment.id).yield_per(YIELD_PER)
+    try:
+        return export_response(
+            'enrollments', ['Batch', 'Subject', 'Grade', 'Student ID', 'Name', 'Email',
+                            'Phone', 'Enrolled'],
+            rows, request.args.get('format'))
+    except ExportError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('admin.batches'))
+
+
 @admin_bp.route('/batches/add', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -248,10 +416,66 @@ def enroll_students(id):
 @login_required
 @admin_required
 def results():
-    page = request.args.get('page', 1, type=int)
-    results = Result.query.order_by(Result.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False)
-    return render_template('admin/results.html', results=results)
+    filters = _result_filters()
+    results = keyset_paginate(
+        _filtered_results(**filters).options(
+            db.joinedload(Result.student), db.joinedload(Result.subject)),
+        Result, request.args.get('after'), request.args.get('before'), per_page=20,
+        total=None if any(filters.values()) else get_counts('results')['results'],
+        # A date range is served by the exam date index, in that order.
+        order_by='exam_date' if filters['date_from'] or filters['date_to'] else 'created_at')
+    return render_template('admin/results.html', results=results,
+                           subjects=active_subjects_cache.get(), filters=filters)
+
+
+def _result_filters():
+    return {
+        'grade': request.args.get('grade', 0, type=int),
+        'subject': request.args.get('subject', 0, type=int),
+        'exam': request.args.get('exam', '').strip(),
+        'date_from': request.args.get('date_from', type=date.fromisoformat),
+        'date_to': request.args.get('date_to', type=date.fromisoformat),
+    }
+
+
+def _filtered_results(grade=0, subject=0, exam='', date_from=None, date_to=None):
+    query = Result.query
+    if grade:
+        query = query.join(Result.student).filter(Student.grade == grade)
+    if subject:
+        query = query.filter(Result.subject_id == subject)
+    if exam:
+        query = query.filter(Result.exam_name == exam)
+    if date_from:
+        query = query.filter(Result.exam_date >= date_from)
+    if date_to:
+        query = query.filter(Result.exam_date <= date_to)
+    return query
+
+
+@admin_bp.route('/results/export')
+@login_required
+@admin_required
+def export_results():
+    filters = _result_filters()
+    query = _filtered_results(**filters)
+    if not filters['grade']:
+        query = query.join(Result.student)
+    rows = query.join(Result.subject).with_entities(
+        Student.student_id, Student.full_name, Student.grade, Subject.name, Result.exam_name,
+        Result.exam_date, Result.marks_obtained, Result.total_marks, Result.grade_letter,
+        Result.remarks
+    ).order_by(Result.id).yield_per(YIELD_PER)
+    rows = ((*row[:8], Result.percentage_of(row.marks_obtained, row.total_marks), *row[8:])
+            for row in rows)
+    try:
+        return export_response(
+            'results', ['Student ID', 'Name', 'Grade', 'Subject', 'Exam', 'Date', 'Marks',
+                        'Total', 'Percentage', 'Grade Letter', 'Remarks'],
+            rows, request.args.get('format'))
+    except ExportError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('admin.results'))
 
 
 @admin_bp.route('/results/add', methods=['GET', 'POST'])
@@ -282,6 +506,30 @@ def add_result():
     return render_template('admin/result_form.html', form=form, editing=False)
 
 
+@admin_bp.route('/results/import', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def import_results():
+    form = ResultImportForm()
+    form.subject_id.choices = [(s.id, s.name) for s in Subject.query.filter_by(is_active=True).all()]
+    report = None
+
+    if form.validate_on_submit():
+        try:
+            inserted, errors = import_results_sheet(
+                form.file.data, form.subject_id.data, form.exam_name.data,
+                form.exam_date.data, form.total_marks.data)
+        except SheetError as e:
+            flash(str(e), 'danger')
+        else:
+            report = {'inserted': inserted, 'errors': errors}
+            if inserted:
+                flash(f'{inserted} result(s) imported.', 'success')
+            if errors:
+                flash(f'{len(errors)} row(s) were skipped; see the report below.', 'warning')
+    return render_template('admin/result_import.html', form=form, report=report)
+
+
 @admin_bp.route('/results/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -319,6 +567,63 @@ def delete_result(id):
     return redirect(url_for('admin.results'))
 
 
+# ==================== Analytics ====================
+
+@admin_bp.route('/analytics')
+@login_required
+@admin_required
+def analytics():
+    grade_filter = request.args.get('grade', 0, type=int)
+    subject_filter = request.args.get('subject', 0, type=int)
+    query = ExamStat.query.options(db.joinedload(ExamStat.subject))
+    if grade_filter:
+        query = query.filter_by(grade=grade_filter)
+    if subject_filter:
+        query = query.filter_by(subject_id=subject_filter)
+    stats = query.order_by(ExamStat.exam_date.desc(), ExamStat.id.desc()).limit(200).all()
+    subjects = Subject.query.filter_by(is_active=True).all()
+    return render_template('admin/analytics.html', stats=stats, subjects=subjects,
+                           grade_filter=grade_filter, subject_filter=subject_filter)
+
+
+@admin_bp.route('/analytics/<int:id>')
+@login_required
+@admin_required
+def exam_analytics(id):
+    stat = ExamStat.query.get_or_404(id)
+    return render_template('admin/exam_analytics.html', stat=stat)
+
+
+@admin_bp.route('/leaderboard')
+@login_required
+@admin_required
+def leaderboard():
+    batch_filter = request.args.get('batch', 0, type=int)
+    subject_filter = request.args.get('subject', 0, type=int)
+    query = RankList.query.options(db.joinedload(RankList.subject)).filter_by(
+        batch_id=batch_filter)
+    if subject_filter:
+        query = query.filter_by(subject_id=subject_filter)
+    lists = query.order_by(RankList.exam_date.desc(), RankList.id.desc()).limit(100).all()
+    batches = Batch.query.filter_by(is_active=True).order_by(Batch.name).all()
+    subjects = Subject.query.filter_by(is_active=True).all()
+    return render_template('admin/leaderboard.html', lists=lists, batches=batches,
+                           subjects=subjects, batch_filter=batch_filter,
+                           subject_filter=subject_filter)
+
+
+@admin_bp.route('/leaderboard/<int:id>')
+@login_required
+@admin_required
+def exam_leaderboard(id):
+    rank_list = RankList.query.get_or_404(id)
+    batch = db.session.get(Batch, rank_list.batch_id) if rank_list.batch_id else None
+    entries = rank_list.entries.options(db.joinedload(ResultRank.student)).order_by(
+        ResultRank.percentage.desc(), ResultRank.id).limit(100).all()
+    return render_template('admin/exam_leaderboard.html', rank_list=rank_list,
+                           batch=batch, entries=entries)
+
+
 # ==================== Announcements ====================
 
 @admin_bp.route('/announcements')
@@ -396,23 +701,42 @@ def gallery():
 @admin_required
 def upload_gallery():
     form = GalleryUploadForm()
-    if form.images.data:
-        file = form.images.data
-        if allowed_file(file.filename, current_app.config['ALLOWED_IMAGE_EXTENSIONS']):
-            filename = save_image(file, current_app.config['GALLERY_FOLDER'])
-            source_path = os.path.join(current_app.config['GALLERY_FOLDER'], filename)
-            thumb = create_thumbnail(source_path, current_app.config['THUMBNAILS_FOLDER'])
-            image = GalleryImage(
-                filename=filename,
-                thumbnail=thumb,
-                caption=form.caption.data,
-                category=form.category.data
-            )
-            db.session.add(image)
-            db.session.commit()
-            flash('Image uploaded!', 'success')
+    files = [f for f in (form.images.data or []) if f and f.filename]
+    if not files:
+        flash('Please choose at least one image.', 'warning')
+        return redirect(url_for('admin.gallery'))
+
+    saved, pending, skipped = [], [], []
+    for file in files:
+        if not allowed_file(file.filename, current_app.config['ALLOWED_IMAGE_EXTENSIONS']):
+            skipped.append(f'{file.filename} (invalid file type)')
+        elif not is_readable_image(file):
+            skipped.append(f'{file.filename} (not a readable image)')
         else:
-            flash('Invalid file type.', 'danger')
+            filename, is_new = save_original(file, 'gallery')
+            image = GalleryImage(filename=filename, caption=form.caption.data,
+                                 category=form.category.data)
+            if not is_new:
+                # Already stored content reuses the existing renditions, or
+                # is processed again if that failed before.
+                done = GalleryImage.query.filter(GalleryImage.filename == filename,
+                                                 GalleryImage.thumbnail != None).first()
+                if done:
+                    image.thumbnail, image.widths = done.thumbnail, done.widths
+                elif GalleryImage.query.filter_by(filename=filename, processing_failed=True).first():
+                    is_new = True
+            if is_new and filename not in pending:
+                pending.append(filename)
+            saved.append(image)
+
+    if saved:
+        db.session.add_all(saved)
+        db.session.commit()
+        for filename in pending:
+            image_pipeline.submit('gallery', filename)
+        flash(f'{len(saved)} image(s) uploaded! They will appear once processed.', 'success')
+    if skipped:
+        flash(f'{len(skipped)} file(s) skipped: ' + ', '.join(skipped), 'danger')
     return redirect(url_for('admin.gallery'))
 
 
@@ -421,16 +745,7 @@ def upload_gallery():
 @admin_required
 def delete_gallery_image(id):
     image = GalleryImage.query.get_or_404(id)
-    try:
-        path = os.path.join(current_app.config['GALLERY_FOLDER'], image.filename)
-        if os.path.exists(path):
-            os.remove(path)
-        if image.thumbnail:
-            thumb_path = os.path.join(current_app.config['THUMBNAILS_FOLDER'], image.thumbnail)
-            if os.path.exists(thumb_path):
-                os.remove(thumb_path)
-    except OSError:
-        pass
+    release_upload('gallery', image.filename)
     db.session.delete(image)
     db.session.commit()
     flash('Image deleted.', 'info')
@@ -453,9 +768,9 @@ def faculty():
 def add_faculty():
     form = FacultyForm()
     if form.validate_on_submit():
-        photo = 'default-avatar.png'
+        photo, is_new = 'default-avatar.png', False
         if form.photo.data:
-            photo = save_image(form.photo.data, current_app.config['AVATARS_FOLDER'])
+            photo, is_new = save_original(form.photo.data, 'faculty')
         f = Faculty(
             full_name=form.full_name.data,
             email=form.email.data,
@@ -468,6 +783,8 @@ def add_faculty():
         )
         db.session.add(f)
         db.session.commit()
+        if is_new:
+            image_pipeline.submit('faculty', photo)
         flash('Faculty member added!', 'success')
         return redirect(url_for('admin.faculty'))
     return render_template('admin/faculty_form.html', form=form, editing=False)
@@ -487,9 +804,15 @@ def edit_faculty(id):
         fac.experience = form.experience.data
         fac.bio = form.bio.data
         fac.specialization = form.specialization.data
+        is_new = False
         if form.photo.data:
-            fac.photo = save_image(form.photo.data, current_app.config['AVATARS_FOLDER'])
+            old_photo = fac.photo
+            fac.photo, is_new = save_original(form.photo.data, 'faculty')
+            if old_photo and old_photo != 'default-avatar.png':
+                release_upload('faculty', old_photo)
         db.session.commit()
+        if is_new:
+            image_pipeline.submit('faculty', fac.photo)
         flash('Faculty updated!', 'success')
         return redirect(url_for('admin.faculty'))
     return render_template('admin/faculty_form.html', form=form, editing=True, faculty_member=fac)
@@ -605,12 +928,8 @@ def upload_note():
 @admin_required
 def delete_note(id):
     note = Note.query.get_or_404(id)
-    try:
-        path = os.path.join(current_app.config['NOTES_FOLDER'], note.filename)
-        if os.path.exists(path):
-            os.remove(path)
-    except OSError:
-        pass
+    if note.is_active:
+        release_upload('note', note.filename)
     note.is_active = False
     db.session.commit()
     flash('Note removed.', 'info')
@@ -623,7 +942,8 @@ def delete_note(id):
 @login_required
 @admin_required
 def messages():
-    items = ContactMessage.query.order_by(ContactMessage.created_at.desc()).all()
+    items = keyset_paginate(ContactMessage.query, ContactMessage, request.args.get('after'),
+                            request.args.get('before'), per_page=25)
     return render_template('admin/messages.html', messages=items)
 
 
@@ -648,14 +968,16 @@ def settings():
         keys = ['site_name', 'tagline', 'phone', 'email', 'address',
                 'about_text', 'google_maps_embed',
                 'social_facebook', 'social_instagram', 'social_youtube']
+        existing = {s.key: s for s in SiteSetting.query.filter(SiteSetting.key.in_(keys))}
         for key in keys:
             value = request.form.get(key, '')
-            setting = SiteSetting.query.filter_by(key=key).first()
+            setting = existing.get(key)
             if setting:
                 setting.value = value
             else:
                 db.session.add(SiteSetting(key=key, value=value))
         db.session.commit()
+        site_settings_cache.invalidate()
         flash('Settings saved!', 'success')
         return redirect(url_for('admin.settings'))
 
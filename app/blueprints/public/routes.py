@@ -1,22 +1,28 @@
 from flask import render_template, flash, redirect, url_for, request
 from . import public_bp
-from ...models import Subject, Faculty, GalleryImage, Announcement, Testimonial, ContactMessage
+from ...models import (
+    Subject, Faculty, GalleryImage, Announcement, Testimonial, ContactMessage, Batch
+)
 from ...forms import ContactForm
 from ...extensions import db
+from ...cache import cached_page
+from ...counters import get_counts
 
 
 @public_bp.route('/')
+@cached_page(Subject, Testimonial, Announcement,
+             counters=('active_students', 'active_faculty', 'active_batches'))
 def home():
     subjects = Subject.query.filter_by(is_active=True).all()
     testimonials = Testimonial.query.filter_by(is_active=True, is_featured=True).limit(6).all()
     announcements = Announcement.query.filter_by(is_active=True).order_by(
         Announcement.created_at.desc()
     ).limit(5).all()
-    from ...models import Student, Batch
+    counts = get_counts('active_students', 'active_faculty', 'active_batches')
     stats = {
-        'students': Student.query.filter_by(is_active=True).count(),
-        'faculty': Faculty.query.filter_by(is_active=True).count(),
-        'batches': Batch.query.filter_by(is_active=True).count(),
+        'students': counts['active_students'],
+        'faculty': counts['active_faculty'],
+        'batches': counts['active_batches'],
     }
     return render_template('public/home.html', subjects=subjects,
                            testimonials=testimonials, announcements=announcements,
@@ -24,37 +30,44 @@ def home():
 
 
 @public_bp.route('/about')
+@cached_page(Faculty)
 def about():
     faculty = Faculty.query.filter_by(is_active=True).order_by(Faculty.sort_order).all()
     return render_template('public/about.html', faculty=faculty)
 
 
 @public_bp.route('/subjects')
+@cached_page(Subject)
 def subjects():
     subjects = Subject.query.filter_by(is_active=True).all()
     return render_template('public/subjects.html', subjects=subjects)
 
 
 @public_bp.route('/subjects/<code>')
+@cached_page(Subject, Batch, Faculty)
 def subject_detail(code):
     subject = Subject.query.filter_by(code=code, is_active=True).first_or_404()
-    from ...models import Batch
-    batches = Batch.query.filter_by(subject_id=subject.id, is_active=True).all()
-    faculty_ids = [b.faculty_id for b in batches if b.faculty_id]
-    faculty = Faculty.query.filter(Faculty.id.in_(faculty_ids)).all() if faculty_ids else []
+    batches = Batch.query.options(db.joinedload(Batch.faculty)).filter_by(
+        subject_id=subject.id, is_active=True
+    ).all()
+    faculty = list({b.faculty.id: b.faculty for b in batches if b.faculty}.values())
     return render_template('public/subject_detail.html', subject=subject,
                            batches=batches, faculty=faculty)
 
 
 @public_bp.route('/faculty')
+@cached_page(Faculty)
 def faculty():
     faculty = Faculty.query.filter_by(is_active=True).order_by(Faculty.sort_order).all()
     return render_template('public/faculty.html', faculty=faculty)
 
 
 @public_bp.route('/gallery')
+@cached_page(GalleryImage)
 def gallery():
-    images = GalleryImage.query.filter_by(is_active=True).order_by(
+    images = GalleryImage.query.filter(
+        GalleryImage.is_active == True, GalleryImage.thumbnail != None
+    ).order_by(
         GalleryImage.sort_order, GalleryImage.uploaded_at.desc()
     ).all()
     categories = db.session.query(GalleryImage.category).filter_by(
@@ -83,6 +96,7 @@ def contact():
 
 
 @public_bp.route('/testimonials')
+@cached_page(Testimonial)
 def testimonials():
     testimonials = Testimonial.query.filter_by(is_active=True).order_by(
         Testimonial.created_at.desc()
@@ -1,40 +1,37 @@
-import os
-from flask import render_template, flash, redirect, url_for, request, current_app, send_file
+from flask import render_template, flash, redirect, url_for, request, current_app, jsonify
 from flask_login import login_required, current_user
+from werkzeug.exceptions import NotFound
 from werkzeug.security import check_password_hash, generate_password_hash
 from . import student_bp
 from ...extensions import db
-from ...models import (
-    Student, Result, Note, Announcement, BatchEnrollment, Subject
-)
+from ...models import Result, Note
 from ...forms import ProfileForm, ChangePasswordForm
-from ...utils import student_required, save_image
+from ...utils import student_required, release_upload, send_upload
+from ...images import image_pipeline, save_original
+from ...analytics import exam_stats_for, progress_for, ranks_for
+from ...pagination import keyset_paginate
+from ...student_context import get_student_context
+
+
+@student_bp.context_processor
+def inject_student_context():
+    if current_user.is_authenticated and current_user.role == 'student':
+        return dict(student_context=get_student_context())
+    return {}
 
 
 @student_bp.route('/')
 @login_required
 @student_required
 def dashboard():
-    announcements = Announcement.query.filter(
-        Announcement.is_active == True,
-        db.or_(
-            Announcement.target_grade == None,
-            Announcement.target_grade == current_user.grade
-        )
-    ).order_by(Announcement.created_at.desc()).limit(5).all()
-
-    enrollments = BatchEnrollment.query.filter_by(
-        student_id=current_user.id
-    ).all()
-    batches = [e.batch for e in enrollments if e.batch.is_active]
-
-    recent_results = Result.query.filter_by(
+    context = get_student_context()
+    recent_results = Result.query.options(db.joinedload(Result.subject)).filter_by(
         student_id=current_user.id
     ).order_by(Result.exam_date.desc()).limit(5).all()
 
     return render_template('student/dashboard.html',
-                           announcements=announcements,
-                           batches=batches,
+                           announcements=context.announcements,
+                           batches=context.batches,
                            recent_results=recent_results)
 
 
@@ -43,13 +40,39 @@ def dashboard():
 @student_required
 def results():
     subject_filter = request.args.get('subject', 0, type=int)
-    query = Result.query.filter_by(student_id=current_user.id)
+    query = Result.query.options(db.joinedload(Result.subject)).filter_by(
+        student_id=current_user.id)
     if subject_filter:
         query = query.filter_by(subject_id=subject_filter)
-    results = query.order_by(Result.exam_date.desc()).all()
-    subjects = Subject.query.filter_by(is_active=True).all()
-    return render_template('student/results.html', results=results,
-                           subjects=subjects, subject_filter=subject_filter)
+    results = keyset_paginate(query, Result, request.args.get('after'),
+                              request.args.get('before'), per_page=20, order_by='exam_date')
+    exam_stats = exam_stats_for((r.exam_name, r.subject_id, current_user.grade)
+                                for r in results.items)
+    ranks = ranks_for(current_user.id, ((r.exam_name, r.subject_id, r.exam_date)
+                                        for r in results.items))
+    progress = [p for p in progress_for(current_user.id)
+                if not subject_filter or p.subject_id == subject_filter]
+    return render_template('student/results.html', results=results, exam_stats=exam_stats,
+                           ranks=ranks, progress=progress, subjects=get_student_context().subjects,
+                           subject_filter=subject_filter)
+
+
+@student_bp.route('/results/progress')
+@login_required
+@student_required
+def progress():
+    return jsonify(subjects=[{
+        'subject_id': p.subject_id,
+        'subject': p.subject.name,
+        'exams': p.exam_count,
+        'average': p.average,
+        'rolling_average': p.rolling_average,
+        'best': p.best,
+        'latest': p.latest,
+        'latest_date': p.latest_date.isoformat() if p.latest_date else None,
+        'trend': p.trend,
+        'points': [{'date': day.isoformat(), 'percentage': pct} for day, pct in p.points()],
+    } for p in progress_for(current_user.id)])
 
 
 @student_bp.route('/notes')
@@ -57,37 +80,34 @@ def results():
 @student_required
 def notes():
     subject_filter = request.args.get('subject', 0, type=int)
-    query = Note.query.filter_by(is_active=True, grade=current_user.grade)
+    query = Note.query.options(db.joinedload(Note.subject)).filter_by(
+        is_active=True, grade=current_user.grade)
     if subject_filter:
         query = query.filter_by(subject_id=subject_filter)
     notes = query.order_by(Note.subject_id, Note.chapter).all()
-    subjects = Subject.query.filter_by(is_active=True).all()
     return render_template('student/notes.html', notes=notes,
-                           subjects=subjects, subject_filter=subject_filter)
+                           subjects=get_student_context().subjects,
+                           subject_filter=subject_filter)
 
 
 @student_bp.route('/notes/<int:id>/download')
 @login_required
 @student_required
 def download_note(id):
-    note = Note.query.get_or_404(id)
-    filepath = os.path.join(current_app.config['NOTES_FOLDER'], note.filename)
-    if os.path.exists(filepath):
-        return send_file(filepath, as_attachment=True,
-                         download_name=f'{note.title}.pdf')
-    flash('File not found.', 'danger')
-    return redirect(url_for('student.notes'))
+    note = Note.query.filter_by(id=id, is_active=True).first_or_404()
+    try:
+        return send_upload(current_app.config['NOTES_FOLDER'], note.filename,
+                           f'{note.title}.pdf')
+    except NotFound:
+        flash('File not found.', 'danger')
+        return redirect(url_for('student.notes'))
 
 
 @student_bp.route('/schedule')
 @login_required
 @student_required
 def schedule():
-    enrollments = BatchEnrollment.query.filter_by(
-        student_id=current_user.id
-    ).all()
-    batches = [e.batch for e in enrollments if e.batch.is_active]
-    return render_template('student/schedule.html', batches=batches)
+    return render_template('student/schedule.html', batches=get_student_context().batches)
 
 
 @student_bp.route('/profile', methods=['GET', 'POST'])
@@ -100,12 +120,15 @@ def profile():
     if 'update_profile' in request.form and form.validate_on_submit():
         current_user.phone = form.phone.data
         current_user.address = form.address.data
+        is_new = False
         if form.avatar.data:
-            current_user.avatar = save_image(
-                form.avatar.data, current_app.config['AVATARS_FOLDER'],
-                max_size=(300, 300)
-            )
+            old_avatar = current_user.avatar
+            current_user.avatar, is_new = save_original(form.avatar.data, 'avatar')
+            if old_avatar and old_avatar != 'default-avatar.png':
+                release_upload('avatar', old_avatar)
         db.session.commit()
+        if is_new:
+            image_pipeline.submit('avatar', current_user.avatar)
         flash('Profile updated!', 'success')
         return redirect(url_for('student.profile'))
 
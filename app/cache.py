@@ -0,0 +1,285 @@
+"""In-process caches with cross-worker invalidation.
+
+Every worker keeps its own copy of cached data. Each cache namespace has a
+version stamp file in the instance folder; writers replace the stamp after
+committing, and readers compare it (at most once per request) against the
+version their copy was loaded at. A change saved in one gunicorn worker is
+therefore picked up by all the others on their next request, without
+touching the database.
+
+Committed writes bump a stamp per changed table (``table.<name>``) and per
+changed counter (``counter.<name>``), which the public page cache uses to
+drop exactly the pages built from them.
+
+Cached values are always built from the primary database. A read replica
+that lags behind the stamp would otherwise leave stale data cached under
+the new version.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, request, session
+from flask_login import current_user
+from jinja2 import nodes
+from jinja2.ext import Extension
+from sqlalchemy import event
+
+from .database import primary_reads
+from .extensions import db
+
+
+def _stamp_path(name):
+    return os.path.join(current_app.instance_path, f'{name}.version')
+
+
+def get_version(name):
+    """Return the current version stamp of ``name``, read once per request."""
+    versions = g.setdefault('_cache_versions', {})
+    if name not in versions:
+        try:
+            with open(_stamp_path(name)) as f:
+                versions[name] = f.read()
+        except OSError:
+            versions[name] = ''
+    return versions[name]
+
+
+def bump_version(name):
+    """Mark every worker's copy of ``name`` as stale."""
+    path = _stamp_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    version = uuid.uuid4().hex
+    tmp_path = f'{path}.{version}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+    g.setdefault('_cache_versions', {})[name] = version
+    return version
+
+
+class VersionedCache:
+    """A value loaded once per worker and reloaded when its stamp changes.
+
+    ``loader`` is called inside the current app context. State is kept per
+    application object, so several apps in one process never share data.
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self._lock = threading.Lock()
+
+    def _entry(self):
+        store = current_app.extensions.setdefault('versioned_cache', {})
+        return store.setdefault(self.name, {'version': None, 'value': None})
+
+    def get(self):
+        version = get_version(self.name)
+        entry = self._entry()
+        if entry['version'] != version:
+            with self._lock:
+                if entry['version'] != version:
+                    with primary_reads():
+                        entry['value'] = self.loader()
+                    entry['version'] = version
+        return entry['value']
+
+    def invalidate(self):
+        """Call after the underlying rows have been committed."""
+        bump_version(self.name)
+
+
+def _load_site_settings():
+    from .models import SiteSetting
+    return {s.key: s.value for s in SiteSetting.query.all()}
+
+
+site_settings_cache = VersionedCache('site_settings', _load_site_settings)
+
+
+# ==================== Table change stamps ====================
+
+def table_stamp(name):
+    return f'table.{name}'
+
+
+def counter_stamp(name):
+    return f'counter.{name}'
+
+
+def mark_changed(session, stamp):
+    """Bump ``stamp`` once ``session`` commits."""
+    session.info.setdefault('changed_stamps', set()).add(stamp)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_flushed_tables(session, flush_context):
+    for obj in list(session.new) + list(session.deleted):
+        mark_changed(session, table_stamp(obj.__table__.name))
+    for obj in session.dirty:
+        if session.is_modified(obj):
+            mark_changed(session, table_stamp(obj.__table__.name))
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _track_bulk_statements(orm_execute_state):
+    # Core bulk inserts and Query.update()/delete() skip the flush.
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None and hasattr(table, 'name'):
+            mark_changed(orm_execute_state.session, table_stamp(table.name))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _bump_changed_stamps(session):
+    for stamp in session.info.pop('changed_stamps', ()):
+        try:
+            bump_version(stamp)
+        except OSError:
+            # The data is committed already; cached pages expire by TTL.
+            current_app.logger.exception('Could not bump the version of %s', stamp)
+
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _forget_changed_stamps(session, transaction):
+    # Only a rolled back outer transaction discards its changes; savepoint
+    # rollbacks keep whatever the enclosing transaction already wrote.
+    if transaction.parent is None:
+        session.info.pop('changed_stamps', None)
+
+
+# ==================== Rendered output caches ====================
+
+_namespaces = {'versioned_cache'}
+
+
+def _entries(name):
+    _namespaces.add(name)
+    return current_app.extensions.setdefault(
+        name, {'entries': OrderedDict(), 'lock': threading.Lock()})
+
+
+def clear_caches(app):
+    """Drop everything ``app`` has cached, as in a freshly started worker."""
+    for name in _namespaces:
+        app.extensions.pop(name, None)
+
+
+def _cache_get(name, key, versions):
+    """A value stored under ``key`` if it was built at ``versions`` and has not expired."""
+    store = _entries(name)
+    with store['lock']:
+        entry = store['entries'].get(key)
+        if entry is None or entry['versions'] != versions or entry['expires'] <= time.monotonic():
+            return None
+        store['entries'].move_to_end(key)
+        return entry['value']
+
+
+def _cache_set(name, key, versions, value, ttl):
+    store = _entries(name)
+    with store['lock']:
+        store['entries'][key] = {'value': value, 'versions': versions,
+                                 'expires': time.monotonic() + ttl}
+        store['entries'].move_to_end(key)
+        while len(store['entries']) > current_app.config.get('RENDER_CACHE_MAX_ENTRIES', 500):
+            store['entries'].popitem(last=False)
+
+
+def cached_value(namespace, key, tables, ttl, build):
+    """Return ``build()`` cached per worker under ``(namespace, key)``.
+
+    The value is rebuilt once ``ttl`` seconds pass or a commit changes one
+    of ``tables``. Cached values are shared between threads, so they must
+    not be ORM instances or other session-bound objects.
+    """
+    if ttl <= 0:
+        return build()
+    versions = tuple(get_version(table_stamp(t)) for t in tables)
+    value = _cache_get(namespace, key, versions)
+    if value is None:
+        with primary_reads():
+            value = build()
+        _cache_set(namespace, key, versions, value, ttl)
+    return value
+
+
+class FragmentCacheExtension(Extension):
+    """Cache a rendered template fragment per worker.
+
+    ``{% cache 'footer' depends 'site_settings' %}...{% endcache %}``
+
+    Every expression before ``depends`` is part of the key, so anything the
+    fragment varies on (such as the user's role) must be listed there. The
+    fragment is rendered again once ``FRAGMENT_CACHE_TTL`` seconds pass or
+    a commit changes one of the tables after ``depends``.
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        keys = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            keys.append(parser.parse_expression())
+        tables = []
+        if parser.stream.skip_if('name:depends'):
+            tables.append(parser.parse_expression())
+            while parser.stream.skip_if('comma'):
+                tables.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        call = self.call_method('_render', [nodes.List(keys), nodes.List(tables)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, keys, tables, caller):
+        return cached_value('fragment_cache', tuple(keys), tables,
+                            current_app.config.get('FRAGMENT_CACHE_TTL', 0), caller)
+
+
+# ==================== Public page cache ====================
+
+def _is_cacheable_request():
+    return (current_app.config.get('PAGE_CACHE_TTL', 0) > 0
+            and request.method in ('GET', 'HEAD')
+            and '_flashes' not in session
+            and not current_user.is_authenticated)
+
+
+def cached_page(*models, counters=(), ttl=None):
+    """Serve a view's HTML from a per-worker cache for anonymous visitors.
+
+    An entry is reused until ``ttl`` seconds (default ``PAGE_CACHE_TTL``)
+    pass or a commit changes one of ``models``, one of the named
+    ``counters`` or the site settings. A page that only shows how many rows
+    a table has should depend on its counter, not the table. Responses that
+    touch the session (flashes, logins) are never stored.
+    """
+    stamps = tuple(table_stamp(t) for t in ('site_settings',) + tuple(m.__tablename__ for m in models))
+    stamps += tuple(counter_stamp(name) for name in counters)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not _is_cacheable_request():
+                return view(*args, **kwargs)
+            key = request.full_path
+            versions = tuple(get_version(stamp) for stamp in stamps)
+            cached = _cache_get('page_cache', key, versions)
+            if cached is not None:
+                body, mimetype = cached
+                response = current_app.response_class(body, mimetype=mimetype)
+                response.headers['X-Page-Cache'] = 'hit'
+                return response
+
+            with primary_reads():
+                response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not session.modified and not response.is_streamed:
+                _cache_set('page_cache', key, versions, (response.get_data(), response.mimetype),
+                           ttl or current_app.config['PAGE_CACHE_TTL'])
+                response.headers['X-Page-Cache'] = 'miss'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,665 @@
+"""Flask CLI commands for maintenance and working with production-sized data.
+
+    flask generate-data --students 100000 --results 2000000
+    flask benchmark --repeat 20 --save before.json
+    flask benchmark --repeat 20 --baseline before.json
+    flask process-images --backfill
+    flask search-reindex
+    flask reconcile-counters
+    flask rebuild-analytics
+    flask explain-queries --check
+    flask check-database
+    flask sync-replicas
+"""
+import json
+import random
+import re
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from werkzeug.security import generate_password_hash
+
+from .extensions import db
+from .models import (
+    AdminUser, Student, Subject, Faculty, Batch, BatchEnrollment, Result,
+    Announcement, GalleryImage, Note, Testimonial, ContactMessage, ExamStat, RankList
+)
+from .analytics import deferred_analytics, rebuild_analytics
+from .search import is_enabled as search_enabled, rebuild_index
+from .utils import calculate_grade, reserve_student_ids
+
+GRADES = (9, 10, 11, 12)
+EXAM_NAMES = ('Unit Test 1', 'Unit Test 2', 'Weekly Test', 'Mid Term',
+              'Pre Board', 'Final Exam')
+CHUNK_SIZE = 10000
+
+
+def register_commands(app):
+    app.cli.add_command(generate_data)
+    app.cli.add_command(benchmark)
+    app.cli.add_command(process_images)
+    app.cli.add_command(search_reindex)
+    app.cli.add_command(reconcile_counters)
+    app.cli.add_command(rebuild_analytics_command)
+    app.cli.add_command(explain_queries)
+    app.cli.add_command(check_database_command)
+    app.cli.add_command(sync_replicas)
+    app.cli.add_command(purge_import_reports)
+
+
+# ==================== Data generator ====================
+
+def _bulk_insert(model, rows):
+    """Insert ``rows`` (an iterable of dicts) in executemany chunks."""
+    table = model.__table__
+    total = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            db.session.execute(table.insert(), chunk)
+            total += len(chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+        total += len(chunk)
+    db.session.commit()
+    return total
+
+
+def _sync_sequence(model):
+    """Move a PostgreSQL id sequence past rows inserted with explicit ids."""
+    if db.engine.dialect.name == 'postgresql':
+        table = model.__tablename__
+        db.session.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"))
+        db.session.commit()
+
+
+def _next_id(model):
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def _random_datetime(rng, start, end):
+    span = int((end - start).total_seconds())
+    return start + timedelta(seconds=rng.randrange(max(span, 1)))
+
+
+@click.command('generate-data')
+@with_appcontext
+@click.option('--students', default=100000, show_default=True)
+@click.option('--faculty', 'faculty_count', default=200, show_default=True)
+@click.option('--batches', default=2000, show_default=True)
+@click.option('--enrollments', default=500000, show_default=True)
+@click.option('--results', default=2000000, show_default=True)
+@click.option('--notes', default=20000, show_default=True)
+@click.option('--gallery', default=5000, show_default=True)
+@click.option('--announcements', default=2000, show_default=True)
+@click.option('--messages', default=10000, show_default=True)
+@click.option('--testimonials', default=500, show_default=True)
+@click.option('--years', default=3, show_default=True, help='How far back dates go.')
+@click.option('--seed', default=42, show_default=True, help='Random seed.')
+def generate_data(students, faculty_count, batches, enrollments, results, notes,
+                  gallery, announcements, messages, testimonials, years, seed):
+    """Fill the database with synthetic rows for load testing."""
+    rng = random.Random(seed)
+    subject_ids = [s.id for s in Subject.query.filter_by(is_active=True).all()]
+    if not subject_ids:
+        raise click.ClickException('No subjects found; run seed.py first.')
+
+    now = datetime.utcnow()
+    start = now - timedelta(days=365 * years)
+    started = time.perf_counter()
+
+    def report(label, count):
+        click.echo(f'{label:<14} {count:>9,}  ({time.perf_counter() - started:.1f}s)')
+
+    # Every generated student shares one hash so the run is not CPU bound.
+    password_hash = generate_password_hash('student123')
+    first_student = _next_id(Student)
+    student_grades = [rng.choice(GRADES) for _ in range(students)]
+    student_created = [_random_datetime(rng, start, now) for _ in range(students)]
+    per_year = {}
+    for created in student_created:
+        per_year[created.year] = per_year.get(created.year, 0) + 1
+    id_blocks = {year: iter(reserve_student_ids(count, year=year))
+                 for year, count in per_year.items()}
+
+    def student_rows():
+        for i, grade in enumerate(student_grades):
+            pk = first_student + i
+            created = student_created[i]
+            yield {
+                'id': pk, 'student_id': next(id_blocks[created.year]),
+                'full_name': f'Student {pk}', 'email': f'student{pk}@example.test',
+                'phone': f'9{pk:09d}'[-10:], 'password_hash': password_hash,
+                'grade': grade, 'avatar': 'default-avatar.png',
+                'parent_name': f'Parent {pk}', 'is_active': rng.random() > 0.05,
+                'created_at': created,
+            }
+    report('students', _bulk_insert(Student, student_rows()))
+    _sync_sequence(Student)
+
+    first_faculty = _next_id(Faculty)
+    report('faculty', _bulk_insert(Faculty, (
+        {'id': first_faculty + i, 'full_name': f'Faculty {first_faculty + i}',
+         'qualification': 'M.Sc., B.Ed.', 'photo': 'default-avatar.png',
+         'is_active': True, 'sort_order': i}
+        for i in range(faculty_count))))
+    _sync_sequence(Faculty)
+    faculty_ids = list(range(first_faculty, first_faculty + faculty_count))
+
+    first_batch = _next_id(Batch)
+    batch_grades = [rng.choice(GRADES) for _ in range(batches)]
+    batch_subjects = [rng.choice(subject_ids) for _ in range(batches)]
+    report('batches', _bulk_insert(Batch, (
+        {'id': first_batch + i, 'name': f'Batch {first_batch + i}',
+         'subject_id': batch_subjects[i], 'grade': batch_grades[i],
+         'faculty_id': rng.choice(faculty_ids) if faculty_ids else None,
+         'schedule': 'Mon, Wed, Fri 4-6 PM', 'max_students': 300,
+         'start_date': _random_datetime(rng, start, now).date(),
+         'is_active': rng.random() > 0.1, 'created_at': _random_datetime(rng, start, now)}
+        for i in range(batches))))
+    _sync_sequence(Batch)
+
+    batches_by_grade = {grade: [] for grade in GRADES}
+    for i, grade in enumerate(batch_grades):
+        batches_by_grade[grade].append(first_batch + i)
+
+    def enrollment_rows():
+        if not students:
+            return
+        per_student, extra = divmod(enrollments, students)
+        for i, grade in enumerate(student_grades):
+            pool = batches_by_grade[grade]
+            k = min(per_student + (1 if i < extra else 0), len(pool))
+            for batch_id in rng.sample(pool, k):
+                yield {'student_id': first_student + i, 'batch_id': batch_id,
+                       'enrolled_at': _random_datetime(rng, start, now)}
+    with deferred_analytics():
+        report('enrollments', _bulk_insert(BatchEnrollment, enrollment_rows()))
+
+    def result_rows():
+        for _ in range(results if students else 0):
+            total = rng.choice((20, 25, 50, 80, 100))
+            marks = round(min(total, max(0.0, rng.gauss(0.65, 0.18) * total)), 1)
+            exam_date = _random_datetime(rng, start, now)
+            yield {
+                'student_id': first_student + rng.randrange(students),
+                'subject_id': rng.choice(subject_ids),
+                'exam_name': rng.choice(EXAM_NAMES), 'exam_date': exam_date.date(),
+                'marks_obtained': marks, 'total_marks': total,
+                'grade_letter': calculate_grade(marks / total * 100),
+                'created_at': exam_date + timedelta(days=rng.randrange(1, 8)),
+            }
+    with deferred_analytics():
+        report('results', _bulk_insert(Result, result_rows()))
+    report('analytics', rebuild_analytics())
+
+    report('notes', _bulk_insert(Note, (
+        {'title': f'Chapter {i % 15 + 1} notes', 'subject_id': rng.choice(subject_ids),
+         'grade': rng.choice(GRADES), 'chapter': f'Chapter {i % 15 + 1}',
+         'filename': f'synthetic_{i}.pdf', 'file_size': rng.randrange(100000, 30000000),
+         'uploaded_at': _random_datetime(rng, start, now), 'is_active': rng.random() > 0.05}
+        for i in range(notes))))
+
+    report('gallery', _bulk_insert(GalleryImage, (
+        {'filename': f'synthetic_{i}.jpg', 'thumbnail': f'thumb_synthetic_{i}.jpg',
+         'caption': f'Photo {i}', 'category': rng.choice(('general', 'classroom', 'events')),
+         'sort_order': i, 'is_active': True, 'uploaded_at': _random_datetime(rng, start, now)}
+        for i in range(gallery))))
+
+    report('announcements', _bulk_insert(Announcement, (
+        {'title': f'Announcement {i}', 'content': 'Synthetic announcement text.',
+         'category': 'general', 'priority': rng.choice(('low', 'normal', 'high')),
+         'target_grade': rng.choice((None,) + GRADES), 'is_active': rng.random() > 0.3,
+         'created_at': _random_datetime(rng, start, now)}
+        for i in range(announcements))))
+
+    report('messages', _bulk_insert(ContactMessage, (
+        {'name': f'Visitor {i}', 'email': f'visitor{i}@example.test',
+         'message': 'Synthetic enquiry.', 'is_read': rng.random() > 0.2,
+         'created_at': _random_datetime(rng, start, now)}
+        for i in range(messages))))
+
+    report('testimonials', _bulk_insert(Testimonial, (
+        {'student_name': f'Alumnus {i}', 'content': 'Synthetic testimonial.',
+         'rating': rng.randint(3, 5), 'is_featured': i < 6, 'is_active': True,
+         'created_at': _random_datetime(rng, start, now)}
+        for i in range(testimonials))))
+
+    # Bulk inserts bypass the ORM hooks that maintain the search index.
+    report('search index', rebuild_index())
+
+    click.echo(f'Done in {time.perf_counter() - started:.1f}s.')
+
+
+# ==================== Route benchmark ====================
+
+# Models that provide a sample value for URL arguments, by endpoint.
+SAMPLE_ARGS = {
+    'public.subject_detail': (Subject, 'code'),
+    'admin.edit_student': (Student, 'id'),
+    'admin.edit_batch': (Batch, 'id'),
+    'admin.enroll_students': (Batch, 'id'),
+    'admin.edit_result': (Result, 'id'),
+    'admin.edit_announcement': (Announcement, 'id'),
+    'admin.edit_faculty': (Faculty, 'id'),
+    'admin.edit_testimonial': (Testimonial, 'id'),
+    'admin.view_message': (ContactMessage, 'id'),
+    'student.download_note': (Note, 'id'),
+    'admin.exam_analytics': (ExamStat, 'id'),
+    'admin.exam_leaderboard': (RankList, 'id'),
+}
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def _benchmark_urls(app):
+    """Yield ``(endpoint, url)`` for every GET route of the blueprints."""
+    from flask import url_for
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        if 'GET' not in rule.methods or rule.endpoint == 'static':
+            continue
+        if rule.endpoint.split('.')[0] not in ('public', 'auth', 'student', 'admin'):
+            continue
+        if rule.endpoint == 'auth.logout':
+            continue
+        values = {}
+        if rule.arguments:
+            sample = SAMPLE_ARGS.get(rule.endpoint)
+            if sample is None:
+                continue
+            model, column = sample
+            row = model.query.order_by(model.id.desc()).first()
+            if row is None:
+                continue
+            values = {arg: getattr(row, column) for arg in rule.arguments}
+        with app.test_request_context():
+            yield rule.endpoint, url_for(rule.endpoint, **values)
+
+
+def _login(client, user_id):
+    with client.session_transaction() as session:
+        session['_user_id'] = user_id
+        session['_fresh'] = True
+
+
+def _benchmark_clients(app):
+    """Test clients by blueprint, logged in as the admin and the most enrolled student."""
+    admin = AdminUser.query.first()
+    student = db.session.query(Student).join(BatchEnrollment).filter(
+        Student.is_active == True
+    ).group_by(Student.id).order_by(db.func.count(BatchEnrollment.id).desc()).first() \
+        or Student.query.filter_by(is_active=True).first()
+    clients = {'public': app.test_client(), 'auth': app.test_client(),
+               'admin': app.test_client(), 'student': app.test_client()}
+    if admin:
+        _login(clients['admin'], admin.get_id())
+    if student:
+        _login(clients['student'], student.get_id())
+    return clients
+
+
+@click.command('benchmark')
+@with_appcontext
+@click.option('--repeat', default=20, show_default=True, help='Requests per route.')
+@click.option('--save', type=click.Path(dir_okay=False), help='Write results as JSON.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False),
+              help='Compare against a previously saved JSON run.')
+def benchmark(repeat, save, baseline):
+    """Time every blueprint GET route and count its SQL statements."""
+    from .testing import record_queries
+    app = current_app._get_current_object()
+    app.config['SQL_RECORD_QUERIES'] = True
+
+    clients = _benchmark_clients(app)
+    urls = list(_benchmark_urls(app))
+    db.session.remove()
+
+    before = {}
+    if baseline:
+        with open(baseline) as f:
+            before = json.load(f)
+
+    report = {}
+    click.echo(f'{"endpoint":<32} {"status":>6} {"p50 ms":>9} {"p95 ms":>9} {"queries":>8}')
+    for endpoint, url in urls:
+        client = clients[endpoint.split('.')[0]]
+        timings, counts = [], []
+        status = None
+        for _ in range(repeat):
+            # A fresh app context per request, so ``g`` is not shared with the CLI's.
+            with app.app_context(), record_queries(app) as recorded:
+                started = time.perf_counter()
+                # Read streamed bodies to the end and close them before the context goes.
+                with client.get(url) as response:
+                    response.get_data()
+                timings.append((time.perf_counter() - started) * 1000)
+            status = response.status_code
+            counts.append(sum(stats.count for _, stats in recorded))
+        row = {'url': url, 'status': status,
+               'p50': round(_percentile(timings, 50), 2),
+               'p95': round(_percentile(timings, 95), 2),
+               'queries': int(statistics.median(counts))}
+        report[endpoint] = row
+        line = f'{endpoint:<32} {status:>6} {row["p50"]:>9.2f} {row["p95"]:>9.2f} {row["queries"]:>8}'
+        if endpoint in before:
+            old = before[endpoint]
+            line += f'   (p50 {row["p50"] - old["p50"]:+.2f} ms, queries {row["queries"] - old["queries"]:+d})'
+        click.echo(line)
+
+    if save:
+        with open(save, 'w') as f:
+            json.dump(report, f, indent=2)
+        click.echo(f'Saved {len(report)} routes to {save}.')
+
+
+# ==================== Query plans ====================
+
+# Filtered variants of list pages, so their plans are checked too.
+EXPLAIN_VARIANTS = {
+    'admin.students': ('grade=10',),
+    'admin.results': ('grade=10', 'subject=1', 'date_from=2024-01-01&date_to=2024-12-31'),
+    'admin.analytics': ('grade=10&subject=1',),
+    'admin.leaderboard': ('subject=1',),
+    'student.results': ('subject=1',),
+    'student.notes': ('subject=1',),
+}
+
+# Lookup tables small enough that scanning or sorting them is the best plan.
+SMALL_TABLES = ('admin_users', 'subjects', 'faculty', 'testimonials', 'site_settings',
+                'counters')
+
+# Whole-table downloads, which read every row whatever the indexes.
+FULL_SCAN_ENDPOINTS = ('admin.export_students', 'admin.export_results',
+                       'admin.export_enrollments')
+
+_SELECT = re.compile(r'\s*(SELECT|WITH)\b', re.IGNORECASE)
+# SQLAlchemy aliases a joined table as <table>_<n>.
+_SQLITE_TABLE = re.compile(r'(SCAN|SEARCH) ([a-z]\w*?)(?:_\d+)?(?: |$)', re.IGNORECASE)
+
+
+def _sqlite_plan(conn, statement, parameters):
+    """Return ``(plan lines, tables read, (table, problem) pairs)`` from EXPLAIN QUERY PLAN.
+
+    A sort of the rows sharing an index prefix ("RIGHT PART OF ORDER BY")
+    only ever holds ties, so it is not flagged.
+    """
+    lines, tables, problems = [], set(), []
+    for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters):
+        detail = row[-1]
+        lines.append(detail)
+        access = _SQLITE_TABLE.match(detail)
+        if access:
+            tables.add(access.group(2))
+            if access.group(1) == 'SCAN' and access.end() == len(detail):
+                problems.append((access.group(2), detail))
+        elif detail.startswith('USE TEMP B-TREE') and 'RIGHT PART' not in detail:
+            problems.append((None, detail))
+    return lines, tables, problems
+
+
+def _postgresql_plan(conn, statement, parameters):
+    """Return ``(plan lines, tables read, (table, problem) pairs)`` from EXPLAIN (FORMAT JSON)."""
+    lines, tables, problems = [], set(), []
+
+    def walk(node, depth):
+        relation = node.get('Relation Name')
+        line = node['Node Type'] + (f' on {relation}' if relation else '')
+        if node.get('Sort Key'):
+            line += f' by {", ".join(node["Sort Key"])}'
+        lines.append('  ' * depth + line)
+        if relation:
+            tables.add(relation)
+        if node['Node Type'] == 'Seq Scan':
+            problems.append((relation, line))
+        elif node['Node Type'] == 'Sort':
+            problems.append((None, line))
+        for child in node.get('Plans', ()):
+            walk(child, depth + 1)
+
+    plan = conn.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    walk(plan[0]['Plan'], 0)
+    return lines, tables, problems
+
+
+def _explain_urls(app):
+    for endpoint, url in _benchmark_urls(app):
+        yield endpoint, url
+        for query_string in EXPLAIN_VARIANTS.get(endpoint, ()):
+            yield endpoint, f'{url}?{query_string}'
+
+
+@click.command('explain-queries')
+@with_appcontext
+@click.option('--verbose', '-v', is_flag=True, help='Print the plan of every statement.')
+@click.option('--ignore', multiple=True, default=SMALL_TABLES, show_default=True,
+              help='Table that may be scanned and sorted (repeatable).')
+@click.option('--check', is_flag=True, help='Exit with status 1 if any statement is flagged.')
+def explain_queries(verbose, ignore, check):
+    """EXPLAIN every SELECT the blueprint GET routes issue.
+
+    Flags full table scans and sorts not served by an index ("USE TEMP
+    B-TREE" on SQLite, Sort nodes on PostgreSQL). Plans depend on the
+    data, so run it against a production-sized database (see
+    ``generate-data``).
+    """
+    app = current_app._get_current_object()
+    engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        explain = _sqlite_plan
+    elif engine.dialect.name == 'postgresql':
+        explain = _postgresql_plan
+    else:
+        raise click.ClickException(f'EXPLAIN is not supported on {engine.dialect.name}.')
+
+    clients = _benchmark_clients(app)
+    urls = list(_explain_urls(app))
+    db.session.remove()
+
+    captured = []
+
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and _SELECT.match(statement):
+            captured.append((statement, parameters))
+
+    seen = set()
+    explained = flagged = 0
+    # Replicas included: GET requests may read from them.
+    engines = list(db.engines.values())
+    for bound in engines:
+        event.listen(bound, 'before_cursor_execute', _capture)
+    try:
+        for endpoint, url in urls:
+            captured.clear()
+            with app.app_context():
+                with clients[endpoint.split('.')[0]].get(url) as response:
+                    response.get_data()
+                status = response.status_code
+            report = []
+            with engine.connect() as conn:
+                for sql, params in captured:
+                    if sql in seen:
+                        continue
+                    seen.add(sql)
+                    lines, tables, problems = explain(conn, sql, params)
+                    if tables <= set(ignore):
+                        problems = []
+                    problems = [line for table, line in problems if table not in ignore
+                                and not (table and endpoint in FULL_SCAN_ENDPOINTS)]
+                    explained += 1
+                    flagged += bool(problems)
+                    if problems or verbose:
+                        report.append((sql, lines, problems))
+            if not report:
+                continue
+            click.echo(f'{endpoint} {url} [{status}]')
+            for sql, lines, problems in report:
+                click.echo('    ' + ' '.join(sql.split())[:300])
+                for line in lines if verbose else problems:
+                    click.echo(f'  {"!" if line in problems else " "}   {line}')
+            click.echo()
+    finally:
+        for bound in engines:
+            event.remove(bound, 'before_cursor_execute', _capture)
+
+    click.echo(f'{explained} statement(s) explained, {flagged} with full scans or unindexed sorts.')
+    if check and flagged:
+        raise SystemExit(1)
+
+
+# ==================== Database ====================
+
+@click.command('check-database')
+@with_appcontext
+def check_database_command():
+    """Show the settings each database engine is actually running with."""
+    from .database import check_database
+    failed = False
+    for bind in db.engines:
+        click.echo(f'[{bind or "default"}]')
+        try:
+            settings, problems = check_database(current_app._get_current_object(), [bind])[bind]
+        except DBAPIError as e:
+            click.echo(f'  ! cannot connect: {e.orig}', err=True)
+            failed = True
+            continue
+        for key, value in settings.items():
+            click.echo(f'  {key:<16} {value}')
+        for problem in problems:
+            click.echo(f'  ! {problem}', err=True)
+        failed = failed or bool(problems)
+    if failed:
+        raise SystemExit(1)
+
+
+@click.command('sync-replicas')
+@with_appcontext
+def sync_replicas():
+    """Copy the primary SQLite database over each SQLite replica.
+
+    Stands in for replication when trying out read replicas locally;
+    server replicas are kept in sync by the database itself.
+    """
+    replicas = current_app.extensions['db_replicas']
+    if not replicas:
+        raise click.ClickException('No replicas are configured (DATABASE_REPLICA_URLS).')
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException('Only SQLite databases can be copied.')
+    source = db.engine.raw_connection()
+    try:
+        for bind in replicas:
+            engine = db.engines[bind]
+            if engine.dialect.name != 'sqlite':
+                click.echo(f'{bind}: skipped, not SQLite')
+                continue
+            target = engine.raw_connection()
+            try:
+                source.driver_connection.backup(target.driver_connection)
+            finally:
+                target.close()
+            click.echo(f'{bind}: copied to {engine.url.database}')
+    finally:
+        source.close()
+
+
+# ==================== Images ====================
+
+@click.command('process-images')
+@with_appcontext
+@click.option('--backfill', is_flag=True,
+              help='Also record, and create missing, responsive sizes of processed gallery images.')
+def process_images(backfill):
+    """Process uploads left unprocessed, e.g. after a worker restart."""
+    from .images import pending_images, process_image, backfill_variants, is_processed
+    done = failed = 0
+    for kind, filename in list(pending_images()):
+        try:
+            process_image(kind, filename)
+            done += 1
+        except Exception as e:
+            failed += 1
+            click.echo(f'{kind}/{filename}: {e}', err=True)
+    click.echo(f'Processed {done} pending image(s), {failed} failed.')
+
+    # Duplicate uploads committed after the shared job marked its rows ready.
+    for image in GalleryImage.query.filter(GalleryImage.thumbnail == None):
+        if is_processed('gallery', image.filename):
+            done = GalleryImage.query.filter(GalleryImage.filename == image.filename,
+                                             GalleryImage.thumbnail != None).first()
+            image.thumbnail = f'thumb_{image.filename}'
+            image.widths = done.widths if done else None
+            image.processing_failed = False
+    db.session.commit()
+
+    if backfill:
+        created = sum(backfill_variants(image) for image in GalleryImage.query.filter(
+            GalleryImage.thumbnail != None, GalleryImage.widths == None))
+        db.session.commit()
+        click.echo(f'Created {created} missing responsive size(s).')
+
+
+# ==================== Search ====================
+
+@click.command('search-reindex')
+@with_appcontext
+def search_reindex():
+    """Rebuild the full-text search index from the database."""
+    if not search_enabled():
+        raise click.ClickException('Full-text search is not available on this database.')
+    started = time.perf_counter()
+    total = rebuild_index()
+    click.echo(f'Indexed {total:,} documents in {time.perf_counter() - started:.1f}s.')
+
+
+# ==================== Counters ====================
+
+@click.command('purge-import-reports')
+@with_appcontext
+def purge_import_reports():
+    """Delete student import credentials sheets older than IMPORT_REPORT_HOURS.
+
+    The import page purges them too; run this from cron so sheets expire
+    even when nobody opens it.
+    """
+    from .importers import purge_credential_sheets
+    purged = purge_credential_sheets(current_app.config['IMPORT_REPORTS_FOLDER'],
+                                     timedelta(hours=current_app.config['IMPORT_REPORT_HOURS']))
+    click.echo(f'Deleted {purged} credentials sheet(s).')
+
+
+@click.command('reconcile-counters')
+@with_appcontext
+def reconcile_counters():
+    """Recount the dashboard counters and report any drift."""
+    from .counters import reconcile
+    report = reconcile()
+    db.session.commit()
+    for name, (stored, actual) in report.items():
+        status = 'ok' if stored == actual else f'was {stored}'
+        click.echo(f'{name:<22} {actual:>9,}  {status}')
+
+
+# ==================== Analytics ====================
+
+@click.command('rebuild-analytics')
+@with_appcontext
+def rebuild_analytics_command():
+    """Recompute exam statistics from every result."""
+    start = time.perf_counter()
+    total = rebuild_analytics()
+    click.echo(f'{total:,} results aggregated in {time.perf_counter() - start:.1f}s')
@@ -0,0 +1,170 @@
+"""Materialized row counts for dashboards.
+
+Each counter counts the rows of one model whose flag column holds a given
+value, e.g. active students or unread messages, or all of its rows. Deltas
+are applied to the ``counters`` table in the same transaction as the change
+itself: ORM inserts, deletes and flag flips through an ``after_flush``
+hook, and Core bulk statements through ``do_orm_execute``. Reading any
+number of counters is one primary-key lookup and never writes, so the
+pages showing them stay cacheable; a counter that changes bumps its
+``counter.<name>`` cache stamp on commit. Missing counters are seeded with
+a COUNT(*) at startup and by ``flask reconcile-counters``, which also
+repairs drift, e.g. after raw SQL edits.
+"""
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from .cache import counter_stamp, mark_changed
+from .extensions import db
+from .models import Counter, Student, Faculty, Batch, Announcement, ContactMessage, Result
+
+# name -> (model, flag attribute, value that is counted); no attribute counts every row
+COUNTERS = {
+    'active_students': (Student, 'is_active', True),
+    'active_faculty': (Faculty, 'is_active', True),
+    'active_batches': (Batch, 'is_active', True),
+    'active_announcements': (Announcement, 'is_active', True),
+    'unread_messages': (ContactMessage, 'is_read', False),
+    'results': (Result, None, None),
+}
+_COUNTERS_BY_MODEL = {}
+for _name, (_model, _attr, _value) in COUNTERS.items():
+    _COUNTERS_BY_MODEL.setdefault(_model, []).append((_name, _attr, _value))
+_COUNTERS_BY_TABLE = {model.__tablename__: counters
+                      for model, counters in _COUNTERS_BY_MODEL.items()}
+
+
+def _load_old_flag(target, value, oldvalue, initiator):
+    pass
+
+
+# Setting a flag that was expired (e.g. by a commit) loads the value it
+# replaces first, so the flush can tell whether the count changed.
+for _model, _counters in _COUNTERS_BY_MODEL.items():
+    for _name, _attr, _value in _counters:
+        if _attr is not None:
+            event.listen(getattr(_model, _attr), 'set', _load_old_flag, active_history=True)
+
+
+def _apply(session, deltas):
+    table = Counter.__table__
+    changes = [{'n': name, 'd': delta} for name, delta in deltas.items() if delta]
+    for change in changes:
+        mark_changed(session, counter_stamp(change['n']))
+    if changes:
+        session.connection().execute(table.update().where(
+            table.c.name == db.bindparam('n')).values(value=table.c.value + db.bindparam('d')),
+            changes)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _count_flushed(session, flush_context):
+    deltas = {}
+    for obj in session.new:
+        for name, attr, value in _COUNTERS_BY_MODEL.get(type(obj), ()):
+            if attr is None or getattr(obj, attr) == value:
+                deltas[name] = deltas.get(name, 0) + 1
+    for obj in session.deleted:
+        for name, attr, value in _COUNTERS_BY_MODEL.get(type(obj), ()):
+            if attr is None:
+                deltas[name] = deltas.get(name, 0) - 1
+                continue
+            history = db.inspect(obj).attrs[attr].history
+            old = history.deleted[0] if history.deleted else getattr(obj, attr)
+            if old == value:
+                deltas[name] = deltas.get(name, 0) - 1
+    for obj in session.dirty:
+        for name, attr, value in _COUNTERS_BY_MODEL.get(type(obj), ()):
+            if attr is None:
+                continue
+            history = db.inspect(obj).attrs[attr].history
+            if history.deleted and history.added:
+                was, now = history.deleted[0] == value, history.added[0] == value
+                if was != now:
+                    deltas[name] = deltas.get(name, 0) + (1 if now else -1)
+    _apply(session, deltas)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _count_bulk(orm_execute_state):
+    table = getattr(orm_execute_state.statement, 'table', None)
+    counters = _COUNTERS_BY_TABLE.get(getattr(table, 'name', None))
+    if not counters:
+        return None
+    if orm_execute_state.is_insert:
+        params = orm_execute_state.parameters or []
+        rows = [params] if isinstance(params, dict) else params
+        deltas = {}
+        for name, attr, value in counters:
+            if attr is None:
+                deltas[name] = len(rows)
+                continue
+            default = table.c[attr].default
+            default = default.arg if default is not None and default.is_scalar else None
+            deltas[name] = sum(1 for row in rows if row.get(attr, default) == value)
+        result = orm_execute_state.invoke_statement()
+        _apply(orm_execute_state.session, deltas)
+        return result
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        result = orm_execute_state.invoke_statement()
+        # Counts of all rows only change by the rows deleted. Which flags
+        # changed is unknown here, so those counters are recounted.
+        if orm_execute_state.is_delete:
+            _apply(orm_execute_state.session, {
+                name: -result.rowcount for name, attr, _ in counters if attr is None})
+        reconcile([name for name, attr, _ in counters if attr is not None])
+        return result
+    return None
+
+
+def _count(name):
+    model, attr, value = COUNTERS[name]
+    query = db.session.query(db.func.count(model.id))
+    if attr is not None:
+        query = query.filter(getattr(model, attr) == value)
+    return query.scalar()
+
+
+def reconcile(names=None):
+    """Recount counters from their tables; returns ``{name: (stored, actual)}``."""
+    report = {}
+    for name in names or COUNTERS:
+        actual = _count(name)
+        counter = db.session.get(Counter, name)
+        if counter is None:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(Counter(name=name, value=actual))
+            except IntegrityError:
+                # Seeded concurrently by another request.
+                counter = db.session.get(Counter, name)
+            report[name] = (None, actual)
+        if counter is not None:
+            report[name] = (counter.value, actual)
+            counter.value = actual
+        if report[name][0] != actual:
+            mark_changed(db.session, counter_stamp(name))
+    db.session.flush()
+    return report
+
+
+def seed_counters():
+    """Create any counters that do not exist yet; returns their names."""
+    existing = {name for name, in db.session.query(Counter.name)}
+    missing = [name for name in COUNTERS if name not in existing]
+    if missing:
+        reconcile(missing)
+        db.session.commit()
+    return missing
+
+
+def get_counts(*names):
+    """Current values of the named counters.
+
+    A counter that has not been seeded yet is counted with a COUNT(*).
+    """
+    values = dict(db.session.query(Counter.name, Counter.value).filter(Counter.name.in_(names)))
+    for name in names:
+        if name not in values:
+            values[name] = _count(name)
+    return values
@@ -0,0 +1,269 @@
+"""Engine settings, read replica routing and a startup check of the databases.
+
+SQLite is shared by every gunicorn worker through one file. Each new
+connection therefore sets these pragmas:
+
+- WAL journal mode, so readers don't block the writer or each other.
+- ``busy_timeout``, so a writer waits for the lock instead of failing
+  with "database is locked".
+- ``synchronous=NORMAL``, which is still crash safe in WAL mode and
+  syncs only at checkpoints.
+- Larger ``mmap_size`` and ``cache_size``, so hot pages are read from
+  memory.
+
+Server databases (PostgreSQL) get an explicitly sized pool. Connections
+are pinged before use and replaced after ``DB_POOL_RECYCLE`` seconds, so
+server restarts and idle timeouts don't surface as request errors.
+
+Pools are per process. A forked child, such as a gunicorn worker of a
+preloaded app, drops the connections it inherited without closing the
+parent's.
+
+Read replicas listed in ``SQLALCHEMY_REPLICA_URIS`` become binds
+``replica0``, ``replica1`` and so on. :class:`RoutingSession` sends the
+SELECTs of GET requests to one of them and everything else to the
+primary. A replica that cannot be reached at startup is left out.
+"""
+import itertools
+import os
+import re
+import time
+import weakref
+from contextlib import contextmanager
+from functools import partial
+
+from flask import current_app, has_request_context, request, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.elements import TextClause
+
+SQLITE_SYNCHRONOUS = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+# Pragmas that have no effect on an in-memory database
+SQLITE_FILE_PRAGMAS = ('journal_mode', 'mmap_size')
+
+# Engines whose pools a forked child must not share with its parent.
+_engines = weakref.WeakSet()
+
+
+def _dispose_after_fork():
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_dispose_after_fork)
+
+
+def engine_options(url, config):
+    """``create_engine`` options for ``url``, from the ``DB_POOL_*`` settings."""
+    if make_url(url).get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+
+
+def _set_sqlite_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
+
+def init_database(app):
+    """Initialise ``db`` for ``app`` with the engine settings for its database.
+
+    Options set in ``SQLALCHEMY_ENGINE_OPTIONS`` take precedence.
+    """
+    from .extensions import db
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        **engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config),
+        **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}),
+    }
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    replicas = []
+    for n, url in enumerate(app.config.get('SQLALCHEMY_REPLICA_URIS', ())):
+        replicas.append(f'replica{n}')
+        binds[replicas[-1]] = {'url': url, **engine_options(url, app.config)}
+    app.extensions['db_replicas'] = replicas
+    db.init_app(app)
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect',
+                         partial(_set_sqlite_pragmas, app.config['SQLITE_PRAGMAS']))
+        _engines.add(engine)
+
+
+# ==================== Read replicas ====================
+
+# Flask session key: reads go to the primary until this time after a write.
+PRIMARY_UNTIL_KEY = '_db_primary_until'
+
+_SELECT_TEXT = re.compile(r'\s*SELECT\b', re.IGNORECASE)
+# Replicas are handed out in turn, one per request.
+_replica_turn = itertools.count()
+
+
+def _is_read(clause):
+    if isinstance(clause, TextClause):
+        return bool(_SELECT_TEXT.match(clause.text))
+    return (clause is not None and clause.is_select
+            and getattr(clause, '_for_update_arg', None) is None)
+
+
+class RoutingSession(Session):
+    """Sends the SELECTs of GET requests to a read replica, if any are configured.
+
+    Once the session flushes or runs any other statement, the rest of the
+    request reads from the primary. So do the same browser's requests for
+    the next ``REPLICA_PIN_SECONDS``: the page a form redirects to then
+    shows the change even while the replicas lag behind.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or (clause is not None and not _is_read(clause)):
+                self._pin_primary()
+            elif clause is not None and self._may_use_replica():
+                return self._replica()
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _may_use_replica(self):
+        if not current_app.extensions.get('db_replicas'):
+            return False
+        if self.info.get('pinned') or self.info.get('primary_reads'):
+            return False
+        if not has_request_context() or request.method not in ('GET', 'HEAD'):
+            return False
+        return flask_session.get(PRIMARY_UNTIL_KEY, 0) <= time.time()
+
+    def _replica(self):
+        key = self.info.get('replica')
+        if key is None:
+            replicas = current_app.extensions['db_replicas']
+            key = self.info['replica'] = replicas[next(_replica_turn) % len(replicas)]
+        return self._db.engines[key]
+
+    def _pin_primary(self):
+        if self.info.get('pinned'):
+            return
+        self.info['pinned'] = True
+        seconds = current_app.config.get('REPLICA_PIN_SECONDS', 0)
+        if seconds and has_request_context() and current_app.extensions.get('db_replicas'):
+            flask_session[PRIMARY_UNTIL_KEY] = time.time() + seconds
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block, e.g. to fill a shared cache."""
+    from .extensions import db
+    info = db.session.info
+    info['primary_reads'] = info.get('primary_reads', 0) + 1
+    try:
+        yield
+    finally:
+        info['primary_reads'] -= 1
+
+
+# ==================== Self-check ====================
+
+def _pool_settings(pool):
+    if not isinstance(pool, QueuePool):
+        return {'pool': type(pool).__name__}
+    return {
+        'pool': type(pool).__name__,
+        'pool_size': pool.size(),
+        'max_overflow': pool._max_overflow,
+        'pool_timeout': pool.timeout(),
+        'pool_recycle': pool._recycle,
+        'pool_pre_ping': pool._pre_ping,
+    }
+
+
+def _sqlite_settings(conn, pragmas):
+    settings, problems = {}, []
+    in_memory = conn.engine.url.database in (None, '', ':memory:')
+    for name, wanted in pragmas.items():
+        value = conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+        if name == 'synchronous':
+            value = SQLITE_SYNCHRONOUS.get(value, value)
+        settings[name] = value
+        if in_memory and name in SQLITE_FILE_PRAGMAS:
+            continue
+        if str(value).upper() != str(wanted).upper():
+            problems.append(f'{name} is {value}, configured {wanted}')
+    return settings, problems
+
+
+def _postgresql_settings(conn, pool_settings):
+    settings = {
+        'server_version': conn.exec_driver_sql('SHOW server_version').scalar(),
+        'max_connections': int(conn.exec_driver_sql('SHOW max_connections').scalar()),
+    }
+    problems = []
+    # gunicorn starts WEB_CONCURRENCY workers, each with its own pool.
+    workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+    per_worker = pool_settings.get('pool_size', 0) + pool_settings.get('max_overflow', 0)
+    if per_worker * workers > settings['max_connections']:
+        problems.append(f'{workers} worker(s) x {per_worker} connections exceeds '
+                        f'max_connections={settings["max_connections"]}')
+    return settings, problems
+
+
+def check_database(app, binds=None):
+    """Return ``{bind: (settings, problems)}`` as seen by a live connection of each engine.
+
+    ``binds`` limits the check to those bind keys (None is the primary).
+    Raises ``DBAPIError`` if an engine cannot connect.
+    """
+    from .extensions import db
+    report = {}
+    with app.app_context():
+        engines = dict(db.engines)
+    for bind, engine in engines.items():
+        if binds is not None and bind not in binds:
+            continue
+        settings = {'url': engine.url.render_as_string(hide_password=True)}
+        settings.update(_pool_settings(engine.pool))
+        with engine.connect() as conn:
+            if engine.dialect.name == 'sqlite':
+                extra, problems = _sqlite_settings(conn, app.config['SQLITE_PRAGMAS'])
+            elif engine.dialect.name == 'postgresql':
+                extra, problems = _postgresql_settings(conn, settings)
+            else:
+                extra, problems = {}, []
+        settings.update(extra)
+        report[bind] = settings, problems
+    return report
+
+
+def log_database_settings(app):
+    """Log the effective settings of every engine; mismatches as warnings.
+
+    A read replica that cannot be reached is logged and dropped from read
+    routing, so a replica outage does not stop workers from starting.
+    """
+    replicas = app.extensions['db_replicas']
+    report = check_database(app, [None])
+    for bind in list(replicas):
+        try:
+            report.update(check_database(app, [bind]))
+        except DBAPIError as e:
+            app.logger.warning('Database %s is unreachable, reading from the primary instead: %s',
+                               bind, e.orig)
+            replicas.remove(bind)
+    for bind, (settings, problems) in report.items():
+        name = bind or 'default'
+        app.logger.info('Database %s: %s', name,
+                        ', '.join(f'{key}={value}' for key, value in settings.items()))
+        for problem in problems:
+            app.logger.warning('Database %s: %s', name, problem)
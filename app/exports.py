@@ -0,0 +1,89 @@
+"""Streaming CSV and XLSX downloads of admin lists.
+
+Rows come from queries run with ``yield_per``, so only one batch of rows
+is held at a time whatever the size of the export. CSV is written to the
+response as it is produced. An XLSX file is a zip archive whose directory
+comes last, so it is built with openpyxl's write-only mode in a temporary
+file (rows go straight to disk) and streamed from there once complete;
+rows past the sheet size limit continue on further sheets.
+"""
+import csv
+import io
+import tempfile
+from datetime import datetime
+
+from flask import Response, stream_with_context
+
+YIELD_PER = 2000
+CSV_FLUSH_ROWS = 500
+STREAM_CHUNK_SIZE = 64 * 1024
+# Rows per XLSX worksheet, header included (the format's limit)
+XLSX_MAX_ROWS = 1048576
+# Text starting with these is read as a formula (or DDE) by spreadsheet apps
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+class ExportError(ValueError):
+    """The export cannot be produced in the requested format."""
+
+
+def _safe_cell(value):
+    # Keep spreadsheet apps from evaluating exported text as a formula.
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_chunks(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for i, row in enumerate(rows, 1):
+        writer.writerow([_safe_cell(value) for value in row])
+        if i % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def xlsx_chunks(workbook_class, header, rows, title):
+    workbook = workbook_class(write_only=True)
+    sheet = None
+    for i, row in enumerate(rows):
+        if i % (XLSX_MAX_ROWS - 1) == 0:
+            number = i // (XLSX_MAX_ROWS - 1) + 1
+            sheet = workbook.create_sheet(title if number == 1 else f'{title} {number}')
+            sheet.append(header)
+        sheet.append([_safe_cell(value) for value in row])
+    if sheet is None:
+        workbook.create_sheet(title).append(header)
+    with tempfile.TemporaryFile() as f:
+        workbook.save(f)
+        f.seek(0)
+        while True:
+            chunk = f.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def export_response(name, header, rows, fmt):
+    """A download of ``rows`` (an iterable of sequences) as CSV or XLSX."""
+    if fmt == 'xlsx':
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            raise ExportError('XLSX export needs the openpyxl package; download a CSV instead.')
+        chunks = xlsx_chunks(Workbook, header, rows, name.title())
+    else:
+        fmt = 'csv'
+        chunks = csv_chunks(header, rows)
+    filename = f'{name}-{datetime.now():%Y%m%d-%H%M%S}.{fmt}'
+    return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
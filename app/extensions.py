@@ -1,15 +1,28 @@
+import time
+from collections import Counter
+
+from blinker import Namespace
+from flask import current_app, g, has_app_context, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 csrf = CSRFProtect()
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 login_manager.login_message_category = 'info'
 
+_signals = Namespace()
+# Sent after each recorded request with ``endpoint`` and ``stats`` keyword arguments.
+queries_recorded = _signals.signal('queries-recorded')
+
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -20,3 +33,87 @@ def load_user(user_id):
     elif kind == 'student':
         return db.session.get(Student, int(uid))
     return None
+
+
+class QueryStats:
+    """SQL statements issued while handling one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    @property
+    def duplicates(self):
+        """Number of statements that repeat an earlier identical one (N+1 signature)."""
+        return sum(n - 1 for n in self.statements.values() if n > 1)
+
+    def repeated(self):
+        return [(sql, n) for sql, n in self.statements.most_common() if n > 1]
+
+
+def _current_stats():
+    if has_app_context():
+        return g.get('sql_stats')
+    return None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats() is not None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats()
+    if stats is None or not conn.info.get('query_start'):
+        return
+    stats.duration += time.perf_counter() - conn.info['query_start'].pop()
+    stats.count += 1
+    stats.statements[statement] += 1
+
+
+class QueryRecorder:
+    """Count statements, DB time and repeats per request.
+
+    Enabled when ``SQL_RECORD_QUERIES`` is set or the app runs in debug or
+    testing mode. In debug mode the numbers are returned as ``X-SQL-*``
+    response headers; requests over their ``SQL_QUERY_BUDGETS`` entry are
+    logged as warnings.
+    """
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_RECORD_QUERIES', False)
+        app.config.setdefault('SQL_QUERY_BUDGETS', {})
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    @staticmethod
+    def _enabled(app):
+        return app.config['SQL_RECORD_QUERIES'] or app.debug or app.testing
+
+    def _start(self):
+        if self._enabled(current_app):
+            g.sql_stats = QueryStats()
+
+    def _finish(self, response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+        endpoint = request.endpoint
+        budget = current_app.config['SQL_QUERY_BUDGETS'].get(endpoint)
+        if budget is not None and stats.count > budget:
+            current_app.logger.warning(
+                '%s issued %d SQL statements (budget %d, %d repeated)',
+                endpoint, stats.count, budget, stats.duplicates)
+        if current_app.debug:
+            response.headers['X-SQL-Queries'] = str(stats.count)
+            response.headers['X-SQL-Time'] = f'{stats.duration * 1000:.2f}ms'
+            response.headers['X-SQL-Duplicates'] = str(stats.duplicates)
+        queries_recorded.send(current_app._get_current_object(),
+                              endpoint=endpoint, stats=stats)
+        return response
+
+
+query_recorder = QueryRecorder()
@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from flask_wtf.file import FileField, FileAllowed
+from flask_wtf.file import FileField, FileAllowed, FileRequired, MultipleFileField
 from wtforms import (
     StringField, PasswordField, TextAreaField, SelectField,
     IntegerField, FloatField, BooleanField, DateField, SubmitField
@@ -31,6 +31,13 @@ class StudentForm(FlaskForm):
     submit = SubmitField('Save Student')
 
 
+class StudentImportForm(FlaskForm):
+    file = FileField('Admission Sheet', validators=[
+        FileRequired(), FileAllowed(['csv', 'xlsx'], 'CSV or XLSX files only!')
+    ])
+    submit = SubmitField('Import Students')
+
+
 # ---------- Admin: Batch ----------
 class BatchForm(FlaskForm):
     name = StringField('Batch Name', validators=[DataRequired(), Length(max=100)])
@@ -58,6 +65,17 @@ class ResultForm(FlaskForm):
     submit = SubmitField('Save Result')
 
 
+class ResultImportForm(FlaskForm):
+    subject_id = SelectField('Subject', coerce=int, validators=[DataRequired()])
+    exam_name = StringField('Exam Name', validators=[DataRequired(), Length(max=100)])
+    exam_date = DateField('Exam Date', validators=[DataRequired()], format='%Y-%m-%d')
+    total_marks = FloatField('Total Marks', validators=[Optional(), NumberRange(min=1)])
+    file = FileField('Marks Sheet', validators=[
+        FileRequired(), FileAllowed(['csv', 'xlsx'], 'CSV or XLSX files only!')
+    ])
+    submit = SubmitField('Import Results')
+
+
 # ---------- Admin: Announcement ----------
 class AnnouncementForm(FlaskForm):
     title = StringField('Title', validators=[DataRequired(), Length(max=200)])
@@ -91,7 +109,7 @@ class FacultyForm(FlaskForm):
 
 # ---------- Admin: Gallery ----------
 class GalleryUploadForm(FlaskForm):
-    images = FileField('Upload Images', validators=[
+    images = MultipleFileField('Upload Images', validators=[
         FileAllowed(['jpg', 'jpeg', 'png', 'gif', 'webp'], 'Images only!')
     ])
     caption = StringField('Caption', validators=[Optional(), Length(max=200)])
@@ -0,0 +1,248 @@
+"""Background processing of uploaded images.
+
+Upload requests only store the original file (outside ``static``) and
+enqueue a job; a per-worker thread pool then decodes it once and writes
+the display image, the thumbnail and the responsive sizes. Pillow releases
+the GIL while resizing and encoding, so jobs run in parallel across cores.
+
+Originals are stored under their content digest, so uploading an image
+that is already stored costs no disk space and no processing, unless its
+earlier processing failed, in which case it is tried again. Until a job
+finishes, gallery rows have no ``thumbnail`` and templates show a
+placeholder; a failed job marks its rows ``processing_failed`` instead.
+Originals of failed jobs stay in place and are picked up again by ``flask
+process-images``.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from PIL import Image
+
+from .utils import register_file_remover, store_upload
+
+# Upload kind -> (config key of the output folder, display size, filename suffix)
+# Kinds sharing a folder need distinct suffixes, as the same picture is
+# rendered at a different size for each.
+IMAGE_KINDS = {
+    'gallery': ('GALLERY_FOLDER', (800, 800), ''),
+    'faculty': ('AVATARS_FOLDER', (800, 800), ''),
+    'avatar': ('AVATARS_FOLDER', (300, 300), '_300'),
+}
+THUMBNAIL_SIZE = (300, 300)
+
+
+def variant_name(filename, width):
+    """Name of the responsive copy of a gallery image ``width`` pixels wide."""
+    return f'w{width}_{filename}'
+
+
+def _originals_folder(kind):
+    return os.path.join(current_app.config['ORIGINALS_FOLDER'], kind)
+
+
+def is_readable_image(file):
+    """Check that an upload parses as an image without decoding its pixels."""
+    try:
+        with Image.open(file.stream) as img:
+            img.verify()
+        return True
+    except Exception:
+        return False
+    finally:
+        file.stream.seek(0)
+
+
+def save_original(file, kind):
+    """Store an upload untouched for later processing.
+
+    Returns ``(filename, is_new)``; only new content needs to be submitted
+    to the pipeline, as identical uploads share the already stored files.
+    """
+    filename, _, is_new = store_upload(file, kind, _originals_folder(kind),
+                                       suffix=IMAGE_KINDS[kind][2])
+    return filename, is_new
+
+
+def is_processed(kind, filename):
+    """Whether the display copy of a stored image has been written."""
+    return os.path.exists(os.path.join(current_app.config[IMAGE_KINDS[kind][0]], filename))
+
+
+def _write_variant(img, path, size, quality):
+    copy = img.copy()
+    copy.thumbnail(size, Image.LANCZOS)
+    copy.save(path, quality=quality, optimize=True)
+
+
+def _write_widths(img, filename):
+    """Write the responsive sizes of a gallery image; returns their widths.
+
+    Only widths up to the image's own are rendered, each exactly that wide,
+    so ``srcset`` never advertises a size the file does not have.
+    """
+    config = current_app.config
+    widths = [w for w in sorted(config['GALLERY_IMAGE_WIDTHS']) if w <= img.width]
+    for width in widths:
+        _write_variant(img, os.path.join(config['GALLERY_FOLDER'], variant_name(filename, width)),
+                       (width, img.height), 85)
+    return widths
+
+
+def process_image(kind, filename):
+    """Render every variant of one stored original, then discard the original."""
+    from .extensions import db
+    from .models import GalleryImage, StoredFile
+
+    config = current_app.config
+    folder_key, display_size, _ = IMAGE_KINDS[kind]
+    source = os.path.join(_originals_folder(kind), filename)
+    if not os.path.exists(source):
+        # Released, or handled by another job, while queued.
+        return
+
+    try:
+        with Image.open(source) as img:
+            img.load()
+            if img.mode in ('RGBA', 'P'):
+                img = img.convert('RGB')
+            _write_variant(img, os.path.join(config[folder_key], filename), display_size, 85)
+            if kind == 'gallery':
+                thumb = f'thumb_{filename}'
+                _write_variant(img, os.path.join(config['THUMBNAILS_FOLDER'], thumb),
+                               THUMBNAIL_SIZE, 80)
+                widths = _write_widths(img, filename)
+    except Exception:
+        if kind == 'gallery':
+            db.session.rollback()
+            GalleryImage.query.filter_by(filename=filename, thumbnail=None).update(
+                {'processing_failed': True})
+            db.session.commit()
+        raise
+
+    if kind == 'gallery':
+        GalleryImage.query.filter_by(filename=filename, thumbnail=None).update(
+            {'thumbnail': thumb, 'widths': widths, 'processing_failed': False})
+        db.session.commit()
+    os.remove(source)
+    if not StoredFile.query.filter_by(kind=kind, filename=filename).count():
+        # Every reference was released while the job was running.
+        _remove_image_files(kind, filename)
+
+
+def remove_gallery_files(filename, thumbnail=None):
+    """Delete a gallery image's display copy, variants, thumbnail and any pending original."""
+    config = current_app.config
+    paths = [os.path.join(config['GALLERY_FOLDER'], filename),
+             os.path.join(_originals_folder('gallery'), filename)]
+    paths += [os.path.join(config['GALLERY_FOLDER'], variant_name(filename, w))
+              for w in config['GALLERY_IMAGE_WIDTHS']]
+    if thumbnail:
+        paths.append(os.path.join(config['THUMBNAILS_FOLDER'], thumbnail))
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _remove_image_files(kind, filename):
+    if kind == 'gallery':
+        return remove_gallery_files(filename, f'thumb_{filename}')
+    for path in (os.path.join(current_app.config[IMAGE_KINDS[kind][0]], filename),
+                 os.path.join(_originals_folder(kind), filename)):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+for _kind in IMAGE_KINDS:
+    register_file_remover(_kind, lambda filename, kind=_kind: _remove_image_files(kind, filename))
+
+
+def backfill_variants(image):
+    """Record the responsive sizes of a processed gallery image, creating missing ones.
+
+    Sizes already on disk are kept if they are as wide as their name says.
+    Rows uploaded before responsive sizes existed only have the 800px
+    display copy, so only sizes up to its width can be created. Returns
+    the number of sizes created.
+    """
+    folder = current_app.config['GALLERY_FOLDER']
+    display = os.path.join(folder, image.filename)
+    if not os.path.exists(display):
+        return 0
+    widths, created = [], 0
+    with Image.open(display) as img:
+        for width in sorted(current_app.config['GALLERY_IMAGE_WIDTHS']):
+            path = os.path.join(folder, variant_name(image.filename, width))
+            if os.path.exists(path):
+                with Image.open(path) as variant:
+                    if variant.width == width:
+                        widths.append(width)
+                        continue
+            if width <= img.width:
+                img.load()
+                _write_variant(img, path, (width, img.height), 85)
+                widths.append(width)
+                created += 1
+    image.widths = widths
+    return created
+
+
+def pending_images():
+    """Yield ``(kind, filename)`` for every original still waiting to be processed."""
+    for kind in IMAGE_KINDS:
+        folder = _originals_folder(kind)
+        if os.path.isdir(folder):
+            for filename in sorted(os.listdir(folder)):
+                if not filename.startswith('.'):
+                    yield kind, filename
+
+
+class ImagePipeline:
+    """Runs image jobs on a thread pool owned by the current worker process.
+
+    ``IMAGE_WORKERS`` sets the pool size; ``0`` processes images inline,
+    which keeps tests deterministic.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('IMAGE_WORKERS', os.cpu_count() or 1)
+        app.config.setdefault('GALLERY_IMAGE_WIDTHS', (480, 1600))
+        app.extensions['image_pipeline'] = self
+
+    def _get_executor(self, workers):
+        # Created lazily so each forked gunicorn worker gets its own threads.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=workers,
+                                                    thread_name_prefix='images')
+                self._pid = os.getpid()
+            return self._executor
+
+    @staticmethod
+    def _run(app, kind, filename):
+        with app.app_context():
+            try:
+                process_image(kind, filename)
+            except Exception:
+                app.logger.exception('Processing %s image %s failed', kind, filename)
+
+    def submit(self, kind, filename):
+        """Queue processing of a stored original; call after committing its row."""
+        app = current_app._get_current_object()
+        workers = app.config['IMAGE_WORKERS']
+        if not workers:
+            return self._run(app, kind, filename)
+        return self._get_executor(workers).submit(self._run, app, kind, filename)
+
+
+image_pipeline = ImagePipeline()
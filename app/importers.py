@@ -0,0 +1,360 @@
+"""Spreadsheet imports for bulk admin data entry.
+
+Uploads are CSV or XLSX with a header row. Every row is validated in one
+pass, lookups against existing rows are batched into IN queries, and all
+valid rows are written in a single transaction. Invalid rows are returned
+as ``(row_number, identifier, message)`` tuples for the import report.
+"""
+import csv
+import io
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+from werkzeug.security import generate_password_hash
+
+from .extensions import db
+from .models import Student, Result
+from .search import index_rows
+from .utils import calculate_grades, generate_random_password, reserve_student_ids
+
+# SQLite caps the number of bound parameters per statement.
+IN_CHUNK_SIZE = 900
+INSERT_CHUNK_SIZE = 1000
+STUDENT_BATCH_SIZE = 500
+GRADES = (9, 10, 11, 12)
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+class SheetError(ValueError):
+    """The uploaded file cannot be read as a sheet."""
+
+
+def read_sheet(file):
+    """Return ``(header, rows)`` from a CSV or XLSX upload.
+
+    Header names are lower-cased with spaces turned into underscores; rows
+    are lists of cell values with blank trailing rows skipped.
+    """
+    filename = (file.filename or '').lower()
+    if filename.endswith('.xlsx'):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise SheetError('XLSX import needs the openpyxl package; upload a CSV instead.')
+        try:
+            workbook = load_workbook(file.stream, read_only=True, data_only=True)
+        except Exception:
+            raise SheetError('Could not read the XLSX file.')
+        rows = list(workbook.active.iter_rows(values_only=True))
+    elif filename.endswith('.csv'):
+        try:
+            rows = list(csv.reader(io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')))
+        except (UnicodeDecodeError, csv.Error):
+            raise SheetError('Could not read the CSV file; save it as UTF-8.')
+    else:
+        raise SheetError('Upload a .csv or .xlsx file.')
+
+    if not rows:
+        raise SheetError('The file is empty.')
+    header = [str(h or '').strip().lower().replace(' ', '_') for h in rows[0]]
+    body = [list(r) for r in rows[1:] if any(str(c or '').strip() for c in r)]
+    return header, body
+
+
+def _column(header, *names, required=True):
+    for name in names:
+        if name in header:
+            return header.index(name)
+    if required:
+        raise SheetError(f'Missing column "{names[0]}".')
+    return None
+
+
+def _cell(row, index):
+    if index is None or index >= len(row) or row[index] is None:
+        return ''
+    return str(row[index]).strip()
+
+
+def _chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def import_results(file, subject_id, exam_name, exam_date, default_total=None):
+    """Validate a marks sheet for one exam and bulk insert the valid rows.
+
+    Columns: ``student_id`` and ``marks`` (or ``marks_obtained``), plus
+    optional ``total_marks`` and ``remarks``. Returns ``(inserted, errors)``.
+    """
+    header, rows = read_sheet(file)
+    col_student = _column(header, 'student_id', 'student')
+    col_marks = _column(header, 'marks', 'marks_obtained')
+    col_total = _column(header, 'total_marks', 'total', required=False)
+    col_remarks = _column(header, 'remarks', required=False)
+
+    errors = []
+    parsed = []
+    seen = set()
+    for number, row in enumerate(rows, start=2):
+        code = _cell(row, col_student).upper()
+        if not code:
+            errors.append((number, '', 'Student ID is missing.'))
+            continue
+        if code in seen:
+            errors.append((number, code, 'Student appears more than once in the sheet.'))
+            continue
+        seen.add(code)
+        try:
+            marks = float(_cell(row, col_marks))
+            total = float(_cell(row, col_total) or default_total or '')
+        except ValueError:
+            errors.append((number, code, 'Marks and total marks must be numbers.'))
+            continue
+        if total <= 0:
+            errors.append((number, code, 'Total marks must be greater than zero.'))
+        elif not 0 <= marks <= total:
+            errors.append((number, code, f'Marks must be between 0 and {total:g}.'))
+        else:
+            parsed.append((number, code, marks, total, _cell(row, col_remarks) or None))
+
+    student_ids = {}
+    for chunk in _chunks({p[1] for p in parsed}, IN_CHUNK_SIZE):
+        student_ids.update(db.session.query(Student.student_id, Student.id).filter(
+            Student.student_id.in_(chunk), Student.is_active == True
+        ).all())
+
+    already_recorded = set()
+    for chunk in _chunks(student_ids.values(), IN_CHUNK_SIZE):
+        already_recorded.update(sid for sid, in db.session.query(Result.student_id).filter(
+            Result.student_id.in_(chunk),
+            Result.subject_id == subject_id,
+            Result.exam_name == exam_name,
+            Result.exam_date == exam_date
+        ))
+
+    valid = []
+    for number, code, marks, total, remarks in parsed:
+        pk = student_ids.get(code)
+        if pk is None:
+            errors.append((number, code, 'No active student with this ID.'))
+        elif pk in already_recorded:
+            errors.append((number, code, 'A result for this exam is already recorded.'))
+        else:
+            valid.append((pk, marks, total, remarks))
+
+    grades = calculate_grades([marks / total * 100 for _, marks, total, _ in valid])
+    new_rows = [
+        {'student_id': pk, 'subject_id': subject_id, 'exam_name': exam_name,
+         'exam_date': exam_date, 'marks_obtained': marks, 'total_marks': total,
+         'grade_letter': grade, 'remarks': remarks}
+        for (pk, marks, total, remarks), grade in zip(valid, grades)
+    ]
+    for chunk in _chunks(new_rows, INSERT_CHUNK_SIZE):
+        db.session.execute(Result.__table__.insert(), chunk)
+    db.session.commit()
+
+    errors.sort()
+    return len(new_rows), errors
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    for fmt in ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(value)
+
+
+def read_student_sheet(file):
+    """Validate an admission sheet; return ``(students, errors)``.
+
+    Columns: ``full_name``, ``email`` and ``grade``, plus optional ``phone``,
+    ``parent_name``, ``parent_phone``, ``address`` and ``date_of_birth``.
+    ``students`` is a list of ``(row_number, fields)`` ready to insert.
+    Duplicates against existing students are checked later, per batch.
+    """
+    header, rows = read_sheet(file)
+    cols = {
+        'full_name': _column(header, 'full_name', 'name'),
+        'email': _column(header, 'email'),
+        'grade': _column(header, 'grade'),
+        'phone': _column(header, 'phone', required=False),
+        'parent_name': _column(header, 'parent_name', required=False),
+        'parent_phone': _column(header, 'parent_phone', required=False),
+        'address': _column(header, 'address', required=False),
+        'date_of_birth': _column(header, 'date_of_birth', 'dob', required=False),
+    }
+
+    students, errors = [], []
+    seen_emails, seen_phones = set(), set()
+    for number, row in enumerate(rows, start=2):
+        fields = {key: _cell(row, index) or None for key, index in cols.items()}
+        email = fields['email'] or ''
+        problem = None
+        if not fields['full_name']:
+            problem = 'Full name is missing.'
+        elif not EMAIL_RE.match(email):
+            problem = 'Email address is not valid.'
+        elif email.lower() in seen_emails:
+            problem = 'Email appears more than once in the sheet.'
+        elif fields['phone'] and fields['phone'] in seen_phones:
+            problem = 'Phone appears more than once in the sheet.'
+        elif any(len(fields[k] or '') > 15 for k in ('phone', 'parent_phone')):
+            problem = 'Phone numbers can be at most 15 characters.'
+        else:
+            try:
+                fields['grade'] = int(float(fields['grade'] or ''))
+            except ValueError:
+                fields['grade'] = None
+            if fields['grade'] not in GRADES:
+                problem = 'Grade must be 9, 10, 11 or 12.'
+            elif fields['date_of_birth']:
+                raw = row[cols['date_of_birth']]
+                if isinstance(raw, str):
+                    raw = raw.strip()
+                try:
+                    fields['date_of_birth'] = _parse_date(raw)
+                except ValueError:
+                    problem = 'Date of birth must look like YYYY-MM-DD.'
+        if problem:
+            errors.append((number, fields['email'] or '', problem))
+            continue
+        seen_emails.add(email.lower())
+        if fields['phone']:
+            seen_phones.add(fields['phone'])
+        students.append((number, fields))
+    return students, errors
+
+
+CREDENTIAL_COLUMNS = ['row', 'student_id', 'full_name', 'email', 'password', 'status']
+
+_hash_pool = None
+_hash_pool_pid = None
+_hash_pool_lock = threading.Lock()
+
+
+def _get_hash_pool(workers):
+    # One pool per worker process, created on first use; hashlib's scrypt
+    # and pbkdf2 release the GIL, so threads hash in parallel.
+    global _hash_pool, _hash_pool_pid
+    with _hash_pool_lock:
+        if _hash_pool is None or _hash_pool_pid != os.getpid():
+            _hash_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='passwords')
+            _hash_pool_pid = os.getpid()
+        return _hash_pool
+
+
+class CredentialSheet:
+    """The credentials CSV of one student import, stored on disk.
+
+    ``write`` flushes and fsyncs, so rows written before a batch commits
+    survive the request that created them.
+    """
+
+    def __init__(self, path):
+        # Holds passwords: readable by the app user only.
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        self.path = path
+        self.file = io.open(fd, 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=CREDENTIAL_COLUMNS)
+        self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def purge_credential_sheets(folder, max_age):
+    """Delete credentials sheets older than ``max_age`` (a timedelta); return how many."""
+    cutoff = (datetime.now() - max_age).timestamp()
+    purged = 0
+    for entry in os.scandir(folder):
+        if entry.is_file() and entry.name.endswith('.csv') and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+                purged += 1
+            except FileNotFoundError:
+                pass
+    return purged
+
+
+def onboard_students(students, sheet, workers=None, batch_size=STUDENT_BATCH_SIZE):
+    """Create students in batches, recording every row in ``sheet``.
+
+    Each batch checks its emails and phones against existing students with
+    one IN query apiece, reserves a block of student IDs and hashes the
+    generated passwords on the worker's thread pool. Its credentials are
+    written to the sheet before the batch commits, so no student exists
+    whose password was not stored. If a commit fails the batch is rolled
+    back, its rows are recorded as not created and the error is re-raised.
+    Returns the number of students created.
+    """
+    pool = _get_hash_pool(workers or os.cpu_count() or 1)
+    created = 0
+    for batch in _chunks(students, batch_size):
+        emails = [f['email'].lower() for _, f in batch]
+        phones = [f['phone'] for _, f in batch if f['phone']]
+        # Emails are matched case-insensitively, as within the sheet.
+        taken_emails = {e.lower() for e, in db.session.query(Student.email).filter(
+            db.func.lower(Student.email).in_(emails))}
+        taken_phones = {p for p, in db.session.query(Student.phone).filter(
+            Student.phone.in_(phones))} if phones else set()
+
+        accepted = []
+        skipped = []
+        for number, fields in batch:
+            if fields['email'].lower() in taken_emails:
+                status = 'Skipped: email already belongs to a student.'
+            elif fields['phone'] and fields['phone'] in taken_phones:
+                status = 'Skipped: phone already belongs to a student.'
+            else:
+                accepted.append((number, fields))
+                continue
+            skipped.append({'row': number, 'student_id': '', 'full_name': fields['full_name'],
+                            'email': fields['email'], 'password': '', 'status': status})
+        sheet.write(skipped)
+        if not accepted:
+            continue
+
+        passwords = [generate_random_password() for _ in accepted]
+        hashes = list(pool.map(generate_password_hash, passwords))
+        try:
+            student_ids = reserve_student_ids(len(accepted))
+            db.session.execute(Student.__table__.insert(), [
+                dict(fields, student_id=sid, password_hash=pw_hash)
+                for (_, fields), sid, pw_hash in zip(accepted, student_ids, hashes)
+            ])
+            index_rows('student', Student.query.filter(Student.student_id.in_(student_ids)))
+            sheet.write({'row': number, 'student_id': sid, 'full_name': fields['full_name'],
+                         'email': fields['email'], 'password': password, 'status': 'Created'}
+                        for (number, fields), sid, password in zip(accepted, student_ids, passwords))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            sheet.write({'row': number, 'student_id': '', 'full_name': fields['full_name'],
+                         'email': fields['email'], 'password': '',
+                         'status': 'Not created: saving this batch failed.'}
+                        for number, fields in accepted)
+            raise
+        created += len(accepted)
+    return created
@@ -1,7 +1,19 @@
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from flask_login import UserMixin
 from .extensions import db
 
+# Day zero for the exam dates stored in StudentProgress
+PROGRESS_EPOCH = date(2000, 1, 1)
+
+
+def partial_index(name, *columns, where):
+    """An index over the rows matching ``where`` only, where the database supports it.
+
+    ``where`` must be written the way the queries filter (``is_active == True``),
+    or the planner cannot tell that the index covers them.
+    """
+    return db.Index(name, *columns, sqlite_where=where, postgresql_where=where)
+
 
 class AdminUser(db.Model, UserMixin):
     __tablename__ = 'admin_users'
@@ -29,9 +41,10 @@ class Student(db.Model, UserMixin):
     student_id = db.Column(db.String(20), unique=True, nullable=False)
     full_name = db.Column(db.String(120), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    phone = db.Column(db.String(15))
+    phone = db.Column(db.String(15), index=True)
     password_hash = db.Column(db.String(256), nullable=False)
-    grade = db.Column(db.Integer, nullable=False)
+    # active_history: app.analytics needs the old grade even when it was expired
+    grade = db.column_property(db.Column(db.Integer, nullable=False), active_history=True)
     avatar = db.Column(db.String(256), default='default-avatar.png')
     parent_name = db.Column(db.String(120))
     parent_phone = db.Column(db.String(15))
@@ -40,6 +53,16 @@ class Student(db.Model, UserMixin):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Case-insensitive duplicate checks of student imports
+        db.Index('ix_students_email_lower', db.func.lower(email)),
+        # Admin student list (keyset on created_at, id), with and without a grade filter
+        partial_index('ix_students_active_grade_created', 'grade', 'created_at', 'id',
+                      where=is_active == True),
+        partial_index('ix_students_active_created', 'created_at', 'id',
+                      where=is_active == True),
+    )
+
     batch_enrollments = db.relationship('BatchEnrollment', back_populates='student', lazy='dynamic')
     results = db.relationship('Result', back_populates='student', lazy='dynamic')
 
@@ -51,6 +74,14 @@ class Student(db.Model, UserMixin):
         return f'student:{self.id}'
 
 
+class StudentIdSequence(db.Model):
+    """Last issued number of the yearly ``MPC-YYYY-NNN`` student ID series."""
+    __tablename__ = 'student_id_sequences'
+
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+
+
 class Subject(db.Model):
     __tablename__ = 'subjects'
 
@@ -100,6 +131,13 @@ class Batch(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        partial_index('ix_batches_active_subject', 'subject_id', where=is_active == True),
+        # Admin batch list (newest first) and batch pickers (by name)
+        partial_index('ix_batches_active_created', 'created_at', where=is_active == True),
+        partial_index('ix_batches_active_name', 'name', where=is_active == True),
+    )
+
     subject = db.relationship('Subject', back_populates='batches')
     faculty = db.relationship('Faculty', back_populates='batches')
     enrollments = db.relationship('BatchEnrollment', back_populates='batch', lazy='dynamic')
@@ -113,7 +151,12 @@ class BatchEnrollment(db.Model):
     batch_id = db.Column(db.Integer, db.ForeignKey('batches.id'), nullable=False)
     enrolled_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    __table_args__ = (db.UniqueConstraint('student_id', 'batch_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'batch_id'),
+        db.Index('ix_batch_enrollments_batch', 'batch_id'),
+        # A student's batches in the order they joined, on the dashboard
+        db.Index('ix_batch_enrollments_student_enrolled', 'student_id', 'enrolled_at'),
+    )
 
     student = db.relationship('Student', back_populates='batch_enrollments')
     batch = db.relationship('Batch', back_populates='enrollments')
@@ -123,24 +166,40 @@ class Result(db.Model):
     __tablename__ = 'results'
 
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
-    subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
-    exam_name = db.Column(db.String(100), nullable=False)
-    exam_date = db.Column(db.Date, nullable=False)
-    marks_obtained = db.Column(db.Float, nullable=False)
-    total_marks = db.Column(db.Float, nullable=False)
+    # active_history on the columns app.analytics aggregates, so assigning one
+    # that was expired (e.g. by a commit) still records the value it replaces
+    student_id = db.column_property(
+        db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False), active_history=True)
+    subject_id = db.column_property(
+        db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False), active_history=True)
+    exam_name = db.column_property(db.Column(db.String(100), nullable=False), active_history=True)
+    exam_date = db.column_property(db.Column(db.Date, nullable=False), active_history=True)
+    marks_obtained = db.column_property(db.Column(db.Float, nullable=False), active_history=True)
+    total_marks = db.column_property(db.Column(db.Float, nullable=False), active_history=True)
     grade_letter = db.Column(db.String(2))
     remarks = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # A student's results: keyset pages and the latest exams on the dashboard
+        db.Index('ix_results_student_exam_date', 'student_id', 'exam_date', 'id'),
+        # Admin results list, and its pages by exam date when filtered by date range
+        db.Index('ix_results_created', 'created_at', 'id'),
+        db.Index('ix_results_exam_date', 'exam_date', 'id'),
+    )
+
     student = db.relationship('Student', back_populates='results')
     subject = db.relationship('Subject', back_populates='results')
 
+    @staticmethod
+    def percentage_of(marks_obtained, total_marks):
+        if total_marks:
+            return round((marks_obtained / total_marks) * 100, 1)
+        return 0
+
     @property
     def percentage(self):
-        if self.total_marks:
-            return round((self.marks_obtained / self.total_marks) * 100, 1)
-        return 0
+        return Result.percentage_of(self.marks_obtained, self.total_marks)
 
 
 class Announcement(db.Model):
@@ -156,6 +215,14 @@ class Announcement(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime)
 
+    __table_args__ = (
+        # Newest active announcements, optionally for one grade
+        partial_index('ix_announcements_active_created', 'created_at', 'target_grade',
+                      where=is_active == True),
+        # Admin list of all announcements
+        db.Index('ix_announcements_created', 'created_at'),
+    )
+
 
 class GalleryImage(db.Model):
     __tablename__ = 'gallery_images'
@@ -163,12 +230,22 @@ class GalleryImage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(256), nullable=False)
     thumbnail = db.Column(db.String(256))
+    # Set when rendering the sizes failed; `flask process-images` retries
+    processing_failed = db.Column(db.Boolean, default=False)
+    # Responsive widths rendered, smallest first; None until recorded
+    widths = db.Column(db.JSON(none_as_null=True))
     caption = db.Column(db.String(200))
     category = db.Column(db.String(50), default='general')
     sort_order = db.Column(db.Integer, default=0)
     is_active = db.Column(db.Boolean, default=True)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Gallery order (admin lists every image, the public page active ones)
+        db.Index('ix_gallery_images_order', 'sort_order', uploaded_at.desc()),
+        partial_index('ix_gallery_images_active_category', 'category', where=is_active == True),
+    )
+
 
 class Note(db.Model):
     __tablename__ = 'notes'
@@ -183,6 +260,13 @@ class Note(db.Model):
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
 
+    __table_args__ = (
+        # A grade's notes grouped by subject and chapter on the student portal
+        partial_index('ix_notes_active_grade_subject', 'grade', 'subject_id', 'chapter',
+                      where=is_active == True),
+        partial_index('ix_notes_active_uploaded', 'uploaded_at', where=is_active == True),
+    )
+
     subject = db.relationship('Subject', back_populates='notes')
 
 
@@ -212,6 +296,8 @@ class ContactMessage(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (db.Index('ix_contact_messages_created', 'created_at', 'id'),)
+
 
 class SiteSetting(db.Model):
     __tablename__ = 'site_settings'
@@ -219,3 +305,195 @@ class SiteSetting(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     key = db.Column(db.String(100), unique=True, nullable=False)
     value = db.Column(db.Text)
+
+
+class StoredFile(db.Model):
+    """An uploaded file stored under its SHA-256 digest, shared by reference."""
+    __tablename__ = 'stored_files'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    filename = db.Column(db.String(256), nullable=False)
+    digest = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.Integer)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('kind', 'filename'),)
+
+
+class Counter(db.Model):
+    """A row count kept up to date on write; see ``app.counters``."""
+    __tablename__ = 'counters'
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ExamStat(db.Model):
+    """Score distribution of one exam for one subject and grade; see ``app.analytics``.
+
+    ``histogram[i]`` counts results scoring from ``i`` to ``i + 1`` percent
+    (the last bin includes 100), so the median, quantiles and percentile
+    ranks below are accurate to about a percentage point.
+    """
+    __tablename__ = 'exam_stats'
+
+    id = db.Column(db.Integer, primary_key=True)
+    exam_name = db.Column(db.String(100), nullable=False)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
+    grade = db.Column(db.Integer, nullable=False)
+    exam_date = db.Column(db.Date)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0)
+    total_squares = db.Column(db.Float, nullable=False, default=0)
+    histogram = db.Column(db.JSON, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    subject = db.relationship('Subject')
+
+    __table_args__ = (
+        db.UniqueConstraint('exam_name', 'subject_id', 'grade'),
+        db.Index('ix_exam_stats_exam_date', 'exam_date', 'id'),
+    )
+
+    @property
+    def mean(self):
+        return round(self.total / self.count, 1) if self.count else 0
+
+    @property
+    def stddev(self):
+        if not self.count:
+            return 0
+        variance = self.total_squares / self.count - (self.total / self.count) ** 2
+        return round(max(variance, 0) ** 0.5, 1)
+
+    @property
+    def median(self):
+        return self.quantile(0.5)
+
+    def quantile(self, q):
+        """The score below which a fraction ``q`` of results fall."""
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.histogram):
+            if n and seen + n >= target:
+                return round(i + (target - seen) / n, 1)
+            seen += n
+        return 0
+
+    def percentile_rank(self, percentage):
+        """Percentage of results scoring below ``percentage``."""
+        if not self.count:
+            return 0
+        i = min(int(percentage), len(self.histogram) - 1)
+        below = sum(self.histogram[:i]) + self.histogram[i] * (percentage - i)
+        return round(min(below / self.count * 100, 100))
+
+    def buckets(self, width=10):
+        """``(low, high, count)`` for consecutive ranges of ``width`` percent."""
+        return [(low, low + width, sum(self.histogram[low:low + width]))
+                for low in range(0, len(self.histogram), width)]
+
+
+class StudentProgress(db.Model):
+    """A student's running scores in one subject; see ``app.analytics``.
+
+    ``recent`` holds the latest exams, newest first, as ``[day, percentage]``
+    pairs where ``day`` counts days since ``PROGRESS_EPOCH``. The sums over
+    every exam give the all-time average and the least-squares trend.
+    """
+    __tablename__ = 'student_progress'
+
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
+    exam_count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0)
+    sum_x = db.Column(db.Float, nullable=False, default=0)
+    sum_xx = db.Column(db.Float, nullable=False, default=0)
+    sum_xy = db.Column(db.Float, nullable=False, default=0)
+    best = db.Column(db.Float)
+    recent = db.Column(db.JSON, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    subject = db.relationship('Subject')
+
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'subject_id'),
+        # A student's subjects, most examined first
+        db.Index('ix_student_progress_student_count', 'student_id', 'exam_count'),
+    )
+
+    ROLLING_WINDOW = 5
+
+    @property
+    def average(self):
+        return round(self.total / self.exam_count, 1) if self.exam_count else 0
+
+    @property
+    def rolling_average(self):
+        window = [pct for _, pct in self.recent[:self.ROLLING_WINDOW]]
+        return round(sum(window) / len(window), 1) if window else 0
+
+    @property
+    def latest(self):
+        return self.recent[0][1] if self.recent else None
+
+    @property
+    def latest_date(self):
+        return PROGRESS_EPOCH + timedelta(days=self.recent[0][0]) if self.recent else None
+
+    @property
+    def trend(self):
+        """Least-squares slope in percentage points per 30 days, or None."""
+        n = self.exam_count
+        spread = n * self.sum_xx - self.sum_x ** 2
+        if n < 2 or spread <= 0:
+            return None
+        return round((n * self.sum_xy - self.sum_x * self.total) / spread * 30, 1)
+
+    def points(self):
+        """``(date, percentage)`` of the recent exams, oldest first, for charts."""
+        return [(PROGRESS_EPOCH + timedelta(days=day), pct) for day, pct in reversed(self.recent)]
+
+
+class RankList(db.Model):
+    """The ranking of one exam sitting, over everyone or one batch; see ``app.analytics``."""
+    __tablename__ = 'rank_lists'
+
+    id = db.Column(db.Integer, primary_key=True)
+    exam_name = db.Column(db.String(100), nullable=False)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
+    exam_date = db.Column(db.Date, nullable=False)
+    # 0 ranks every student who sat the exam, otherwise one batch's students
+    batch_id = db.Column(db.Integer, nullable=False, default=0)
+    size = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    subject = db.relationship('Subject')
+    entries = db.relationship('ResultRank', back_populates='rank_list', lazy='dynamic')
+
+    __table_args__ = (
+        db.UniqueConstraint('exam_name', 'subject_id', 'exam_date', 'batch_id'),
+        db.Index('ix_rank_lists_batch_exam_date', 'batch_id', 'exam_date', 'id'),
+    )
+
+
+class ResultRank(db.Model):
+    """A student's position in a rank list, kept in order as results change."""
+    __tablename__ = 'result_ranks'
+
+    id = db.Column(db.Integer, primary_key=True)
+    rank_list_id = db.Column(db.Integer, db.ForeignKey('rank_lists.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    percentage = db.Column(db.Float, nullable=False)
+    rank = db.Column(db.Integer, nullable=False, default=0)
+
+    rank_list = db.relationship('RankList', back_populates='entries')
+    student = db.relationship('Student')
+
+    __table_args__ = (
+        db.Index('ix_result_ranks_list_percentage', 'rank_list_id', 'percentage'),
+        db.Index('ix_result_ranks_student', 'student_id', 'rank_list_id'),
+    )
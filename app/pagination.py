@@ -0,0 +1,91 @@
+"""Keyset (cursor) pagination for lists that grow without bound.
+
+Pages are ordered newest first on ``(created_at, id)``, or another date
+column and ``id``, and fetched with a row-value comparison against the
+last row seen, so every page costs one
+index range scan however deep it is. Totals come from the ``counters``
+table rather than a COUNT(*). Cursors
+are opaque URL-safe tokens; a malformed one simply yields the first page.
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from .extensions import db
+
+
+def encode_cursor(value, id):
+    raw = json.dumps([value.isoformat(), id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, type_=datetime):
+    """Return ``(value, id)`` from a cursor token, or None if invalid.
+
+    ``type_`` is the type of the ordering column, ``datetime`` or ``date``.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        value, id = json.loads(raw)
+        return type_.fromisoformat(value), int(id)
+    except (ValueError, TypeError):
+        return None
+
+
+class KeysetPage:
+    """One page of a keyset paginated query.
+
+    ``items`` are newest first. ``next_cursor``/``prev_cursor`` are None at
+    either end of the list; ``total`` is the number of rows in an
+    unfiltered list, or None when the list is filtered.
+    """
+
+    def __init__(self, items, next_cursor, prev_cursor, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_paginate(query, model, after=None, before=None, per_page=20, total=None,
+                    order_by='created_at'):
+    """Return a :class:`KeysetPage` of ``query`` ordered by ``(order_by, id)`` descending.
+
+    ``after`` continues past the given cursor towards older rows and
+    ``before`` goes back towards newer ones; with neither the first page
+    is returned. ``order_by`` names a non-null date or datetime column.
+    """
+    column = getattr(model, order_by)
+    key = db.tuple_(column, model.id)
+    type_ = date if column.type.python_type is date else datetime
+    after, before = decode_cursor(after, type_), decode_cursor(before, type_)
+    if before is not None:
+        rows = query.filter(key > db.tuple_(*before)).order_by(
+            column.asc(), model.id.asc()).limit(per_page + 1).all()
+        more = len(rows) > per_page
+        items = rows[:per_page][::-1]
+        has_prev, has_next = more, True
+    else:
+        if after is not None:
+            query = query.filter(key < db.tuple_(*after))
+        rows = query.order_by(column.desc(), model.id.desc()).limit(per_page + 1).all()
+        items = rows[:per_page]
+        has_prev, has_next = after is not None, len(rows) > per_page
+
+    next_cursor = prev_cursor = None
+    if items:
+        if has_next:
+            next_cursor = encode_cursor(getattr(items[-1], order_by), items[-1].id)
+        if has_prev:
+            prev_cursor = encode_cursor(getattr(items[0], order_by), items[0].id)
+    return KeysetPage(items, next_cursor, prev_cursor, total)
@@ -0,0 +1,259 @@
+"""Full-text search over students, notes, announcements and messages.
+
+All searchable rows share one index: an FTS5 virtual table on SQLite or a
+table with a GIN-indexed ``tsvector`` on PostgreSQL. Each document is keyed
+by ``ref_id * 8 + kind code`` so updates and deletes hit the primary key.
+Inactive students, notes and announcements are left out.
+The index is kept in step with ORM writes by an ``after_flush`` hook, in
+the same transaction; rows written with Core bulk inserts are indexed with
+``index_rows`` or ``flask search-reindex``. Rows that predate the index are
+indexed when the app first starts with it; an empty marker document
+records that this has happened.
+
+Queries match every word as a prefix and are ranked by BM25 (SQLite) or
+``ts_rank`` (PostgreSQL), with titles weighted above bodies.
+"""
+import re
+
+from flask import current_app
+from sqlalchemy import event, inspect
+
+from .extensions import db
+from .models import Student, Note, Announcement, ContactMessage
+
+INDEX_TABLE = 'search_index'
+# Document ids step by this per ref id; the remainder is the kind code.
+KIND_STRIDE = 8
+# Never matches; present once the index has been filled
+BUILT_MARKER = 0
+
+# kind -> (code, model, attributes that feed the document, document builder)
+# A builder returns (title, body), or None to keep the row out of the index.
+SEARCH_KINDS = {
+    'student': (1, Student, ('student_id', 'full_name', 'email', 'phone', 'parent_name', 'is_active'),
+                lambda s: (s.full_name, ' '.join(filter(None, [s.student_id, s.email, s.phone,
+                                                               s.parent_name])))
+                if s.is_active else None),
+    'note': (2, Note, ('title', 'chapter', 'is_active'),
+             lambda n: (n.title, n.chapter or '') if n.is_active else None),
+    'announcement': (3, Announcement, ('title', 'content', 'is_active'),
+                     lambda a: (a.title, a.content) if a.is_active else None),
+    'message': (4, ContactMessage, ('name', 'email', 'subject', 'message'),
+                lambda m: (m.subject or m.name, ' '.join(filter(None, [m.name, m.email,
+                                                                       m.message])))),
+}
+_KIND_BY_MODEL = {model: kind for kind, (_, model, _, _) in SEARCH_KINDS.items()}
+_KIND_BY_CODE = {code: kind for kind, (code, _, _, _) in SEARCH_KINDS.items()}
+
+
+def _is_postgres(bind):
+    return bind.dialect.name == 'postgresql'
+
+
+def create_search_index():
+    """Create the index table if it is missing; returns False if unsupported.
+
+    An index that has never been filled, such as one just created on a
+    database that already has searchable rows, is filled from them.
+    """
+    with db.engine.begin() as conn:
+        if _is_postgres(conn):
+            conn.exec_driver_sql(
+                f'CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ('
+                'doc_id BIGINT PRIMARY KEY, title TEXT, body TEXT, document TSVECTOR)')
+            conn.exec_driver_sql(
+                f'CREATE INDEX IF NOT EXISTS ix_{INDEX_TABLE}_document '
+                f'ON {INDEX_TABLE} USING GIN (document)')
+        elif conn.dialect.name == 'sqlite':
+            try:
+                conn.exec_driver_sql(
+                    f'CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5('
+                    "title, body, tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+            except Exception:
+                current_app.logger.warning('SQLite was built without FTS5; search is disabled')
+                return False
+        else:
+            return False
+    if _needs_backfill():
+        total = _index_all(db.session.connection())
+        db.session.commit()
+        current_app.logger.info('Search index filled with %d existing documents', total)
+    return True
+
+
+def _needs_backfill():
+    # The marker keeps this from running on every start when no row
+    # produces a document.
+    return db.session.execute(db.text(f'SELECT 1 FROM {INDEX_TABLE} LIMIT 1')).first() is None
+
+
+def is_enabled():
+    return current_app.extensions.get('search', False)
+
+
+def _doc_id(kind, ref_id):
+    return ref_id * KIND_STRIDE + SEARCH_KINDS[kind][0]
+
+
+def _write(conn, upserts, deletes):
+    """Apply ``upserts`` ({doc_id, title, body} dicts) and ``deletes`` (doc ids)."""
+    if _is_postgres(conn):
+        if deletes:
+            conn.execute(db.text(f'DELETE FROM {INDEX_TABLE} WHERE doc_id = :doc_id'),
+                         [{'doc_id': d} for d in deletes])
+        if upserts:
+            conn.execute(db.text(
+                f'INSERT INTO {INDEX_TABLE} (doc_id, title, body, document) VALUES '
+                "(:doc_id, :title, :body, setweight(to_tsvector('simple', :title), 'A') || "
+                "setweight(to_tsvector('simple', :body), 'B')) "
+                'ON CONFLICT (doc_id) DO UPDATE SET title = excluded.title, '
+                'body = excluded.body, document = excluded.document'), upserts)
+    else:
+        stale = deletes + [u['doc_id'] for u in upserts]
+        if stale:
+            conn.execute(db.text(f'DELETE FROM {INDEX_TABLE} WHERE rowid = :doc_id'),
+                         [{'doc_id': d} for d in stale])
+        if upserts:
+            conn.execute(db.text(
+                f'INSERT INTO {INDEX_TABLE} (rowid, title, body) VALUES (:doc_id, :title, :body)'),
+                upserts)
+
+
+def _document(kind, obj):
+    doc = SEARCH_KINDS[kind][3](obj)
+    if doc is None:
+        return None
+    title, body = doc
+    return {'doc_id': _doc_id(kind, obj.id), 'title': title or '', 'body': body or ''}
+
+
+@event.listens_for(db.session, 'after_flush')
+def _sync_index(session, flush_context):
+    if not is_enabled():
+        return
+    upserts, deletes = [], []
+    for obj in list(session.new) + list(session.dirty):
+        kind = _KIND_BY_MODEL.get(type(obj))
+        if kind is None:
+            continue
+        state = inspect(obj)
+        if obj not in session.new and not any(
+                state.attrs[name].history.has_changes() for name in SEARCH_KINDS[kind][2]):
+            continue
+        doc = _document(kind, obj)
+        if doc is None:
+            deletes.append(_doc_id(kind, obj.id))
+        else:
+            upserts.append(doc)
+    for obj in session.deleted:
+        kind = _KIND_BY_MODEL.get(type(obj))
+        if kind is not None:
+            deletes.append(_doc_id(kind, obj.id))
+    if upserts or deletes:
+        _write(session.connection(), upserts, deletes)
+
+
+def _index(conn, kind, rows):
+    upserts, deletes = [], []
+    for obj in rows:
+        doc = _document(kind, obj)
+        if doc is None:
+            deletes.append(_doc_id(kind, obj.id))
+        else:
+            upserts.append(doc)
+    _write(conn, upserts, deletes)
+    return len(upserts)
+
+
+def _index_all(conn, batch_size=2000):
+    conn.execute(db.text(f'DELETE FROM {INDEX_TABLE}'))
+    _write(conn, [{'doc_id': BUILT_MARKER, 'title': '', 'body': ''}], [])
+    total = 0
+    for kind, (_, model, _, _) in SEARCH_KINDS.items():
+        batch = []
+        for obj in model.query.order_by(model.id).yield_per(batch_size):
+            batch.append(obj)
+            if len(batch) == batch_size:
+                total += _index(conn, kind, batch)
+                batch = []
+        total += _index(conn, kind, batch)
+    return total
+
+
+def index_rows(kind, rows):
+    """Index rows written without the ORM (e.g. Core bulk inserts)."""
+    if not is_enabled():
+        return 0
+    return _index(db.session.connection(), kind, rows)
+
+
+def rebuild_index(batch_size=2000):
+    """Re-index every searchable row; returns the number of documents."""
+    if not is_enabled():
+        return 0
+    total = _index_all(db.session.connection(), batch_size)
+    db.session.commit()
+    return total
+
+
+def _match_query(text, postgres):
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return None
+    if postgres:
+        return ' & '.join(f'{w}:*' for w in words)
+    return ' '.join(f'"{w}"*' for w in words)
+
+
+def search(text, kinds=None, limit=50):
+    """Return ranked ``(kind, ref_id)`` pairs for rows matching every word of ``text``."""
+    if not is_enabled():
+        return []
+    postgres = _is_postgres(db.session.get_bind())
+    query = _match_query(text, postgres)
+    if query is None:
+        return []
+    codes = [SEARCH_KINDS[k][0] for k in (kinds or SEARCH_KINDS)]
+    if postgres:
+        sql = (f"SELECT doc_id FROM {INDEX_TABLE}, to_tsquery('simple', :query) q "
+               f'WHERE document @@ q AND doc_id % {KIND_STRIDE} IN :codes '
+               'ORDER BY ts_rank(document, q) DESC LIMIT :limit')
+    else:
+        sql = (f'SELECT rowid FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH :query '
+               f'AND rowid % {KIND_STRIDE} IN :codes '
+               f'ORDER BY bm25({INDEX_TABLE}, 10.0, 1.0) LIMIT :limit')
+    stmt = db.text(sql).bindparams(db.bindparam('codes', expanding=True))
+    rows = db.session.execute(stmt, {'query': query, 'codes': codes, 'limit': limit})
+    return [(_KIND_BY_CODE[doc_id % KIND_STRIDE], doc_id // KIND_STRIDE) for doc_id, in rows]
+
+
+def match_ids(kind, text):
+    """A SELECT of the ids of every row of one kind matching ``text``, for ``in_()``.
+
+    Unlike ``search()`` it is neither ranked nor limited, so lists filtered
+    with it keep their own order and show every match.
+    """
+    postgres = _is_postgres(db.session.get_bind())
+    query = _match_query(text, postgres)
+    if query is None:
+        return []
+    if postgres:
+        sql = (f'SELECT doc_id / {KIND_STRIDE} FROM {INDEX_TABLE} '
+               f"WHERE document @@ to_tsquery('simple', :query) AND doc_id % {KIND_STRIDE} = :code")
+    else:
+        sql = (f'SELECT rowid / {KIND_STRIDE} FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH :query '
+               f'AND rowid % {KIND_STRIDE} = :code')
+    return db.text(sql).bindparams(query=query, code=SEARCH_KINDS[kind][0]).columns(
+        ref_id=db.Integer)
+
+
+def load_results(hits):
+    """Turn ``search()`` hits into ``(kind, obj)`` pairs, one query per kind."""
+    by_kind = {}
+    for kind, ref_id in hits:
+        by_kind.setdefault(kind, []).append(ref_id)
+    objects = {}
+    for kind, ids in by_kind.items():
+        model = SEARCH_KINDS[kind][1]
+        objects.update(((kind, obj.id), obj) for obj in model.query.filter(model.id.in_(ids)))
+    return [(kind, objects[kind, ref_id]) for kind, ref_id in hits if (kind, ref_id) in objects]
@@ -59,6 +59,21 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     });
 
+    // ---------- Image Fallbacks ----------
+    // Uploaded photos are resized in the background; until the file exists show an icon instead
+    const showFallbackIcon = function (img) {
+        const icon = document.createElement('i');
+        icon.className = img.dataset.fallbackIcon;
+        img.replaceWith(icon);
+    };
+    document.querySelectorAll('img[data-fallback-icon]').forEach(function (img) {
+        if (img.complete && img.naturalWidth === 0) {
+            showFallbackIcon(img);
+        } else {
+            img.addEventListener('error', function () { showFallbackIcon(img); });
+        }
+    });
+
     // ---------- Gallery Filter ----------
     const filterBtns = document.querySelectorAll('[data-filter]');
     if (filterBtns.length) {
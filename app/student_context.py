@@ -0,0 +1,79 @@
+"""Data shared by every student portal view, loaded once per request.
+
+A student's batches come back with their subject and faculty in a single
+joined query, together with the announcements for their grade and the
+list of active subjects. The result is kept per request in ``g`` and,
+as plain tuples, in a short-lived per-student cache that any commit to
+the underlying tables invalidates.
+"""
+from collections import namedtuple
+
+from flask import current_app, g
+from flask_login import current_user
+
+from .cache import VersionedCache, cached_value, table_stamp
+from .extensions import db
+from .models import Announcement, Batch, BatchEnrollment, Faculty, Subject
+
+SubjectInfo = namedtuple('SubjectInfo', 'id name code color icon')
+FacultyInfo = namedtuple('FacultyInfo', 'id full_name')
+BatchInfo = namedtuple('BatchInfo', 'id name schedule start_date end_date subject faculty')
+AnnouncementInfo = namedtuple('AnnouncementInfo', 'id title content priority created_at')
+
+CONTEXT_TABLES = ('batch_enrollments', 'batches', 'subjects', 'faculty', 'announcements')
+
+
+class StudentContext:
+    """What the portal needs about one student besides their own row."""
+
+    def __init__(self, subjects, batches, announcements):
+        self.subjects = subjects
+        self.batches = batches
+        self.announcements = announcements
+        self.subjects_by_id = {s.id: s for s in subjects}
+
+
+def _load_subjects():
+    return [SubjectInfo(*row) for row in db.session.query(
+        Subject.id, Subject.name, Subject.code, Subject.color, Subject.icon
+    ).filter_by(is_active=True).order_by(Subject.id)]
+
+
+active_subjects_cache = VersionedCache(table_stamp('subjects'), _load_subjects)
+
+
+def _load_context(student_id, grade):
+    rows = db.session.query(
+        Batch.id, Batch.name, Batch.schedule, Batch.start_date, Batch.end_date,
+        Subject.id, Subject.name, Subject.code, Subject.color, Subject.icon,
+        Faculty.id, Faculty.full_name
+    ).join(BatchEnrollment, BatchEnrollment.batch_id == Batch.id).join(
+        Subject, Subject.id == Batch.subject_id
+    ).outerjoin(Faculty, Faculty.id == Batch.faculty_id).filter(
+        BatchEnrollment.student_id == student_id,
+        Batch.is_active == True
+    ).order_by(BatchEnrollment.enrolled_at).all()
+    batches = [
+        BatchInfo(*row[:5], SubjectInfo(*row[5:10]),
+                  FacultyInfo(*row[10:12]) if row[10] is not None else None)
+        for row in rows
+    ]
+    announcements = [AnnouncementInfo(*row) for row in db.session.query(
+        Announcement.id, Announcement.title, Announcement.content,
+        Announcement.priority, Announcement.created_at
+    ).filter(
+        Announcement.is_active == True,
+        db.or_(Announcement.target_grade == None, Announcement.target_grade == grade)
+    ).order_by(Announcement.created_at.desc()).limit(5)]
+    return StudentContext(active_subjects_cache.get(), batches, announcements)
+
+
+def get_student_context():
+    """The current student's context, built at most once per request."""
+    if 'student_context' not in g:
+        student_id, grade = current_user.id, current_user.grade
+        g.student_context = cached_value(
+            'student_context', (student_id, grade), CONTEXT_TABLES,
+            current_app.config.get('STUDENT_CONTEXT_TTL', 0),
+            lambda: _load_context(student_id, grade))
+    return g.student_context
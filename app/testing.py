@@ -0,0 +1,76 @@
+"""Helpers for tests that lock in per-route SQL query budgets.
+
+Example::
+
+    def test_home_budget(client):
+        assert_max_queries(client, '/')
+
+The budget defaults to the ``SQL_QUERY_BUDGETS`` entry for the endpoint
+that handled the request; pass ``max_queries`` to override it.
+
+Read replica routing can be checked against two SQLite files, using the
+``replica_app`` fixture of ``tests/conftest.py``::
+
+    def test_results_read_from_replica(replica_app, replica_student_client):
+        with record_binds(replica_app) as statements:
+            replica_student_client.get('/student/results')
+        assert {bind for bind, sql in statements} == {'replica0'}
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from .extensions import db, queries_recorded
+
+
+@contextmanager
+def record_queries(app):
+    """Collect ``(endpoint, QueryStats)`` for every request made inside the block."""
+    recorded = []
+
+    def _collect(sender, endpoint, stats, **extra):
+        recorded.append((endpoint, stats))
+
+    with queries_recorded.connected_to(_collect, app):
+        yield recorded
+
+
+def assert_max_queries(client, url, max_queries=None, method='get', **kwargs):
+    """Request ``url`` and fail if it issues more SQL statements than allowed."""
+    app = client.application
+    with record_queries(app) as recorded:
+        response = getattr(client, method)(url, **kwargs)
+    assert recorded, f'no queries were recorded for {url}; is the app in testing mode?'
+    endpoint, stats = recorded[-1]
+    if max_queries is None:
+        max_queries = app.config['SQL_QUERY_BUDGETS'].get(endpoint)
+    assert max_queries is not None, f'no query budget configured for {endpoint}'
+    repeated = '\n'.join(f'  {n}x {sql}' for sql, n in stats.repeated())
+    assert stats.count <= max_queries, (
+        f'{endpoint} issued {stats.count} SQL statements, budget is {max_queries}'
+        + (f'\nrepeated statements:\n{repeated}' if repeated else '')
+    )
+    return response
+
+
+@contextmanager
+def record_binds(app):
+    """Collect ``(bind, statement)`` for every statement run inside the block.
+
+    ``bind`` is None for the primary and ``replica0``, ``replica1``... for
+    the read replicas.
+    """
+    recorded = []
+    with app.app_context():
+        engines = dict(db.engines)
+    listeners = []
+    for bind, engine in engines.items():
+        def _collect(conn, cursor, statement, parameters, context, executemany, bind=bind):
+            recorded.append((bind, statement))
+        event.listen(engine, 'before_cursor_execute', _collect)
+        listeners.append((engine, _collect))
+    try:
+        yield recorded
+    finally:
+        for engine, listener in listeners:
+            event.remove(engine, 'before_cursor_execute', listener)
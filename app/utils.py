@@ -1,12 +1,21 @@
+import errno
+import hashlib
+import mimetypes
 import os
 import random
+import shutil
 import string
+import tempfile
+from bisect import bisect_right
 from functools import wraps
 from datetime import datetime
 
-from flask import abort, current_app
+from flask import Request, abort, current_app
 from flask_login import current_user
-from PIL import Image
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from .extensions import db
 
 
 def admin_required(f):
@@ -27,18 +36,45 @@ def student_required(f):
     return decorated
 
 
+def _student_id_suffix(student_id):
+    suffix = student_id.rsplit('-', 1)[-1]
+    return int(suffix) if suffix.isdigit() else 0
+
+
+def reserve_student_ids(count=1, year=None):
+    """Atomically reserve ``count`` consecutive student IDs for ``year``.
+
+    The counter row is incremented with a single UPDATE, which holds the
+    row (or, on SQLite, the database) write lock until the caller commits,
+    so concurrent workers never hand out the same number. Numbers keep the
+    ``{num:03d}`` format and simply grow a digit past 999.
+    """
+    from .models import Student, StudentIdSequence
+
+    year = year or datetime.now().year
+    table = StudentIdSequence.__table__
+    bump = table.update().where(table.c.year == year).values(
+        last_value=table.c.last_value + count)
+
+    if db.session.execute(bump).rowcount == 0:
+        # First ID of the year: continue after any IDs issued before the sequence existed.
+        taken = db.session.query(Student.student_id).filter(
+            Student.student_id.like(f'MPC-{year}-%'))
+        start = max((_student_id_suffix(sid) for sid, in taken), default=0)
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(year=year, last_value=start + count))
+        except IntegrityError:
+            # Another worker created the row first.
+            db.session.execute(bump)
+
+    last = db.session.execute(
+        db.select(table.c.last_value).where(table.c.year == year)).scalar_one()
+    return [f'MPC-{year}-{num:03d}' for num in range(last - count + 1, last + 1)]
+
+
 def generate_student_id():
-    from .models import Student
-    year = datetime.now().year
-    last = Student.query.filter(
-        Student.student_id.like(f'MPC-{year}-%')
-    ).order_by(Student.id.desc()).first()
-
-    if last:
-        num = int(last.student_id.split('-')[-1]) + 1
-    else:
-        num = 1
-    return f'MPC-{year}-{num:03d}'
+    return reserve_student_ids(1)[0]
 
 
 def generate_random_password(length=8):
@@ -46,23 +82,19 @@ def generate_random_password(length=8):
     return ''.join(random.choice(chars) for _ in range(length))
 
 
+# CBSE grade bands: lower percentage bound of each letter, ascending.
+GRADE_CUTOFFS = [33, 41, 51, 61, 71, 81, 91]
+GRADE_LETTERS = ['E', 'D', 'C2', 'C1', 'B2', 'B1', 'A2', 'A1']
+
+
 def calculate_grade(percentage):
-    if percentage >= 91:
-        return 'A1'
-    elif percentage >= 81:
-        return 'A2'
-    elif percentage >= 71:
-        return 'B1'
-    elif percentage >= 61:
-        return 'B2'
-    elif percentage >= 51:
-        return 'C1'
-    elif percentage >= 41:
-        return 'C2'
-    elif percentage >= 33:
-        return 'D'
-    else:
-        return 'E'
+    return GRADE_LETTERS[bisect_right(GRADE_CUTOFFS, percentage)]
+
+
+def calculate_grades(percentages):
+    """Grade a whole column of percentages against the same bands."""
+    cutoffs, letters = GRADE_CUTOFFS, GRADE_LETTERS
+    return [letters[bisect_right(cutoffs, p)] for p in percentages]
 
 
 def allowed_file(filename, allowed_extensions):
@@ -70,42 +102,258 @@ def allowed_file(filename, allowed_extensions):
         filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
 
-def save_image(file, folder, max_size=(800, 800)):
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# kind -> function(filename) deleting every file stored for that kind
+_file_removers = {}
+
+
+def register_file_remover(kind, remover):
+    _file_removers[kind] = remover
+
+
+class HashingFile:
+    """Disk-backed stream for one uploaded file that hashes what is written.
+
+    The multipart parser writes each file part here in fixed-size chunks,
+    so an upload never sits in memory and its size and SHA-256 digest are
+    known once the form is parsed. Unless claimed by ``store_upload``, the
+    temp file is deleted when the request closes its files.
+    """
+
+    def __init__(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=folder, prefix='.upload-')
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self.size = 0
+        self.claimed = False
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def write(self, data):
+        self._digest.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def claim(self):
+        """Take over the temp file; returns ``(temp_path, sha256_hexdigest, size)``."""
+        self._file.flush()
+        self.claimed = True
+        return self.path, self._digest.hexdigest(), self.size
+
+    def close(self):
+        self._file.close()
+        if not self.claimed:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+# Endpoints accepting bodies larger than MAX_CONTENT_LENGTH -> config key of their limit
+LARGE_UPLOAD_ENDPOINTS = {'admin.upload_note': 'MAX_NOTE_CONTENT_LENGTH'}
+
+
+class UploadRequest(Request):
+    """Request that spools uploaded files through ``HashingFile``."""
+
+    @Request.max_content_length.getter
+    def max_content_length(self):
+        # Decided by endpoint, as CSRF protection parses the form before the view runs.
+        key = LARGE_UPLOAD_ENDPOINTS.get(self.endpoint)
+        if key and self._max_content_length is None and current_app:
+            return current_app.config[key]
+        return Request.max_content_length.fget(self)
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        return HashingFile(current_app.config['UPLOAD_TEMP_FOLDER'])
+
+
+def stream_to_file(stream, folder):
+    """Copy ``stream`` to a temporary file in ``folder`` while hashing it.
+
+    Returns ``(temp_path, sha256_hexdigest, size)``.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=folder, prefix='.upload-')
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path, digest.hexdigest(), size
+
+
+def _move_into(temp_path, path):
+    try:
+        os.replace(temp_path, path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # The temp folder is on another filesystem: copy next to the
+        # target first so the final rename stays atomic.
+        fd, staged = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.upload-')
+        os.close(fd)
+        shutil.copyfile(temp_path, staged)
+        os.replace(staged, path)
+        os.remove(temp_path)
+
+
+def _retain_upload(kind, filename):
+    from .models import StoredFile
+    table = StoredFile.__table__
+    return db.session.execute(table.update().where(
+        table.c.kind == kind, table.c.filename == filename
+    ).values(ref_count=table.c.ref_count + 1)).rowcount > 0
+
+
+def store_upload(file, kind, folder, suffix=''):
+    """Store an upload under its content digest and take a reference to it.
+
+    Returns ``(filename, size, is_new)``. When identical content is already
+    stored for ``kind`` the upload is discarded and ``is_new`` is False.
+    The digest in the filename doubles as a strong ETag.
+    """
     from werkzeug.utils import secure_filename
-    filename = secure_filename(file.filename)
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    name, ext = os.path.splitext(filename)
-    unique_name = f'{name}_{timestamp}{ext}'
-    filepath = os.path.join(folder, unique_name)
+    from .models import StoredFile
+
+    os.makedirs(folder, exist_ok=True)
+    ext = os.path.splitext(secure_filename(file.filename))[1].lower()
+    if isinstance(file.stream, HashingFile) and not file.stream.claimed:
+        temp_path, digest, size = file.stream.claim()
+    else:
+        temp_path, digest, size = stream_to_file(file.stream, folder)
+    filename = f'{digest}{suffix}{ext}'
 
-    img = Image.open(file)
-    if img.mode in ('RGBA', 'P'):
-        img = img.convert('RGB')
-    img.thumbnail(max_size, Image.LANCZOS)
-    img.save(filepath, quality=85, optimize=True)
+    if _retain_upload(kind, filename):
+        os.remove(temp_path)
+        return filename, size, False
+    try:
+        with db.session.begin_nested():
+            db.session.add(StoredFile(kind=kind, filename=filename, digest=digest,
+                                      size=size, ref_count=1))
+    except IntegrityError:
+        # The same content was stored concurrently by another request.
+        os.remove(temp_path)
+        _retain_upload(kind, filename)
+        return filename, size, False
+    # Moved in only once the row holds the key, so a release of the same
+    # content that is still removing the old copy cannot delete this one.
+    _move_into(temp_path, os.path.join(folder, filename))
+    return filename, size, True
 
-    return unique_name
 
+def release_upload(kind, filename):
+    """Drop one reference to a stored file; the last one deletes it after commit.
 
-def create_thumbnail(source_path, thumb_folder, size=(300, 300)):
-    filename = os.path.basename(source_path)
-    thumb_path = os.path.join(thumb_folder, f'thumb_{filename}')
+    Files uploaded before content addressing have no ``StoredFile`` row and
+    are deleted straight away (after commit) as before.
+    """
+    from .models import StoredFile
+    table = StoredFile.__table__
+    match = (table.c.kind == kind, table.c.filename == filename)
+    # Both statements are atomic, so a concurrent retain either lands before
+    # the delete (which then leaves the row and the file alone) or after it,
+    # in which case the file is checked again before it is removed.
+    if db.session.execute(table.update().where(*match).values(
+            ref_count=table.c.ref_count - 1)).rowcount:
+        if not db.session.execute(table.delete().where(
+                *match, table.c.ref_count <= 0)).rowcount:
+            return
+    db.session.info.setdefault('release_files', []).append((kind, filename))
 
-    img = Image.open(source_path)
-    if img.mode in ('RGBA', 'P'):
-        img = img.convert('RGB')
-    img.thumbnail(size, Image.LANCZOS)
-    img.save(thumb_path, quality=80, optimize=True)
 
-    return f'thumb_{filename}'
+@event.listens_for(db.session, 'after_commit')
+def _remove_released_files(session):
+    for kind, filename in session.info.pop('release_files', []):
+        _remove_unreferenced(kind, filename)
+
+
+def _remove_unreferenced(kind, filename):
+    """Delete a released file unless the same content was stored again.
+
+    The file is unlinked while a placeholder row holds its key, in a
+    transaction of its own on the primary. An upload that stored the
+    content since the release makes the insert fail and the file is kept;
+    one arriving meanwhile waits on the key before moving its copy in.
+    """
+    from .models import StoredFile
+    table = StoredFile.__table__
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(table.insert().values(kind=kind, filename=filename, digest='',
+                                               ref_count=0))
+            try:
+                _file_removers[kind](filename)
+            except OSError:
+                pass
+            conn.execute(table.delete().where(table.c.kind == kind, table.c.filename == filename))
+    except IntegrityError:
+        pass
+
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _keep_released_files(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('release_files', None)
+
+
+def _remove_note_file(filename):
+    os.remove(os.path.join(current_app.config['NOTES_FOLDER'], filename))
+
+
+register_file_remover('note', _remove_note_file)
+
+
+def send_upload(folder, filename, download_name):
+    """Send a stored upload as an attachment, or hand it to the front proxy.
+
+    Served by Flask, the response honours ``Range``, ``If-Range``,
+    ``If-None-Match`` and ``If-Modified-Since``; content addressed files
+    use their digest as a strong ETag. With ``SENDFILE_MODE`` set to
+    ``x-accel-redirect`` (nginx) or ``x-sendfile`` (Apache, lighttpd) the
+    worker only returns headers and the web server streams the bytes.
+    Raises ``NotFound`` when the file is missing.
+    """
+    from flask import send_file
+    from werkzeug.exceptions import NotFound
+
+    config = current_app.config
+    path = os.path.join(folder, filename)
+    mode = config.get('SENDFILE_MODE')
+    if mode:
+        if not os.path.isfile(path):
+            raise NotFound()
+        response = current_app.response_class(mimetype=mimetypes.guess_type(filename)[0])
+        if mode == 'x-accel-redirect':
+            relative = os.path.relpath(path, config['UPLOAD_FOLDER']).replace(os.sep, '/')
+            response.headers['X-Accel-Redirect'] = config['SENDFILE_URL_PREFIX'].rstrip('/') + '/' + relative
+        else:
+            response.headers['X-Sendfile'] = path
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    else:
+        digest = os.path.splitext(filename)[0]
+        is_digest = len(digest) == 64 and all(c in '0123456789abcdef' for c in digest)
+        try:
+            response = send_file(path, as_attachment=True, download_name=download_name,
+                                 etag=digest if is_digest else True)
+        except FileNotFoundError:
+            raise NotFound()
+    response.cache_control.private = True
+    return response
 
 
 def save_file(file, folder):
-    from werkzeug.utils import secure_filename
-    filename = secure_filename(file.filename)
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    name, ext = os.path.splitext(filename)
-    unique_name = f'{name}_{timestamp}{ext}'
-    filepath = os.path.join(folder, unique_name)
-    file.save(filepath)
-    return unique_name, os.path.getsize(filepath)
+    filename, size, _ = store_upload(file, 'note', folder)
+    return filename, size
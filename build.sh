@@ -7,3 +7,6 @@ pip install -r requirements.txt
 
 # Seed database with admin user and default subjects
 python seed.py
+
+# Add indexes and backfill data that databases created by older versions are missing
+flask --app run db upgrade
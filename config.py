@@ -8,13 +8,74 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'instance', 'mathphi.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload
+    # Pragmas set on every SQLite connection, in this order (see app/database.py)
+    SQLITE_PRAGMAS = {
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_MB', 256)) * 1024 * 1024,
+        # Negative values are KiB: 64 MB of page cache per connection
+        'cache_size': -int(os.environ.get('SQLITE_CACHE_MB', 64)) * 1024,
+    }
+    # Connection pool per worker process for server databases
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    # Seconds to wait for a free connection before failing the request
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    # Seconds after which a connection is replaced, below server/proxy idle timeouts
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    # Read replicas for the SELECTs of GET requests, comma separated
+    SQLALCHEMY_REPLICA_URIS = [url.strip() for url in
+                               os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    # Seconds a browser keeps reading from the primary after one of its requests wrote
+    REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+    SQL_RECORD_QUERIES = os.environ.get('SQL_RECORD_QUERIES', '').lower() in ('1', 'true', 'yes')
+    # Maximum SQL statements per request, by endpoint (checked when recording and
+    # by tests/test_query_budgets.py); they include filling a new worker's caches
+    SQL_QUERY_BUDGETS = {
+        'public.home': 5,
+        'student.dashboard': 6,
+        'admin.results': 5,
+    }
+    # Seconds anonymous public pages are served from cache (0 disables)
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 300))
+    # Seconds {% cache %} template fragments are reused (0 disables)
+    FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 3600))
+    # Seconds a student's batches and announcements are reused between requests
+    STUDENT_CONTEXT_TTL = int(os.environ.get('STUDENT_CONTEXT_TTL', 30))
+    # Entries kept per worker, each for the page and the fragment cache
+    RENDER_CACHE_MAX_ENTRIES = 500
+    # Largest request body accepted; uploads are streamed to disk, not held in memory
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_UPLOAD_MB', 32)) * 1024 * 1024
+    # Larger limit for lecture PDFs, on the note upload route only
+    MAX_NOTE_CONTENT_LENGTH = int(os.environ.get('MAX_NOTE_UPLOAD_MB', 200)) * 1024 * 1024
+
+    # Threads per worker process used to hash passwords during bulk student imports (default: CPU count)
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 0)) or None
 
     UPLOAD_FOLDER = os.path.join(basedir, 'app', 'static', 'uploads')
     GALLERY_FOLDER = os.path.join(UPLOAD_FOLDER, 'gallery')
     NOTES_FOLDER = os.path.join(UPLOAD_FOLDER, 'notes')
     AVATARS_FOLDER = os.path.join(UPLOAD_FOLDER, 'avatars')
     THUMBNAILS_FOLDER = os.path.join(UPLOAD_FOLDER, 'thumbnails')
+    # Raw uploads waiting for background processing (kept out of static/)
+    ORIGINALS_FOLDER = os.path.join(basedir, 'instance', 'originals')
+    # Uploads being received; keep on the same filesystem as the folders above
+    UPLOAD_TEMP_FOLDER = os.path.join(basedir, 'instance', 'incoming')
+    # Credentials sheets written by student imports (they hold passwords; kept out of static/)
+    IMPORT_REPORTS_FOLDER = os.path.join(basedir, 'instance', 'imports')
+    # Hours a credentials sheet is kept before it is deleted
+    IMPORT_REPORT_HOURS = int(os.environ.get('IMPORT_REPORT_HOURS', 24))
+
+    # Image processing threads per worker process (default: CPU count); 0 processes uploads inline
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', os.cpu_count() or 1))
+    # Extra widths rendered for gallery images, used in srcset
+    GALLERY_IMAGE_WIDTHS = (480, 1600)
+
+    # Let the web server stream note downloads: 'x-accel-redirect' (nginx) or 'x-sendfile'
+    SENDFILE_MODE = os.environ.get('SENDFILE_MODE') or None
+    # Internal nginx location that aliases UPLOAD_FOLDER (x-accel-redirect only)
+    SENDFILE_URL_PREFIX = os.environ.get('SENDFILE_URL_PREFIX', '/protected-uploads/')
 
     ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
     ALLOWED_NOTE_EXTENSIONS = {'pdf'}
@@ -0,0 +1,35 @@
+"""Add gallery_images.processing_failed
+
+Marks gallery images whose background processing failed, so they no
+longer show "Processing..." forever.
+
+Revision ID: 4fd0303e1606
+Revises: 61c3694bf0d6
+Create Date: 2026-10-18 20:11:37.402918
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4fd0303e1606'
+down_revision = '61c3694bf0d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if context.is_offline_mode():
+        columns = set()
+    else:
+        columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('gallery_images')}
+    # Tables created by this version's db.create_all() already have it.
+    if 'processing_failed' not in columns:
+        op.add_column('gallery_images', sa.Column('processing_failed', sa.Boolean(),
+                                                  server_default=sa.false()))
+
+
+def downgrade():
+    with op.batch_alter_table('gallery_images') as batch_op:
+        batch_op.drop_column('processing_failed')
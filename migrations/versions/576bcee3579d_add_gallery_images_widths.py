@@ -0,0 +1,35 @@
+"""Add gallery_images.widths
+
+Records which responsive sizes were rendered for each gallery image, so
+pages no longer check the disk for every size of every image. Existing
+rows stay NULL until ``flask process-images --backfill`` records them.
+
+Revision ID: 576bcee3579d
+Revises: 4fd0303e1606
+Create Date: 2026-10-18 22:40:12.518204
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '576bcee3579d'
+down_revision = '4fd0303e1606'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if context.is_offline_mode():
+        columns = set()
+    else:
+        columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('gallery_images')}
+    # Tables created by this version's db.create_all() already have it.
+    if 'widths' not in columns:
+        op.add_column('gallery_images', sa.Column('widths', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('gallery_images') as batch_op:
+        batch_op.drop_column('widths')
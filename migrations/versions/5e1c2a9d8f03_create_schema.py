@@ -0,0 +1,288 @@
+"""Create the schema
+
+The tables as they were before the indexes of the next revision, so
+``flask db upgrade`` builds a working database from an empty one. Tables
+that already exist, e.g. created by ``db.create_all()`` before migrations
+were used, are left as they are.
+
+Revision ID: 5e1c2a9d8f03
+Revises:
+Create Date: 2026-10-18 17:20:00.000000
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e1c2a9d8f03'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Referenced tables first
+TABLES = [
+    'admin_users', 'announcements', 'contact_messages', 'counters', 'faculty',
+    'gallery_images', 'site_settings', 'stored_files', 'student_id_sequences', 'students',
+    'subjects', 'testimonials', 'batches', 'exam_stats', 'notes', 'rank_lists', 'results',
+    'student_progress', 'batch_enrollments', 'result_ranks',
+]
+
+
+def upgrade():
+    if context.is_offline_mode():
+        existing = set()
+    else:
+        existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    def create_table(name, *items):
+        if name not in existing:
+            op.create_table(name, *items)
+
+    create_table('admin_users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=80), nullable=False),
+        sa.Column('email', sa.String(length=120), nullable=False),
+        sa.Column('password_hash', sa.String(length=256), nullable=False),
+        sa.Column('full_name', sa.String(length=120), nullable=False),
+        sa.Column('is_superadmin', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+        sa.UniqueConstraint('username')
+    )
+    create_table('announcements',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('category', sa.String(length=50), nullable=True),
+        sa.Column('priority', sa.String(length=20), nullable=True),
+        sa.Column('target_grade', sa.Integer(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    create_table('contact_messages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=120), nullable=False),
+        sa.Column('email', sa.String(length=120), nullable=False),
+        sa.Column('phone', sa.String(length=15), nullable=True),
+        sa.Column('subject', sa.String(length=200), nullable=True),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.Column('is_read', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    create_table('counters',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    create_table('faculty',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('full_name', sa.String(length=120), nullable=False),
+        sa.Column('email', sa.String(length=120), nullable=True),
+        sa.Column('phone', sa.String(length=15), nullable=True),
+        sa.Column('qualification', sa.String(length=200), nullable=True),
+        sa.Column('experience', sa.String(length=100), nullable=True),
+        sa.Column('bio', sa.Text(), nullable=True),
+        sa.Column('photo', sa.String(length=256), nullable=True),
+        sa.Column('specialization', sa.String(length=200), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('sort_order', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    create_table('gallery_images',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('filename', sa.String(length=256), nullable=False),
+        sa.Column('thumbnail', sa.String(length=256), nullable=True),
+        sa.Column('caption', sa.String(length=200), nullable=True),
+        sa.Column('category', sa.String(length=50), nullable=True),
+        sa.Column('sort_order', sa.Integer(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('uploaded_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    create_table('site_settings',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(length=100), nullable=False),
+        sa.Column('value', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('key')
+    )
+    create_table('stored_files',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('filename', sa.String(length=256), nullable=False),
+        sa.Column('digest', sa.String(length=64), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=True),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('kind', 'filename')
+    )
+    create_table('student_id_sequences',
+        sa.Column('year', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('last_value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('year')
+    )
+    create_table('students',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('student_id', sa.String(length=20), nullable=False),
+        sa.Column('full_name', sa.String(length=120), nullable=False),
+        sa.Column('email', sa.String(length=120), nullable=False),
+        sa.Column('phone', sa.String(length=15), nullable=True),
+        sa.Column('password_hash', sa.String(length=256), nullable=False),
+        sa.Column('grade', sa.Integer(), nullable=False),
+        sa.Column('avatar', sa.String(length=256), nullable=True),
+        sa.Column('parent_name', sa.String(length=120), nullable=True),
+        sa.Column('parent_phone', sa.String(length=15), nullable=True),
+        sa.Column('address', sa.Text(), nullable=True),
+        sa.Column('date_of_birth', sa.Date(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+        sa.UniqueConstraint('student_id')
+    )
+    create_table('subjects',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=80), nullable=False),
+        sa.Column('code', sa.String(length=10), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('icon', sa.String(length=50), nullable=True),
+        sa.Column('color', sa.String(length=7), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('code')
+    )
+    create_table('testimonials',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('student_name', sa.String(length=120), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('rating', sa.Integer(), nullable=True),
+        sa.Column('grade', sa.String(length=20), nullable=True),
+        sa.Column('photo', sa.String(length=256), nullable=True),
+        sa.Column('is_featured', sa.Boolean(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    create_table('batches',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('subject_id', sa.Integer(), nullable=False),
+        sa.Column('grade', sa.Integer(), nullable=False),
+        sa.Column('faculty_id', sa.Integer(), nullable=True),
+        sa.Column('schedule', sa.String(length=200), nullable=True),
+        sa.Column('start_date', sa.Date(), nullable=True),
+        sa.Column('end_date', sa.Date(), nullable=True),
+        sa.Column('max_students', sa.Integer(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['faculty_id'], ['faculty.id'], ),
+        sa.ForeignKeyConstraint(['subject_id'], ['subjects.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    create_table('exam_stats',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('exam_name', sa.String(length=100), nullable=False),
+        sa.Column('subject_id', sa.Integer(), nullable=False),
+        sa.Column('grade', sa.Integer(), nullable=False),
+        sa.Column('exam_date', sa.Date(), nullable=True),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Float(), nullable=False),
+        sa.Column('total_squares', sa.Float(), nullable=False),
+        sa.Column('histogram', sa.JSON(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['subject_id'], ['subjects.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('exam_name', 'subject_id', 'grade')
+    )
+    create_table('notes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('subject_id', sa.Integer(), nullable=False),
+        sa.Column('grade', sa.Integer(), nullable=False),
+        sa.Column('chapter', sa.String(length=100), nullable=True),
+        sa.Column('filename', sa.String(length=256), nullable=False),
+        sa.Column('file_size', sa.Integer(), nullable=True),
+        sa.Column('uploaded_at', sa.DateTime(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.ForeignKeyConstraint(['subject_id'], ['subjects.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    create_table('rank_lists',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('exam_name', sa.String(length=100), nullable=False),
+        sa.Column('subject_id', sa.Integer(), nullable=False),
+        sa.Column('exam_date', sa.Date(), nullable=False),
+        sa.Column('batch_id', sa.Integer(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['subject_id'], ['subjects.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('exam_name', 'subject_id', 'exam_date', 'batch_id')
+    )
+    create_table('results',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('student_id', sa.Integer(), nullable=False),
+        sa.Column('subject_id', sa.Integer(), nullable=False),
+        sa.Column('exam_name', sa.String(length=100), nullable=False),
+        sa.Column('exam_date', sa.Date(), nullable=False),
+        sa.Column('marks_obtained', sa.Float(), nullable=False),
+        sa.Column('total_marks', sa.Float(), nullable=False),
+        sa.Column('grade_letter', sa.String(length=2), nullable=True),
+        sa.Column('remarks', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['student_id'], ['students.id'], ),
+        sa.ForeignKeyConstraint(['subject_id'], ['subjects.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    create_table('student_progress',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('student_id', sa.Integer(), nullable=False),
+        sa.Column('subject_id', sa.Integer(), nullable=False),
+        sa.Column('exam_count', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Float(), nullable=False),
+        sa.Column('sum_x', sa.Float(), nullable=False),
+        sa.Column('sum_xx', sa.Float(), nullable=False),
+        sa.Column('sum_xy', sa.Float(), nullable=False),
+        sa.Column('best', sa.Float(), nullable=True),
+        sa.Column('recent', sa.JSON(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['student_id'], ['students.id'], ),
+        sa.ForeignKeyConstraint(['subject_id'], ['subjects.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('student_id', 'subject_id')
+    )
+    create_table('batch_enrollments',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('student_id', sa.Integer(), nullable=False),
+        sa.Column('batch_id', sa.Integer(), nullable=False),
+        sa.Column('enrolled_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['batch_id'], ['batches.id'], ),
+        sa.ForeignKeyConstraint(['student_id'], ['students.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('student_id', 'batch_id')
+    )
+    create_table('result_ranks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('rank_list_id', sa.Integer(), nullable=False),
+        sa.Column('student_id', sa.Integer(), nullable=False),
+        sa.Column('percentage', sa.Float(), nullable=False),
+        sa.Column('rank', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['rank_list_id'], ['rank_lists.id'], ),
+        sa.ForeignKeyConstraint(['student_id'], ['students.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    if 'result_ranks' not in existing:
+        op.create_index('ix_result_ranks_list_percentage', 'result_ranks',
+                        ['rank_list_id', 'percentage'])
+        op.create_index('ix_result_ranks_student', 'result_ranks', ['student_id', 'rank_list_id'])
+
+
+def downgrade():
+    for name in reversed(TABLES):
+        op.drop_table(name)
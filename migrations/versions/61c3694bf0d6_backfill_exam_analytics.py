@@ -0,0 +1,35 @@
+"""Backfill exam analytics from existing results
+
+``exam_stats``, ``student_progress``, ``rank_lists`` and ``result_ranks``
+are maintained as results are written, so on a database that had results
+before these tables existed they only reflect later writes: means and
+percentiles, progress trends and ranks would be computed from a fraction
+of the results. This rebuilds all of them once from ``results``, the same
+as ``flask rebuild-analytics``.
+
+Revision ID: 61c3694bf0d6
+Revises: d7b9709a3c2b
+Create Date: 2026-10-18 19:02:41.518307
+
+"""
+from alembic import context, op
+
+
+# revision identifiers, used by Alembic.
+revision = '61c3694bf0d6'
+down_revision = 'd7b9709a3c2b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if context.is_offline_mode():
+        # Data migration; run `flask rebuild-analytics` after applying the SQL.
+        return
+    from app.analytics import rebuild_analytics
+    rebuild_analytics(conn=op.get_bind())
+
+
+def downgrade():
+    # The aggregates stay valid and are kept up to date either way.
+    pass
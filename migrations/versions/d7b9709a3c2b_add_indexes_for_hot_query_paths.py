@@ -0,0 +1,67 @@
+"""Add indexes for hot query paths
+
+Adds the indexes declared in ``app.models`` to tables created by the
+previous revision, or by ``db.create_all()`` before them (which only
+indexes new tables). Indexes on ``is_active`` rows are partial on SQLite
+and PostgreSQL, and are built concurrently on PostgreSQL so the tables
+stay writable meanwhile.
+
+Revision ID: d7b9709a3c2b
+Revises: 5e1c2a9d8f03
+Create Date: 2026-10-18 17:28:05.137211
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7b9709a3c2b'
+down_revision = '5e1c2a9d8f03'
+branch_labels = None
+depends_on = None
+
+ACTIVE = sa.column('is_active') == sa.true()
+
+# (name, table, columns, where)
+INDEXES = [
+    ('ix_students_active_grade_created', 'students', ['grade', 'created_at', 'id'], ACTIVE),
+    ('ix_students_active_created', 'students', ['created_at', 'id'], ACTIVE),
+    ('ix_students_phone', 'students', ['phone'], None),
+    ('ix_students_email_lower', 'students', [sa.func.lower(sa.column('email'))], None),
+    ('ix_results_student_exam_date', 'results', ['student_id', 'exam_date', 'id'], None),
+    ('ix_results_created', 'results', ['created_at', 'id'], None),
+    ('ix_results_exam_date', 'results', ['exam_date', 'id'], None),
+    ('ix_announcements_active_created', 'announcements', ['created_at', 'target_grade'], ACTIVE),
+    ('ix_announcements_created', 'announcements', ['created_at'], None),
+    ('ix_gallery_images_order', 'gallery_images', ['sort_order', sa.desc(sa.column('uploaded_at'))],
+     None),
+    ('ix_gallery_images_active_category', 'gallery_images', ['category'], ACTIVE),
+    ('ix_notes_active_grade_subject', 'notes', ['grade', 'subject_id', 'chapter'], ACTIVE),
+    ('ix_notes_active_uploaded', 'notes', ['uploaded_at'], ACTIVE),
+    ('ix_contact_messages_created', 'contact_messages', ['created_at', 'id'], None),
+    ('ix_batches_active_subject', 'batches', ['subject_id'], ACTIVE),
+    ('ix_batches_active_created', 'batches', ['created_at'], ACTIVE),
+    ('ix_batches_active_name', 'batches', ['name'], ACTIVE),
+    ('ix_batch_enrollments_batch', 'batch_enrollments', ['batch_id'], None),
+    ('ix_batch_enrollments_student_enrolled', 'batch_enrollments', ['student_id', 'enrolled_at'],
+     None),
+    ('ix_exam_stats_exam_date', 'exam_stats', ['exam_date', 'id'], None),
+    ('ix_rank_lists_batch_exam_date', 'rank_lists', ['batch_id', 'exam_date', 'id'], None),
+    ('ix_student_progress_student_count', 'student_progress', ['student_id', 'exam_count'], None),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True,
+                            sqlite_where=where, postgresql_where=where,
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True,
+                          postgresql_concurrently=True)
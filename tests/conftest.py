@@ -0,0 +1,126 @@
+"""Apps on temporary SQLite databases filled by ``flask generate-data``."""
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from app.cache import clear_caches
+from app.commands import generate_data, sync_replicas
+from app.extensions import db
+from app.models import AdminUser, BatchEnrollment, Student, Subject
+from config import Config
+
+GENERATE_ARGS = ['--students', '200', '--faculty', '10', '--batches', '20',
+                 '--enrollments', '400', '--results', '3000', '--notes', '20',
+                 '--gallery', '10', '--announcements', '20', '--messages', '20',
+                 '--testimonials', '6']
+
+
+def make_app(path, **settings):
+    """An app in testing mode whose database and files live under ``path``."""
+    config = type('TestConfig', (Config,), {
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path / "primary.db"}',
+        'UPLOAD_FOLDER': str(path / 'uploads'),
+        'GALLERY_FOLDER': str(path / 'uploads' / 'gallery'),
+        'NOTES_FOLDER': str(path / 'uploads' / 'notes'),
+        'AVATARS_FOLDER': str(path / 'uploads' / 'avatars'),
+        'THUMBNAILS_FOLDER': str(path / 'uploads' / 'thumbnails'),
+        'ORIGINALS_FOLDER': str(path / 'originals'),
+        'UPLOAD_TEMP_FOLDER': str(path / 'incoming'),
+        'IMPORT_REPORTS_FOLDER': str(path / 'imports'),
+        'IMAGE_WORKERS': 0,
+        **settings,
+    })
+    app = create_app(config)
+    # Cache version stamps
+    app.instance_path = str(path)
+    return app
+
+
+def seed(app):
+    """The rows seed.py creates, plus a small generated data set."""
+    with app.app_context():
+        db.session.add(AdminUser(username='admin', email='admin@example.test',
+                                 password_hash=generate_password_hash('admin123'),
+                                 full_name='Administrator', is_superadmin=True))
+        db.session.add_all(Subject(name=name, code=code) for name, code in (
+            ('Mathematics', 'MATH'), ('Physics', 'PHY'), ('Chemistry', 'CHEM')))
+        db.session.commit()
+    result = app.test_cli_runner().invoke(generate_data, GENERATE_ARGS)
+    assert result.exit_code == 0, result.output
+
+
+def login(client, user):
+    with client.session_transaction() as session:
+        session['_user_id'] = user.get_id()
+        session['_fresh'] = True
+    return client
+
+
+def enrolled_student():
+    """The active student with the most batch enrollments."""
+    return db.session.query(Student).join(BatchEnrollment).filter(
+        Student.is_active == True
+    ).group_by(Student.id).order_by(db.func.count(BatchEnrollment.id).desc()).first()
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    app = make_app(tmp_path_factory.mktemp('app'))
+    seed(app)
+    return app
+
+
+@pytest.fixture(scope='session')
+def replica_app(tmp_path_factory):
+    """An app reading from a second SQLite file, copied from the primary after seeding."""
+    path = tmp_path_factory.mktemp('replica_app')
+    app = make_app(path, SQLALCHEMY_REPLICA_URIS=[f'sqlite:///{path / "replica.db"}'])
+    seed(app)
+    result = app.test_cli_runner().invoke(sync_replicas)
+    assert result.exit_code == 0, result.output
+    return app
+
+
+@pytest.fixture
+def fresh_app(tmp_path):
+    """An app on a new database of its own, with the tables but no rows."""
+    return make_app(tmp_path)
+
+
+@pytest.fixture
+def unreachable_replica_app(tmp_path):
+    """An app whose read replica cannot be opened, with the page cache off."""
+    return make_app(tmp_path, PAGE_CACHE_TTL=0,
+                    SQLALCHEMY_REPLICA_URIS=[f'sqlite:///{tmp_path / "missing" / "replica.db"}'])
+
+
+@pytest.fixture
+def cold_app(app):
+    """``app`` with nothing cached, as in a freshly started worker."""
+    clear_caches(app)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_client(app):
+    with app.app_context():
+        return login(app.test_client(), AdminUser.query.first())
+
+
+@pytest.fixture
+def student_client(app):
+    with app.app_context():
+        return login(app.test_client(), enrolled_student())
+
+
+@pytest.fixture
+def replica_student_client(replica_app):
+    with replica_app.app_context():
+        return login(replica_app.test_client(), enrolled_student())
@@ -0,0 +1,151 @@
+"""Analytics kept up to date on write match a full rebuild from ``results``."""
+from datetime import date
+
+import pytest
+
+from app.analytics import PROGRESS_POINTS, RERANK_THRESHOLD, rebuild_analytics
+from app.extensions import db
+from app.models import (
+    Batch, BatchEnrollment, ExamStat, RankList, Result, ResultRank, Student, StudentProgress
+)
+
+
+def snapshot():
+    """Every aggregate row by its natural key, with floats rounded."""
+    stats = {(s.exam_name, s.subject_id, s.grade): (
+        s.count, round(s.total, 6), round(s.total_squares, 3), s.histogram, s.exam_date)
+        for s in ExamStat.query}
+    progress = {(p.student_id, p.subject_id): (
+        p.exam_count, round(p.total, 6), p.sum_x, p.sum_xx, round(p.sum_xy, 3), p.best,
+        [list(point) for point in p.recent]) for p in StudentProgress.query}
+    ranks = {}
+    for entry, rank_list in db.session.query(ResultRank, RankList).join(ResultRank.rank_list):
+        key = (rank_list.exam_name, rank_list.subject_id, rank_list.exam_date, rank_list.batch_id)
+        ranks.setdefault(key, {'size': rank_list.size, 'entries': []})['entries'].append(
+            (entry.student_id, entry.percentage, entry.rank))
+    for ranking in ranks.values():
+        ranking['entries'].sort()
+    return {'stats': stats, 'progress': progress, 'ranks': ranks}
+
+
+def assert_matches_rebuild():
+    db.session.expire_all()
+    incremental = snapshot()
+    rebuild_analytics(commit=False)
+    db.session.expire_all()
+    rebuilt = snapshot()
+    db.session.rollback()
+    for name in rebuilt:
+        differing = {key for key in incremental[name].keys() | rebuilt[name].keys()
+                     if incremental[name].get(key) != rebuilt[name].get(key)}
+        assert not differing, (name, {key: (incremental[name].get(key), rebuilt[name].get(key))
+                                      for key in sorted(differing, key=str)[:3]})
+
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield
+        db.session.rollback()
+
+
+def student_with_results():
+    return db.session.query(Student).join(Result).join(BatchEnrollment, isouter=True).group_by(
+        Student.id).order_by(db.func.count(BatchEnrollment.id).desc(), Student.id).first()
+
+
+def test_edit_expired_result(ctx):
+    result = Result.query.join(Student).filter(Student.id == student_with_results().id).first()
+    db.session.commit()
+    # Expired by the commit: the old values are not loaded when these are set.
+    result.marks_obtained = result.total_marks - result.marks_obtained
+    db.session.commit()
+    result.exam_name = 'Retake'
+    result.exam_date = date(2025, 3, 1)
+    db.session.commit()
+    assert_matches_rebuild()
+
+
+def test_delete_expired_result(ctx):
+    student = student_with_results()
+    results = student.results.order_by(Result.exam_date.desc()).limit(2).all()
+    db.session.commit()
+    for result in results:
+        db.session.delete(result)
+    db.session.commit()
+    assert_matches_rebuild()
+
+
+def test_regrade_expired_student(ctx):
+    student = student_with_results()
+    db.session.commit()
+    student.grade = 9 if student.grade != 9 else 12
+    db.session.commit()
+    assert_matches_rebuild()
+
+
+def test_progress_keeps_latest_exams(ctx):
+    student = student_with_results()
+    subject_id = student.results.first().subject_id
+    for month in range(1, PROGRESS_POINTS + 3):
+        db.session.add(Result(student_id=student.id, subject_id=subject_id, exam_name='Weekly',
+                              exam_date=date(2027, month % 12 + 1, month), marks_obtained=month,
+                              total_marks=20))
+    db.session.commit()
+    progress = StudentProgress.query.filter_by(student_id=student.id, subject_id=subject_id).one()
+    assert len(progress.recent) == PROGRESS_POINTS
+    newest = student.results.filter_by(subject_id=subject_id).order_by(
+        Result.exam_date.desc()).first()
+    db.session.commit()
+    newest.marks_obtained = 0
+    db.session.commit()
+    assert_matches_rebuild()
+    db.session.delete(newest)
+    db.session.commit()
+    assert_matches_rebuild()
+
+
+def test_new_sitting_is_reranked(ctx):
+    students = Student.query.order_by(Student.id).limit(RERANK_THRESHOLD * 2).all()
+    subject_id = Batch.query.first().subject_id
+    for i, student in enumerate(students):
+        db.session.add(Result(student_id=student.id, subject_id=subject_id, exam_name='Mock',
+                              exam_date=date(2025, 4, 1), marks_obtained=40 + i % 5,
+                              total_marks=50))
+    db.session.commit()
+    ranking = snapshot()['ranks'][('Mock', subject_id, date(2025, 4, 1), 0)]
+    assert ranking['size'] == len(students)
+    assert sorted(rank for _, _, rank in ranking['entries'])[:4] == [1, 1, 1, 4]
+    assert_matches_rebuild()
+
+
+def test_enrollment_changes_batch_ranks(ctx):
+    student = student_with_results()
+    subject_ids = {r.subject_id for r in student.results}
+    enrolled = {e.batch_id for e in student.batch_enrollments}
+    batch = Batch.query.filter(Batch.subject_id.in_(subject_ids), Batch.id.notin_(enrolled)).first()
+    enrollment = BatchEnrollment(student_id=student.id, batch_id=batch.id)
+    db.session.add(enrollment)
+    db.session.commit()
+    assert_matches_rebuild()
+    db.session.delete(enrollment)
+    db.session.commit()
+    assert_matches_rebuild()
+
+
+def test_bulk_update_and_delete(ctx):
+    student = student_with_results()
+    Result.query.filter_by(student_id=student.id).update(
+        {Result.marks_obtained: Result.marks_obtained / 2}, synchronize_session=False)
+    db.session.commit()
+    assert_matches_rebuild()
+    exam_name = Result.query.filter_by(student_id=student.id).first().exam_name
+    Result.query.filter_by(student_id=student.id, exam_name=exam_name).delete(
+        synchronize_session=False)
+    BatchEnrollment.query.filter_by(student_id=student.id).delete(synchronize_session=False)
+    db.session.commit()
+    assert_matches_rebuild()
+    db.session.execute(db.update(Student).where(Student.id == student.id).values(
+        grade=Student.grade % 4 + 9))
+    db.session.commit()
+    assert_matches_rebuild()
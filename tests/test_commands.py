@@ -0,0 +1,18 @@
+"""CLI commands run against the seeded test database."""
+import json
+
+from app.commands import benchmark, explain_queries
+
+
+def test_benchmark_runs_every_route(app, tmp_path):
+    path = tmp_path / 'benchmark.json'
+    result = app.test_cli_runner().invoke(benchmark, ['--repeat', '1', '--save', str(path)])
+    assert result.exit_code == 0, result.output
+    report = json.loads(path.read_text())
+    assert report['admin.export_enrollments']['status'] == 200
+    assert report['admin.export_enrollments']['queries'] > 0
+
+
+def test_every_query_uses_an_index(app):
+    result = app.test_cli_runner().invoke(explain_queries, ['--check'])
+    assert result.exit_code == 0, result.output
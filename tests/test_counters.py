@@ -0,0 +1,92 @@
+"""Counters follow every kind of write and match a COUNT(*) afterwards."""
+from datetime import date
+
+import pytest
+
+from app.counters import COUNTERS, get_counts, reconcile
+from app.extensions import db
+from app.models import ContactMessage, Counter, Result, Student, Subject
+
+
+@pytest.fixture
+def ctx(fresh_app):
+    with fresh_app.app_context():
+        yield
+
+
+def assert_counts_match():
+    db.session.expire_all()
+    report = reconcile()
+    db.session.rollback()
+    assert {name: stored for name, (stored, _) in report.items()} == \
+        {name: actual for name, (_, actual) in report.items()}
+
+
+def student(n, **fields):
+    return Student(student_id=f'T{n:04d}', full_name=f'Student {n}', email=f's{n}@example.test',
+                   password_hash='-', grade=10, **fields)
+
+
+def test_orm_writes(ctx):
+    students = [student(n, is_active=n % 3 != 0) for n in range(1, 10)]
+    db.session.add_all(students)
+    db.session.add(ContactMessage(name='A', email='a@example.test', subject='Hi', message='...'))
+    db.session.commit()
+    assert get_counts('active_students', 'unread_messages') == {
+        'active_students': 6, 'unread_messages': 1}
+
+    # Expired by the commit: the old values are not loaded when these are set.
+    students[0].is_active = False
+    students[1].is_active = False
+    students[2].is_active = True
+    students[3].is_active = True
+    ContactMessage.query.one().is_read = True
+    db.session.commit()
+    assert get_counts('active_students', 'unread_messages') == {
+        'active_students': 5, 'unread_messages': 0}
+
+    message = ContactMessage(name='B', email='b@example.test', subject='Fees', message='...')
+    db.session.add(message)
+    db.session.commit()
+    db.session.delete(students[3])
+    db.session.delete(students[5])
+    db.session.delete(message)
+    db.session.commit()
+    assert get_counts('active_students', 'unread_messages') == {
+        'active_students': 4, 'unread_messages': 0}
+    assert_counts_match()
+
+
+def test_bulk_statements(ctx):
+    db.session.add(Subject(name='Mathematics', code='MATH'))
+    db.session.execute(db.insert(Student), [
+        {'student_id': f'T{n:04d}', 'full_name': f'Student {n}', 'email': f's{n}@example.test',
+         'password_hash': '-', 'grade': 10, **({'is_active': False} if n > 7 else {})}
+        for n in range(10)])
+    db.session.commit()
+    ids = [id for id, in db.session.query(Student.id)]
+    db.session.execute(db.insert(Result), [
+        {'student_id': id, 'subject_id': 1, 'exam_name': 'Unit test', 'exam_date': date(2025, 1, 6),
+         'marks_obtained': 10, 'total_marks': 20} for id in ids])
+    db.session.commit()
+    assert get_counts('active_students', 'results') == {'active_students': 8, 'results': 10}
+
+    Student.query.filter(Student.id.in_(ids[:4])).update({'is_active': False},
+                                                          synchronize_session=False)
+    Result.query.filter(Result.student_id.in_(ids[:3])).delete(synchronize_session=False)
+    db.session.commit()
+    assert get_counts('active_students', 'results') == {'active_students': 4, 'results': 7}
+    assert_counts_match()
+
+
+def test_reconcile_repairs_drift(ctx):
+    db.session.add_all(student(n) for n in range(3))
+    db.session.commit()
+    db.session.execute(db.update(Counter).where(Counter.name == 'active_students').values(value=40))
+    db.session.delete(db.session.get(Counter, 'results'))
+    db.session.commit()
+    assert get_counts('results') == {'results': 0}
+    report = reconcile(['active_students', 'results'])
+    db.session.commit()
+    assert report == {'active_students': (40, 3), 'results': (None, 0)}
+    assert get_counts(*COUNTERS)['active_students'] == 3
@@ -0,0 +1,52 @@
+"""Streamed CSV and XLSX exports."""
+import csv
+import io
+
+import pytest
+from openpyxl import load_workbook
+
+from app import exports
+from app.extensions import db
+from app.models import BatchEnrollment, Student
+
+
+def csv_rows(response):
+    return list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+
+
+@pytest.fixture
+def formula_students(app):
+    names = ['=1+1', "+cmd|'/c calc'!A0", '-1+1', '@SUM(A1)']
+    with app.app_context():
+        students = [Student(student_id=f'MPC-1999-{i:03d}', full_name=name, grade=10,
+                            email=f'formula{i}@example.test', password_hash='x')
+                    for i, name in enumerate(names)]
+        db.session.add_all(students)
+        db.session.commit()
+        yield names
+        for student in students:
+            db.session.delete(student)
+        db.session.commit()
+
+
+def test_csv_export_has_every_row(app, admin_client):
+    rows = csv_rows(admin_client.get('/admin/batches/enrollments/export'))
+    with app.app_context():
+        assert len(rows) - 1 == BatchEnrollment.query.count()
+
+
+def test_formulas_are_escaped(admin_client, formula_students):
+    rows = csv_rows(admin_client.get('/admin/students/export?search=MPC-1999'))
+    assert sorted(row[1] for row in rows[1:]) == sorted("'" + name for name in formula_students)
+
+
+def test_xlsx_export_continues_on_new_sheets(app, admin_client, monkeypatch):
+    monkeypatch.setattr(exports, 'XLSX_MAX_ROWS', 50)
+    response = admin_client.get('/admin/students/export?format=xlsx')
+    workbook = load_workbook(io.BytesIO(response.get_data()), read_only=True)
+    sheets = [list(sheet.values) for sheet in workbook.worksheets]
+    assert workbook.sheetnames[:2] == ['Students', 'Students 2']
+    assert all(len(rows) <= 50 and rows[0][0] == 'Student ID' for rows in sheets)
+    with app.app_context():
+        assert sum(len(rows) - 1 for rows in sheets) == Student.query.filter_by(
+            is_active=True).count()
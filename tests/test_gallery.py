@@ -0,0 +1,76 @@
+"""Uploaded gallery images get responsive sizes no wider than the original."""
+import io
+import os
+
+from PIL import Image
+
+from app import images
+from app.extensions import db
+from app.models import GalleryImage
+
+
+def jpeg(size, color):
+    out = io.BytesIO()
+    Image.new('RGB', size, color).save(out, 'JPEG')
+    out.seek(0)
+    return out
+
+
+def upload(client, *files):
+    return client.post('/admin/gallery/upload', data={
+        'images': [(f, f'photo{i}.jpg') for i, f in enumerate(files)], 'category': 'general',
+    }, content_type='multipart/form-data')
+
+
+def uploaded(app, count=1):
+    with app.app_context():
+        return GalleryImage.query.order_by(GalleryImage.id.desc()).limit(count).all()[::-1]
+
+
+def test_sizes_stop_at_the_original_width(app, admin_client):
+    upload(admin_client, jpeg((1000, 600), 'navy'))
+    image, = uploaded(app)
+    assert image.thumbnail and image.widths == [480]
+    folder = app.config['GALLERY_FOLDER']
+    with Image.open(os.path.join(folder, images.variant_name(image.filename, 480))) as variant:
+        assert variant.width == 480
+    assert not os.path.exists(os.path.join(folder, images.variant_name(image.filename, 1600)))
+
+    page = admin_client.get('/admin/gallery').get_data(as_text=True)
+    assert f'w480_{image.filename} 480w' in page
+    assert f'w1600_{image.filename}' not in page
+
+
+def test_failed_image_is_processed_again_on_reupload(app, admin_client, monkeypatch):
+    def fail(img, filename):
+        raise OSError('disk full')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(images, '_write_widths', fail)
+        upload(admin_client, jpeg((2000, 1200), 'teal'))
+    failed, = uploaded(app)
+    assert failed.processing_failed and failed.thumbnail is None
+
+    upload(admin_client, jpeg((2000, 1200), 'teal'))
+    for image in uploaded(app, 2):
+        assert image.filename == failed.filename
+        assert image.thumbnail and not image.processing_failed
+        assert image.widths == [480, 1600]
+
+
+def test_duplicate_reuses_recorded_sizes(app, admin_client):
+    upload(admin_client, jpeg((600, 600), 'olive'))
+    upload(admin_client, jpeg((600, 600), 'olive'))
+    first, second = uploaded(app, 2)
+    assert first.filename == second.filename
+    assert (second.thumbnail, second.widths) == (first.thumbnail, [480])
+
+
+def test_backfill_records_sizes_on_disk(app):
+    with app.app_context():
+        image = GalleryImage.query.filter(GalleryImage.widths != None).first()
+        widths, image.widths = image.widths, None
+        db.session.commit()
+        result = app.test_cli_runner().invoke(args=['process-images', '--backfill'])
+        assert result.exit_code == 0, result.output
+        assert db.session.get(GalleryImage, image.id).widths == widths
@@ -0,0 +1,36 @@
+"""``flask db upgrade`` builds the schema the models declare."""
+from pathlib import Path
+
+import pytest
+from flask_migrate import downgrade, upgrade
+
+from app.extensions import db
+
+# SQLite does not reflect expression indexes such as lower(email).
+pytestmark = pytest.mark.filterwarnings('ignore:Skipped unsupported reflection')
+
+MIGRATIONS = str(Path(__file__).resolve().parents[1] / 'migrations')
+
+
+def schema():
+    inspector = db.inspect(db.engine)
+    return {name: ({c['name'] for c in inspector.get_columns(name)},
+                   {(i['name'], tuple(i['column_names'])) for i in inspector.get_indexes(name)})
+            for name in db.metadata.tables}
+
+
+def test_upgrade_from_empty_database(fresh_app):
+    with fresh_app.app_context():
+        expected = schema()
+        db.drop_all()
+        upgrade(directory=MIGRATIONS)
+        assert schema() == expected
+        downgrade(directory=MIGRATIONS, revision='base')
+        assert not set(db.metadata.tables) & set(db.inspect(db.engine).get_table_names())
+
+
+def test_upgrade_keeps_tables_created_by_create_all(fresh_app):
+    with fresh_app.app_context():
+        expected = schema()
+        upgrade(directory=MIGRATIONS)
+        assert schema() == expected
@@ -0,0 +1,53 @@
+"""Cached public pages are dropped by the changes they show, and only by those."""
+from datetime import date
+
+import pytest
+
+from app.extensions import db
+from app.models import Announcement, Result, Student
+
+
+@pytest.fixture
+def home(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'PAGE_CACHE_TTL', 300)
+    client = app.test_client()
+
+    def get():
+        response = client.get('/')
+        assert response.status_code == 200
+        return response.headers.get('X-Page-Cache')
+
+    assert get() in ('hit', 'miss')
+    assert get() == 'hit'
+    with app.app_context():
+        yield get
+        db.session.rollback()
+
+
+def test_unrelated_student_edits_keep_the_page(home):
+    student = Student.query.filter_by(is_active=True).first()
+    student.password_hash = 'changed'
+    student.phone = '9999999999'
+    db.session.add(Result(student_id=student.id, subject_id=1, exam_name='Quiz',
+                          exam_date=date(2025, 5, 1), marks_obtained=10, total_marks=20))
+    db.session.commit()
+    assert home() == 'hit'
+
+
+def test_counted_changes_drop_the_page(home):
+    student = Student.query.filter_by(is_active=True).first()
+    student.is_active = False
+    db.session.commit()
+    try:
+        assert home() == 'miss'
+        assert home() == 'hit'
+    finally:
+        student.is_active = True
+        db.session.commit()
+    assert home() == 'miss'
+
+
+def test_shown_tables_drop_the_page(home):
+    db.session.add(Announcement(title='Results are out', content='See the portal.'))
+    db.session.commit()
+    assert home() == 'miss'
@@ -0,0 +1,83 @@
+"""Keyset pages walk a list once in order, in either direction."""
+from datetime import date, datetime
+
+import pytest
+
+from app.counters import get_counts
+from app.extensions import db
+from app.models import Announcement, Result, Student
+from app.pagination import decode_cursor, encode_cursor, keyset_paginate
+
+
+def test_cursor_round_trip():
+    moment = datetime(2025, 3, 1, 9, 30, 15, 250)
+    assert decode_cursor(encode_cursor(moment, 42)) == (moment, 42)
+    assert decode_cursor(encode_cursor(date(2025, 3, 1), 7), date) == (date(2025, 3, 1), 7)
+    assert '=' not in encode_cursor(moment, 1)
+
+
+@pytest.mark.parametrize('token', [None, '', 'not-base64!', 'bnVsbA', 'WzEsMl0', 'WyJ4IiwxXQ'])
+def test_malformed_cursor_is_ignored(token):
+    assert decode_cursor(token) is None
+
+
+@pytest.fixture
+def announcements(fresh_app):
+    """Eleven announcements, several of them created at the same moment."""
+    with fresh_app.app_context():
+        for i in range(11):
+            db.session.add(Announcement(title=f'Notice {i}', content='...',
+                                        created_at=datetime(2025, 1, 1 + i // 4)))
+        db.session.commit()
+        yield [a.id for a in Announcement.query.order_by(
+            Announcement.created_at.desc(), Announcement.id.desc())]
+
+
+def walk(cursor_name, cursor):
+    pages = []
+    while True:
+        page = keyset_paginate(Announcement.query, Announcement, per_page=3, **{cursor_name: cursor})
+        pages.append([a.id for a in page.items])
+        cursor = page.next_cursor if cursor_name == 'after' else page.prev_cursor
+        if cursor is None:
+            return pages, page
+
+
+def test_pages_follow_ties_in_both_directions(announcements):
+    pages, last = walk('after', None)
+    assert [id for page in pages for id in page] == announcements
+    assert [len(page) for page in pages] == [3, 3, 3, 2]
+    assert last.has_prev and not last.has_next
+
+    back, first = walk('before', last.prev_cursor)
+    assert back == pages[-2::-1]
+    assert first.has_next and not first.has_prev
+
+
+def test_cursor_past_the_end_gives_an_empty_page(announcements):
+    page = keyset_paginate(Announcement.query, Announcement,
+                           after=encode_cursor(datetime(2000, 1, 1), 0))
+    assert page.items == [] and not page.has_next
+
+
+def test_student_total_counts_active_students(app, admin_client):
+    with app.app_context():
+        student = Student.query.filter_by(is_active=True).first()
+        before = get_counts('active_students')['active_students']
+        assert before == Student.query.filter_by(is_active=True).count()
+        assert f'{before:,} in total' in admin_client.get('/admin/students').get_data(as_text=True)
+        student.is_active = False
+        db.session.commit()
+        try:
+            assert f'{before - 1:,} in total' in admin_client.get(
+                '/admin/students').get_data(as_text=True)
+        finally:
+            student.is_active = True
+            db.session.commit()
+
+
+def test_result_total_counts_every_result(app, admin_client):
+    with app.app_context():
+        total = db.session.query(db.func.count(Result.id)).scalar()
+        assert get_counts('results')['results'] == total
+    assert f'{total:,} in total' in admin_client.get('/admin/results').get_data(as_text=True)
@@ -0,0 +1,18 @@
+"""SQL statement budgets (``SQL_QUERY_BUDGETS``) of the busiest pages.
+
+Requests are made on a cold cache, the most a worker ever issues for them.
+"""
+import pytest
+
+from app.testing import assert_max_queries
+
+
+@pytest.mark.parametrize('client_name, url', [
+    ('client', '/'),
+    ('student_client', '/student/'),
+    ('admin_client', '/admin/results'),
+])
+def test_query_budget(request, cold_app, client_name, url):
+    client = request.getfixturevalue(client_name)
+    response = assert_max_queries(client, url)
+    assert response.status_code == 200
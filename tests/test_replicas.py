@@ -0,0 +1,40 @@
+"""Routing of reads between the primary and a read replica."""
+from app.testing import record_binds
+
+
+def _binds(statements):
+    return {bind for bind, statement in statements}
+
+
+def test_get_reads_from_replica(replica_app, replica_student_client):
+    # The first request fills the caches, which read from the primary.
+    replica_student_client.get('/student/results')
+    with record_binds(replica_app) as statements:
+        response = replica_student_client.get('/student/results')
+    assert response.status_code == 200
+    assert _binds(statements) == {'replica0'}
+
+
+def test_reads_after_write_use_primary(replica_app, replica_student_client):
+    replica_student_client.get('/student/results')
+    with record_binds(replica_app) as statements:
+        response = replica_student_client.post('/student/profile', data={
+            'change_password': '1', 'current_password': 'student123',
+            'new_password': 'student456', 'confirm_password': 'student456'})
+    assert response.status_code == 302
+    assert _binds(statements) == {None}
+
+    with record_binds(replica_app) as statements:
+        response = replica_student_client.get('/student/results')
+    assert response.status_code == 200
+    assert statements and _binds(statements) == {None}
+
+
+def test_unreachable_replica_is_left_out(unreachable_replica_app):
+    app = unreachable_replica_app
+    assert app.extensions['db_replicas'] == []
+    with record_binds(app) as statements:
+        assert app.test_client().get('/about').status_code == 200
+    assert statements and _binds(statements) == {None}
+    result = app.test_cli_runner().invoke(args=['check-database'])
+    assert result.exit_code == 1 and 'cannot connect' in result.output
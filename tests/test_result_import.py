@@ -0,0 +1,122 @@
+"""Marks sheets are validated in one pass and inserted in bulk."""
+import io
+from datetime import date
+
+import pytest
+from openpyxl import Workbook
+from sqlalchemy import event
+from werkzeug.datastructures import FileStorage
+
+from app import importers
+from app.counters import get_counts
+from app.extensions import db
+from app.importers import SheetError, import_results, read_sheet
+from app.models import Result, Student, Subject
+from app.utils import calculate_grade
+
+EXAM = date(2025, 2, 10)
+
+
+@pytest.fixture
+def ctx(fresh_app, monkeypatch):
+    # Small chunks, so a short sheet spans several IN queries and inserts.
+    monkeypatch.setattr(importers, 'IN_CHUNK_SIZE', 2)
+    monkeypatch.setattr(importers, 'INSERT_CHUNK_SIZE', 2)
+    with fresh_app.app_context():
+        db.session.add(Subject(name='Physics', code='PHY'))
+        db.session.add_all(Student(student_id=f'MPC-2025-{n:03d}', full_name=f'Student {n}',
+                                   email=f's{n}@example.test', password_hash='-', grade=11,
+                                   is_active=n != 6) for n in range(1, 8))
+        db.session.commit()
+        db.session.add(Result(student_id=db.session.query(Student.id).filter_by(
+            student_id='MPC-2025-007').scalar(), subject_id=1, exam_name='Unit 1',
+            exam_date=EXAM, marks_obtained=30, total_marks=50))
+        db.session.commit()
+        yield
+
+
+def csv_file(text, name='marks.csv'):
+    return FileStorage(io.BytesIO(text.encode()), filename=name)
+
+
+def statements(sql_prefix):
+    seen = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith(sql_prefix):
+            seen.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    return seen, lambda: event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def test_import_results(ctx):
+    sheet = csv_file('Student ID,Marks,Total Marks,Remarks\n'
+                     'mpc-2025-001,45,50,Well done\n'
+                     'MPC-2025-002,20,,\n'
+                     'MPC-2025-003,38,40,\n'
+                     'MPC-2025-004,12.5,25,\n'
+                     'MPC-2025-005,51,50,\n'
+                     'MPC-2025-006,40,50,\n'
+                     'MPC-2025-007,40,50,\n'
+                     'MPC-2025-099,40,50,\n'
+                     'MPC-2025-001,10,50,\n'
+                     ',10,50,\n'
+                     'MPC-2025-003,abc,50,\n'
+                     ',,,\n')
+    selects, stop = statements('SELECT students.student_id')
+    try:
+        inserted, errors = import_results(sheet, 1, 'Unit 1', EXAM, default_total=40)
+    finally:
+        stop()
+
+    assert inserted == 4
+    assert errors == [
+        (6, 'MPC-2025-005', 'Marks must be between 0 and 50.'),
+        (7, 'MPC-2025-006', 'No active student with this ID.'),
+        (8, 'MPC-2025-007', 'A result for this exam is already recorded.'),
+        (9, 'MPC-2025-099', 'No active student with this ID.'),
+        (10, 'MPC-2025-001', 'Student appears more than once in the sheet.'),
+        (11, '', 'Student ID is missing.'),
+        (12, 'MPC-2025-003', 'Student appears more than once in the sheet.'),
+    ]
+    # Seven distinct IDs passed validation: looked up in chunks of two.
+    assert len(selects) == 4
+
+    rows = {r.student.student_id: (r.marks_obtained, r.total_marks, r.grade_letter, r.remarks)
+            for r in Result.query.filter_by(exam_name='Unit 1')}
+    assert rows['MPC-2025-001'] == (45, 50, calculate_grade(90), 'Well done')
+    assert rows['MPC-2025-002'] == (20, 40, calculate_grade(50), None)
+    assert rows['MPC-2025-004'][:2] == (12.5, 25)
+    assert len(rows) == 5
+    assert get_counts('results')['results'] == 5
+
+
+def test_read_sheet_xlsx():
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(['Student ID', ' Marks Obtained ', None])
+    sheet.append(['MPC-2025-001', 41, None])
+    sheet.append([None, None, None])
+    sheet.append(['MPC-2025-002', 0, None])
+    sheet.append([None, '  ', None])
+    out = io.BytesIO()
+    workbook.save(out)
+    header, rows = read_sheet(FileStorage(io.BytesIO(out.getvalue()), filename='Marks.XLSX'))
+    assert header == ['student_id', 'marks_obtained', '']
+    assert rows == [['MPC-2025-001', 41, None], ['MPC-2025-002', 0, None]]
+
+
+@pytest.mark.parametrize('name, content, message', [
+    ('marks.txt', b'student_id,marks\n', 'Upload a .csv or .xlsx file.'),
+    ('marks.csv', b'', 'The file is empty.'),
+    ('marks.csv', b'\xff\xfe\x00bad', 'save it as UTF-8'),
+    ('marks.xlsx', b'not a workbook', 'Could not read the XLSX file.'),
+])
+def test_unreadable_sheets(name, content, message):
+    with pytest.raises(SheetError, match=message):
+        read_sheet(FileStorage(io.BytesIO(content), filename=name))
+
+
+def test_missing_column(ctx):
+    with pytest.raises(SheetError, match='Missing column "marks"'):
+        import_results(csv_file('student_id,score\nMPC-2025-001,4\n'), 1, 'Unit 2', EXAM)
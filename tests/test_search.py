@@ -0,0 +1,78 @@
+"""The search index follows writes and leaves inactive rows out."""
+import pytest
+
+from app import search as search_module
+from app.extensions import db
+from app.models import Announcement, Student
+from app.search import KIND_STRIDE, SEARCH_KINDS, create_search_index, match_ids, search
+
+
+@pytest.fixture
+def ctx(fresh_app):
+    with fresh_app.app_context():
+        if not search_module.is_enabled():
+            pytest.skip('SQLite was built without FTS5')
+        yield
+
+
+def add_student(name, **fields):
+    first = name.split()[0].lower()
+    student = Student(student_id=f'T-{first}', full_name=name, email=f'{first}@example.test',
+                      password_hash='-', grade=10, **fields)
+    db.session.add(student)
+    db.session.commit()
+    return student
+
+
+def test_prefix_search_and_doc_ids(ctx):
+    student = add_student('Meera Krishnan', parent_name='Lakshmi Krishnan')
+    announcement = Announcement(title='Holiday notice', content='Krishna Jayanthi holiday')
+    db.session.add(announcement)
+    db.session.commit()
+    assert set(search('krish')) == {('student', student.id), ('announcement', announcement.id)}
+    assert search('krish', kinds=['announcement']) == [('announcement', announcement.id)]
+    assert search('meera lak') == [('student', student.id)]
+    assert [id for id, in db.session.execute(match_ids('student', 'meera'))] == [student.id]
+    doc_id = student.id * KIND_STRIDE + SEARCH_KINDS['student'][0]
+    assert db.session.execute(db.text(
+        'SELECT title FROM search_index WHERE rowid = :id'), {'id': doc_id}).scalar() == student.full_name
+
+
+def test_inactive_rows_are_not_indexed(ctx):
+    student = add_student('Arjun Varma')
+    announcement = Announcement(title='Old timetable', content='Superseded', is_active=False)
+    db.session.add(announcement)
+    db.session.commit()
+    assert search('timetable') == []
+    student.is_active = False
+    db.session.commit()
+    assert search('arjun') == []
+    student.is_active = True
+    announcement.is_active = True
+    db.session.commit()
+    assert search('arjun') == [('student', student.id)]
+    assert search('timetable') == [('announcement', announcement.id)]
+
+
+def test_edits_and_deletes_update_the_index(ctx):
+    student = add_student('Kavya Nair')
+    student.full_name = 'Kavya Menon'
+    db.session.commit()
+    assert search('nair') == [] and search('menon') == [('student', student.id)]
+    db.session.delete(student)
+    db.session.commit()
+    assert search('kavya') == []
+
+
+def test_backfill_runs_once(ctx, monkeypatch):
+    db.session.add(Announcement(title='Draft', content='Not published', is_active=False))
+    db.session.commit()
+    db.session.execute(db.text('DELETE FROM search_index'))
+    db.session.commit()
+    calls = []
+    index_all = search_module._index_all
+    monkeypatch.setattr(search_module, '_index_all', lambda conn: calls.append(1) or index_all(conn))
+    create_search_index()
+    create_search_index()
+    assert len(calls) == 1
+    assert search('draft') == []
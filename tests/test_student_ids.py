@@ -0,0 +1,59 @@
+"""Student IDs come from a per-year sequence that concurrent workers share."""
+import threading
+
+import pytest
+
+from app.extensions import db
+from app.models import Student
+from app.utils import reserve_student_ids
+
+
+@pytest.fixture
+def ctx(fresh_app):
+    with fresh_app.app_context():
+        yield
+
+
+def test_sequence_continues_after_existing_ids(ctx):
+    db.session.add(Student(student_id='MPC-2031-041', full_name='Earlier', grade=9,
+                           email='earlier@example.test', password_hash='-'))
+    db.session.commit()
+    assert reserve_student_ids(2, year=2031) == ['MPC-2031-042', 'MPC-2031-043']
+    db.session.commit()
+    assert reserve_student_ids(year=2031) == ['MPC-2031-044']
+    assert reserve_student_ids(year=2032) == ['MPC-2032-001']
+    db.session.commit()
+
+
+def test_rolled_back_reservation_is_reused(ctx):
+    assert reserve_student_ids(3, year=2033) == ['MPC-2033-001', 'MPC-2033-002', 'MPC-2033-003']
+    db.session.rollback()
+    assert reserve_student_ids(year=2033) == ['MPC-2033-001']
+    db.session.commit()
+
+
+def test_concurrent_reservations_never_overlap(fresh_app):
+    workers, rounds = 8, 10
+    reserved, failures = [], []
+    start = threading.Barrier(workers)
+
+    def reserve():
+        with fresh_app.app_context():
+            try:
+                start.wait()
+                for n in range(rounds):
+                    reserved.extend(reserve_student_ids(n % 3 + 1, year=2034))
+                    db.session.commit()
+            except Exception as e:
+                failures.append(e)
+                db.session.rollback()
+
+    threads = [threading.Thread(target=reserve) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not failures
+    expected = workers * sum(n % 3 + 1 for n in range(rounds))
+    assert sorted(reserved) == [f'MPC-2034-{n:03d}' for n in range(1, expected + 1)]
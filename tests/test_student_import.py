@@ -0,0 +1,80 @@
+"""Bulk student imports store each batch's credentials before it commits."""
+import csv
+import io
+import os
+import time
+
+from sqlalchemy.exc import OperationalError
+from werkzeug.security import check_password_hash
+
+from app.commands import purge_import_reports
+from app.extensions import db
+from app.models import Student
+
+SHEET = ('full_name,email,grade,phone\n'
+         'Asha Rao,asha.{name}@example.test,10,{phone}1\n'
+         'Ravi Kumar,ravi.{name}@example.test,11,{phone}2\n'
+         'Asha Again,asha.{name}@example.test,10,\n')
+
+
+def post_sheet(client, name, phone):
+    sheet = SHEET.format(name=name, phone=phone).encode()
+    return client.post('/admin/students/import', data={'file': (io.BytesIO(sheet), 'students.csv')},
+                       content_type='multipart/form-data')
+
+
+def stored_rows(app, filename):
+    with open(os.path.join(app.config['IMPORT_REPORTS_FOLDER'], filename), newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def test_import_sends_stored_sheet(app, admin_client):
+    response = post_sheet(admin_client, 'sent', '800000000')
+    assert response.status_code == 200
+    filename = response.headers['Content-Disposition'].split('filename=')[1]
+    rows = stored_rows(app, filename)
+    assert list(csv.DictReader(io.StringIO(response.get_data(as_text=True)))) == rows
+    assert [r['status'] for r in rows] == [
+        'Skipped: Email appears more than once in the sheet.', 'Created', 'Created']
+    with app.app_context():
+        for row in rows[1:]:
+            student = Student.query.filter_by(student_id=row['student_id']).one()
+            assert check_password_hash(student.password_hash, row['password'])
+
+
+def test_failed_commit_keeps_nothing_unrecorded(app, admin_client, monkeypatch):
+    def fail():
+        raise OperationalError('COMMIT', {}, Exception('database is locked'))
+
+    before = set(os.listdir(app.config['IMPORT_REPORTS_FOLDER']))
+    monkeypatch.setattr(db.session, 'commit', fail)
+    response = post_sheet(admin_client, 'failed', '810000000')
+    monkeypatch.undo()
+    assert response.status_code == 302
+    filename, = set(os.listdir(app.config['IMPORT_REPORTS_FOLDER'])) - before
+    statuses = [r['status'] for r in stored_rows(app, filename)]
+    assert statuses[-2:] == ['Not created: saving this batch failed.'] * 2
+    with app.app_context():
+        assert Student.query.filter(Student.email.like('%.failed@example.test')).count() == 0
+
+
+def test_existing_emails_match_in_any_case(app, admin_client):
+    post_sheet(admin_client, 'cased', '830000000')
+    sheet = SHEET.format(name='CASED', phone='840000000').replace('asha.', 'Asha.')
+    response = admin_client.post('/admin/students/import', data={
+        'file': (io.BytesIO(sheet.encode()), 'students.csv')}, content_type='multipart/form-data')
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert {r['status'] for r in rows[1:]} == {'Skipped: email already belongs to a student.'}
+
+
+def test_stale_sheets_are_purged(app, admin_client):
+    folder = app.config['IMPORT_REPORTS_FOLDER']
+    post_sheet(admin_client, 'stale', '850000000')
+    name = max(os.listdir(folder), key=lambda n: os.path.getmtime(os.path.join(folder, n)))
+    assert admin_client.get(f'/admin/students/import/{name}').status_code == 200
+    old = time.time() - app.config['IMPORT_REPORT_HOURS'] * 3600 - 60
+    os.utime(os.path.join(folder, name), (old, old))
+    assert admin_client.get(f'/admin/students/import/{name}').status_code == 404
+    assert name not in os.listdir(folder)
+    result = app.test_cli_runner().invoke(purge_import_reports)
+    assert result.exit_code == 0, result.output
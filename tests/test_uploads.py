@@ -0,0 +1,95 @@
+"""Content addressed uploads are shared by reference and removed with the last one."""
+import io
+import os
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from app.extensions import db
+from app.models import StoredFile
+from app.utils import _remove_unreferenced, release_upload, store_upload
+
+
+@pytest.fixture
+def notes(fresh_app):
+    with fresh_app.app_context():
+        yield fresh_app.config['NOTES_FOLDER']
+
+
+def upload(folder, content=b'%PDF-1.4 lecture notes', name='notes.pdf'):
+    return store_upload(FileStorage(io.BytesIO(content), filename=name), 'note', folder)
+
+
+def stored(filename):
+    return StoredFile.query.filter_by(kind='note', filename=filename).one_or_none()
+
+
+def test_identical_uploads_share_one_file(notes):
+    filename, size, is_new = upload(notes)
+    db.session.commit()
+    again, _, is_new_again = upload(notes, name='copy.PDF')
+    db.session.commit()
+    other, _, _ = upload(notes, content=b'%PDF-1.4 other notes')
+    db.session.commit()
+    assert (is_new, is_new_again, again) == (True, False, filename)
+    assert filename.endswith('.pdf') and size == len(b'%PDF-1.4 lecture notes')
+    assert stored(filename).ref_count == 2 and stored(other).ref_count == 1
+    assert sorted(os.listdir(notes)) == sorted([filename, other])
+
+
+def test_last_release_removes_the_file(notes):
+    filename, _, _ = upload(notes)
+    upload(notes)
+    db.session.commit()
+    release_upload('note', filename)
+    db.session.commit()
+    assert stored(filename).ref_count == 1
+    assert os.path.exists(os.path.join(notes, filename))
+    release_upload('note', filename)
+    db.session.commit()
+    assert stored(filename) is None
+    assert not os.path.exists(os.path.join(notes, filename))
+
+
+def test_rolled_back_release_keeps_the_file(notes):
+    filename, _, _ = upload(notes)
+    db.session.commit()
+    release_upload('note', filename)
+    db.session.rollback()
+    assert stored(filename).ref_count == 1
+    assert os.path.exists(os.path.join(notes, filename))
+
+
+def test_file_stored_again_after_release_is_kept(notes):
+    filename, _, _ = upload(notes)
+    db.session.commit()
+    release_upload('note', filename)
+    # Another request stores the same content before the removal runs.
+    db.session.add(StoredFile(kind='note', filename=filename, digest='', ref_count=1))
+    db.session.commit()
+    assert stored(filename).ref_count == 1
+    assert os.path.exists(os.path.join(notes, filename))
+
+
+def test_files_without_a_row_are_removed(notes):
+    path = os.path.join(notes, 'legacy.pdf')
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.4')
+    _remove_unreferenced('note', 'legacy.pdf')
+    assert not os.path.exists(path)
+    assert stored('legacy.pdf') is None
+
+
+def test_only_note_uploads_may_be_large(app, admin_client, monkeypatch):
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 4096)
+    monkeypatch.setitem(app.config, 'MAX_NOTE_CONTENT_LENGTH', 64 * 1024)
+    body = b'%PDF-1.4 ' + b'x' * 16 * 1024
+    response = admin_client.post('/admin/gallery/upload', data={
+        'images': (io.BytesIO(body), 'big.jpg')}, content_type='multipart/form-data')
+    assert response.status_code == 413
+    response = admin_client.post('/admin/notes/upload', data={
+        'file': (io.BytesIO(body), 'big.pdf')}, content_type='multipart/form-data')
+    assert response.status_code == 200
+    response = admin_client.post('/admin/notes/upload', data={
+        'file': (io.BytesIO(body * 8), 'bigger.pdf')}, content_type='multipart/form-data')
+    assert response.status_code == 413